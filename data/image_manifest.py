@@ -0,0 +1,118 @@
+"""
+    Cached manifest of the images in a session folder.
+
+    Listing a folder of tens of thousands of PNGs and parsing every filename on
+    each run is slow, so the folder is scanned once with os.scandir and the
+    filename, timestamp, size and mtime of every image are kept in an .npz
+    index inside the folder. Later loads reuse it as long as the folder's mtime
+    is unchanged, and otherwise only parse the files that are new or changed.
+    Timestamps are the full-precision float milliseconds from the filename
+    (..._1743801343904.50585937500000.png); images without one get NaN.
+        python data/image_manifest.py data/MECH464-Color/
+"""
+
+import argparse
+import os
+
+import numpy as np
+
+MANIFEST_FILE = "image_manifest.npz"
+IMAGE_EXTENSION = ".png"
+MANIFEST_FIELDS = ("filename", "timestamp", "size", "mtime_ns")
+
+
+def manifest_dtype(name_length):
+    """Structured dtype of manifest entries, with filenames of up to name_length characters."""
+    return np.dtype([("filename", f"U{max(name_length, 1)}"), ("timestamp", "<f8"), ("size", "<i8"), ("mtime_ns", "<i8")])
+
+
+def parse_timestamp(filename):
+    """Millisecond timestamp after the last "_" of an image filename, or NaN if there is none."""
+    try:
+        return float(os.path.splitext(filename)[0].split("_")[-1])
+    except ValueError:
+        return float("nan")
+
+
+def _read(path):
+    """(entries, folder mtime) from a manifest file, or None if it is missing or unreadable."""
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            entries = np.empty(len(data["filename"]), dtype=manifest_dtype(data["filename"].dtype.itemsize // 4))
+            for field in MANIFEST_FIELDS:
+                entries[field] = data[field]
+            return entries, int(data["folder_mtime_ns"])
+    except (OSError, EOFError, KeyError, ValueError):  # EOFError: created but never written
+        return None
+
+
+def _write(path, entries, folder_mtime_ns):
+    """
+    Save the manifest with the folder mtime taken before the scan, so files added during the scan
+    are picked up next time. A truncated file is just rescanned next time.
+    """
+    with open(path, "wb") as f:
+        np.savez(f, folder_mtime_ns=folder_mtime_ns, **{field: entries[field] for field in MANIFEST_FIELDS})
+
+
+def load_manifest(folder, refresh=False):
+    """
+    The images in folder as a structured array with filename, timestamp, size and mtime_ns fields,
+    sorted by timestamp (images without one last). The cached manifest is updated if the folder
+    changed; refresh=True rescans even if it did not, e.g. after files were rewritten in place.
+    """
+    path = os.path.join(folder, MANIFEST_FILE)
+    cached = _read(path)
+    if not os.path.exists(path):
+        # Creating the file changes the folder mtime and rewriting it later does not, so create it before
+        # taking the mtime; a file added during the first scan then still changes the folder mtime
+        try:
+            open(path, "wb").close()
+        except OSError as e:
+            print(f"Could not create the image manifest in {folder}: {e}")
+    folder_mtime_ns = os.stat(folder).st_mtime_ns
+    if cached is not None and not refresh and cached[1] == folder_mtime_ns:
+        return cached[0]
+
+    known = {} if cached is None else {entry["filename"]: entry for entry in cached[0]}
+    rows = []
+    changed = cached is None
+    with os.scandir(folder) as scan:
+        for entry in scan:
+            if not entry.name.endswith(IMAGE_EXTENSION) or not entry.is_file():
+                continue
+            stat = entry.stat()
+            old = known.pop(entry.name, None)
+            if old is not None and old["size"] == stat.st_size and old["mtime_ns"] == stat.st_mtime_ns:
+                rows.append(tuple(old))
+            else:
+                rows.append((entry.name, parse_timestamp(entry.name), stat.st_size, stat.st_mtime_ns))
+                changed = True
+    changed = changed or bool(known)  # Anything left in known was deleted
+
+    # Sized to the longest filename, so none is truncated
+    entries = np.array(rows, dtype=manifest_dtype(max((len(row[0]) for row in rows), default=1)))
+    entries = entries[np.lexsort((entries["filename"], entries["timestamp"]))]  # NaN timestamps sort last
+    if changed or cached[1] != folder_mtime_ns:
+        try:
+            _write(path, entries, folder_mtime_ns)
+        except OSError as e:
+            print(f"Could not save the image manifest in {folder}: {e}")
+    return entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or update the image manifest of a session folder.")
+    parser.add_argument("folder")
+    parser.add_argument("--refresh", action="store_true", help="Rescan even if the folder looks unchanged")
+    args = parser.parse_args()
+    entries = load_manifest(args.folder, args.refresh)
+    timed = entries[~np.isnan(entries["timestamp"])]
+    print(f"{len(entries)} images in {args.folder}, {len(timed)} with timestamps, "
+          f"{entries['size'].sum() / 1e6:.1f} MB")
+    if len(timed):
+        print(f"Timestamps {timed['timestamp'][0]:.3f} to {timed['timestamp'][-1]:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,34 +1,282 @@
+"""
+    Match color images to the EM pose recorded closest in time.
+
+    Image timestamps come from the image filenames, read through the folder's
+    cached manifest (image_manifest.py), and pose timestamps from
+    Parsed_Pose_Data.csv, both in milliseconds. match_nearest() sorts the poses
+    once and finds every image's nearest pose with one np.searchsorted pass,
+    so it scales to sessions with millions of samples. interpolate_poses()
+    instead evaluates the pose at each image's own timestamp: position
+    linearly, orientation with Slerp. Import them to match other timestamp
+    arrays, or run this file from the repository root:
+        python data/manual_sync.py --max-gap 50 --policy one-to-one
+        python data/manual_sync.py --interpolate
+    With --stream, the pose log is read in chunks and merge-joined with the
+    time-ordered images in one forward pass (stream_matches()), writing rows
+    as it goes, so memory stays flat however long the session is.
+    --poses and --output may be .csv, .parquet or .feather (see tables.py).
+"""
+
+import argparse
+import itertools
+
+import numpy as np
 import pandas as pd
-import os
+from scipy.spatial.transform import Rotation, Slerp
+
+from image_manifest import load_manifest
+from tables import TableWriter, iter_table_chunks, read_table, table_format, write_table
+
+pose_csv_path = "data/Parsed_Pose_Data.csv"
+image_folder = "data/MECH464-Color/"
+output_csv_path = "data/pose_with_image_matches.csv"
+MAX_GAP_MS = 50  # Images with no pose this close are left unmatched; None matches regardless of the gap
+POLICY = "one-to-one"  # "one-to-one": a pose matches at most one image; "many-to-one": images may share a pose
+POLICIES = ("one-to-one", "many-to-one")
+POSITION_COLUMNS = ["x", "y", "z"]
+ANGLE_COLUMNS = ["azimuth", "elevation", "roll"]
+EULER_SEQUENCE = "ZYX"  # Tracker angles are intrinsic azimuth (Z), elevation (Y), roll (X), in degrees
+VALID_STATUS = "0x0000"
+CHUNK_ROWS = 100_000  # Pose rows read at a time in streaming mode
+
+
+def bracketing_indices(times, queries):
+    """
+    For sorted `times`, the indices (before, after) of the samples on either side of each query,
+    with times[before] <= query <= times[after] where such samples exist; clipped to the array ends.
+    """
+    after = np.searchsorted(times, queries, side="left")
+    before = np.clip(after - 1, 0, len(times) - 1)
+    after = np.clip(after, 0, len(times) - 1)
+    # An exact hit is its own bracket on both sides
+    exact = times[after] == queries
+    before[exact] = after[exact]
+    return before, after
+
+
+def match_nearest(times, queries, max_gap=None, policy="many-to-one"):
+    """
+    Index into `times` of the sample nearest each query, or -1 where there is none within max_gap.
+    Neither array needs to be sorted. With policy "one-to-one", a sample nearest to several
+    queries is kept by the closest of them (the earliest on a tie) and the others get -1.
+    """
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown matching policy {policy}, expected one of {', '.join(POLICIES)}")
+    times = np.asarray(times)
+    queries = np.asarray(queries)
+    matches = np.full(len(queries), -1, dtype=np.int64)
+    if not len(times) or not len(queries):
+        return matches
+
+    order = np.argsort(times, kind="stable")
+    sorted_times = times[order]
+    before, after = bracketing_indices(sorted_times, queries)
+    gap_before = np.abs(queries - sorted_times[before])
+    gap_after = np.abs(sorted_times[after] - queries)
+    nearest = np.where(gap_after < gap_before, after, before)
+    gaps = np.minimum(gap_before, gap_after)
+
+    matched = np.ones(len(queries), dtype=bool) if max_gap is None else gaps <= max_gap
+    if policy == "one-to-one":
+        # Visit candidates closest first; the first query to claim each sample keeps it
+        candidates = np.flatnonzero(matched)
+        candidates = candidates[np.lexsort((candidates, gaps[candidates]))]
+        _, first = np.unique(nearest[candidates], return_index=True)
+        matched[:] = False
+        matched[candidates[first]] = True
+    matches[matched] = order[nearest[matched]]
+    return matches
+
+
+def interpolate_poses(times, positions, angles, queries, max_gap=None):
+    """
+    The pose at each query time, from samples at `times` with (n, 3) positions and (n, 3)
+    azimuth/elevation/roll angles in degrees. Position is interpolated linearly and orientation
+    with Slerp. Returns (positions, angles, valid): queries outside the samples, or without a
+    sample within max_gap on both sides, are not valid and their rows are NaN.
+    """
+    times = np.asarray(times, dtype=np.float64)
+    queries = np.asarray(queries, dtype=np.float64)
+    # Slerp needs strictly increasing times: sort, and keep the first of any repeated timestamp
+    times, first = np.unique(times, return_index=True)
+    positions = np.asarray(positions, dtype=np.float64)[first]
+    angles = np.asarray(angles, dtype=np.float64)[first]
+
+    out_positions = np.full((len(queries), 3), np.nan)
+    out_angles = np.full((len(queries), 3), np.nan)
+    if len(times) < 2:
+        return out_positions, out_angles, np.zeros(len(queries), dtype=bool)
+    before, after = bracketing_indices(times, queries)
+    valid = (queries >= times[0]) & (queries <= times[-1])
+    if max_gap is not None:
+        valid &= (queries - times[before] <= max_gap) & (times[after] - queries <= max_gap)
+    if not valid.any():
+        return out_positions, out_angles, valid
+
+    inside = queries[valid]
+    for axis in range(3):
+        out_positions[valid, axis] = np.interp(inside, times, positions[:, axis])
+    # Only the samples bracketing some query are needed for Slerp; with long sessions that is a small fraction
+    needed = np.union1d(before[valid], after[valid])
+    if len(needed) == 1:
+        # Every query sits exactly on one sample; Slerp still needs two
+        needed = np.array([needed[0] - 1, needed[0]]) if needed[0] else np.array([0, 1])
+    rotations = Rotation.from_euler(EULER_SEQUENCE, angles[needed], degrees=True)
+    out_angles[valid] = Slerp(times[needed], rotations)(inside).as_euler(EULER_SEQUENCE, degrees=True)
+    return out_positions, out_angles, valid
+
+
+def interpolated_matches(pose_df, image_times, image_names, max_gap=None):
+    """Rows in the pose_with_image_matches.csv layout with each image's pose interpolated at its timestamp."""
+    if "status" in pose_df:
+        pose_df = pose_df[pose_df["status"] == VALID_STATUS]
+    positions, angles, valid = interpolate_poses(
+        pose_df["time"].values, pose_df[POSITION_COLUMNS].values, pose_df[ANGLE_COLUMNS].values, image_times, max_gap)
+
+    # Columns with no meaning between samples (button, quality, ...) come from the nearest sample
+    nearest = match_nearest(pose_df["time"].values, image_times[valid])
+    output = pose_df.iloc[nearest].reset_index(drop=True)
+    # Interpolated in float64, stored with the pose columns' own dtype (float32 from tables.read_table)
+    for i, column in enumerate(POSITION_COLUMNS):
+        output[column] = positions[valid, i].astype(pose_df[column].dtype)
+    for i, column in enumerate(ANGLE_COLUMNS):
+        output[column] = angles[valid, i].astype(pose_df[column].dtype)
+    output["time"] = image_times[valid]
+    output["image_ts"] = image_times[valid]
+    output["image_filename"] = np.asarray(image_names, dtype=object)[valid]
+    return output
+
+
+def matched_rows(pose_df, matches, image_times, image_names):
+    """One row per matched image (match >= 0) with the pose it matched, in the pose_with_image_matches.csv layout."""
+    matched = matches >= 0
+    output = pose_df.iloc[matches[matched]].reset_index(drop=True)
+    output['image_ts'] = image_times[matched]
+    output['image_filename'] = np.asarray(image_names, dtype=object)[matched]
+    return output
+
+
+def _match_batch(poses, batch, max_gap, policy, hold_last):
+    """
+    Match a batch of (timestamp, filename) images against consecutive pose rows. With hold_last and
+    the one-to-one policy, the image claiming the last pose is returned instead of matched, since
+    images in later batches may still compete for that pose. Returns (rows, held back images).
+    """
+    image_times = np.array([ts for ts, _ in batch], dtype=np.float64)
+    image_names = [name for _, name in batch]
+    matches = match_nearest(poses['time'].values, image_times, max_gap, policy)
+    held = []
+    if hold_last and policy == "one-to-one":
+        claims_last = matches == len(poses) - 1
+        held = [batch[i] for i in np.flatnonzero(claims_last)]  # At most one after one-to-one matching
+        matches[claims_last] = -1
+    return matched_rows(poses, matches, image_times, image_names), held
+
+
+def stream_matches(pose_chunks, images, max_gap=None, policy="many-to-one", batch_size=CHUNK_ROWS):
+    """
+    Merge-join pose chunks with images in one forward pass, yielding DataFrames of matched rows in time order.
+    pose_chunks are DataFrames with a millisecond 'time' column, together in time order (as a pose log is
+    written); images is an iterable of (timestamp, filename) sorted by timestamp. Gives the same matches as
+    match_nearest() on the whole session, holding only one chunk of poses and its images at a time.
+    """
+    images = iter(images)
+    lookahead = next(images, None)
+    previous = None  # Last pose row of the previous chunk; the nearest pose can be on either side of a boundary
+    held = []
+    for chunk in pose_chunks:
+        if not len(chunk):
+            continue
+        times = chunk['time'].values
+        if np.any(np.diff(times) < 0) or (previous is not None and times[0] < previous['time'].iloc[0]):
+            raise ValueError("Pose log is not in time order; use match_nearest() instead of streaming")
+        poses = chunk if previous is None else pd.concat([previous, chunk], ignore_index=True)
+        # Every image up to the chunk's last pose can be resolved now: later poses are all farther away
+        batch = held
+        while lookahead is not None and lookahead[0] <= times[-1]:
+            batch.append(lookahead)
+            lookahead = next(images, None)
+        rows, held = _match_batch(poses, batch, max_gap, policy, hold_last=True)
+        if len(rows):
+            yield rows
+        previous = chunk.iloc[[-1]].reset_index(drop=True)
+    if previous is None:
+        return
+
+    # Images after the last pose can only match it
+    tail = itertools.chain([] if lookahead is None else [lookahead], images)
+    while batch := list(itertools.islice(tail, batch_size)):
+        rows, held = _match_batch(previous, held + batch, max_gap, policy, hold_last=True)
+        if len(rows):
+            yield rows
+    rows, _ = _match_batch(previous, held, max_gap, policy, hold_last=False)
+    if len(rows):
+        yield rows
+
+
+def iter_images(folder):
+    """(timestamp, filename) of the timestamped images in folder, in time order, from its manifest."""
+    manifest = load_manifest(folder)
+    manifest = manifest[~np.isnan(manifest["timestamp"])]
+    return zip(manifest["timestamp"].tolist(), manifest["filename"].tolist())
+
+
+def pose_times_ms(seconds):
+    """Pose log times in seconds to whole milliseconds, the tracker's resolution."""
+    return (seconds * 1000).round().astype(np.int64)
+
+
+def stream_sync(args):
+    """Streaming mode: pose chunks in, matched rows out, without loading the session."""
+    def pose_chunks():
+        for chunk in iter_table_chunks(args.poses, args.chunk_rows):
+            chunk['time'] = pose_times_ms(chunk['time'])
+            yield chunk
+
+    with TableWriter(args.output) as writer:
+        for rows in stream_matches(pose_chunks(), iter_images(args.images), args.max_gap or None, args.policy):
+            writer.write(rows)
+    print(f"Matched {writer.rows_written} images to poses")
 
-pose_csv_path = "data/Parsed_Pose_Data.csv"  
-image_folder = "data/MECH464-Color/"    
-output_csv_path = "data/pose_with_image_matches.csv" 
 
-pose_df = pd.read_csv(pose_csv_path)
-pose_df['image_ts'] = 0  # default = unassigned
-pose_df['image_filename'] = ""  
+def main():
+    parser = argparse.ArgumentParser(description="Match color images to the nearest EM pose.")
+    parser.add_argument("--poses", default=pose_csv_path)
+    parser.add_argument("--images", default=image_folder)
+    parser.add_argument("--output", default=output_csv_path)
+    parser.add_argument("--max-gap", type=float, default=MAX_GAP_MS, help="Largest pose-image gap in ms, 0 for none")
+    parser.add_argument("--policy", choices=POLICIES, default=POLICY)
+    parser.add_argument("--interpolate", action="store_true",
+                        help="Interpolate the pose at each image timestamp instead of taking the nearest pose")
+    parser.add_argument("--stream", action="store_true", help="Read the pose log in chunks; for logs too big for memory")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="Pose rows per chunk with --stream")
+    args = parser.parse_args()
+    if args.stream:
+        if args.interpolate:
+            parser.error("--interpolate does not support --stream")
+        if table_format(args.output) == "feather":
+            parser.error("--stream writes .csv or .parquet output, not .feather")
+        stream_sync(args)
+        return
 
-def extract_ts(filename):
-    try:
-        return int(float(filename.split("_")[-1].replace(".png", "")))
-    except:
-        return None
+    pose_df = read_table(args.poses)
+    pose_df['time'] = pose_times_ms(pose_df['time'])
 
-image_files = [f for f in os.listdir(image_folder) if f.endswith(".png")]
-image_data = [(f, extract_ts(f)) for f in image_files]
-image_data = [(f, ts) for f, ts in image_data if ts is not None]
-image_data.sort(key=lambda x: x[1]) 
-pose_df['time'] = (pose_df['time'] * 1000).astype(int) 
+    image_data = list(iter_images(args.images))
+    image_names = [f for _, f in image_data]
+    image_times = np.array([ts for ts, _ in image_data], dtype=np.float64)
 
-pose_times = pose_df['time'].values
+    if args.interpolate:
+        output = interpolated_matches(pose_df, image_times, image_names, args.max_gap or None)
+        print(f"Interpolated poses for {len(output)} of {len(image_times)} images")
+        write_table(output, args.output)
+        return
 
-for fname, img_ts in image_data:
-    abs_diffs = abs(pose_times - img_ts)
-    closest_idx = abs_diffs.argmin()
+    matches = match_nearest(pose_df['time'].values, image_times, args.max_gap or None, args.policy)
+    print(f"Matched {(matches >= 0).sum()} of {len(image_times)} images to poses")
+    # In image time order
+    write_table(matched_rows(pose_df, matches, image_times, image_names), args.output)
 
-    pose_df.at[closest_idx, 'image_ts'] = img_ts
-    pose_df.at[closest_idx, 'image_filename'] = fname
 
-pose_df = pose_df[pose_df['image_ts'] != 0].reset_index(drop=True)
-pose_df.to_csv(output_csv_path, index=False)
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+    Reading and writing pose and match tables as CSV, Parquet or Feather.
+
+    Parsed_Pose_Data.csv, pose_with_image_matches.csv and synchronized_data.csv
+    can be converted once to a columnar binary file, which loads in
+    milliseconds instead of being re-parsed as text by every processing stage.
+    The format follows the file extension, so every script keeps reading CSVs
+    too. Whatever the format, tables come back with the same dtypes:
+    timestamps as float64, pose values as float32, and status and stream ids
+    as categoricals. Parquet and Feather need pyarrow.
+        python data/tables.py data/Parsed_Pose_Data.csv data/Parsed_Pose_Data.parquet
+"""
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather
+    import pyarrow.parquet
+except ImportError:
+    pa = None
+
+FORMATS = {".csv": "csv", ".parquet": "parquet", ".feather": "feather"}
+CHUNK_ROWS = 100_000
+TIMESTAMP_COLUMNS = [
+    "time", "image_ts", "ServerCycleTimestamp", "CameraTimestamp", "EMTimestampCorrected",
+    "EMTimestamp", "ServerReceiveTimestamp", "RTT_Delay",
+]
+POSE_COLUMNS = ["x", "y", "z", "azimuth", "elevation", "roll"]
+CATEGORICAL_COLUMNS = ["status", "CameraStream", "EMStream", "StreamID"]
+
+
+def table_format(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in FORMATS:
+        raise ValueError(f"Unsupported table format {extension}, expected one of {', '.join(FORMATS)}")
+    if FORMATS[extension] != "csv" and pa is None:
+        raise ImportError(f"Reading and writing {extension} tables needs the pyarrow package")
+    return FORMATS[extension]
+
+
+def apply_dtypes(df):
+    """Give the known timestamp, pose and categorical columns of a table their dtypes, in place."""
+    for column in df.columns.intersection(TIMESTAMP_COLUMNS):
+        df[column] = df[column].astype(np.float64)
+    for column in df.columns.intersection(POSE_COLUMNS):
+        df[column] = df[column].astype(np.float32)
+    for column in df.columns.intersection(CATEGORICAL_COLUMNS):
+        # Read as text, so status keeps its "0x0000" spelling and stream ids compare as strings
+        df[column] = df[column].astype(str).astype("category")
+    return df
+
+
+def _csv_dtypes():
+    return {column: str for column in CATEGORICAL_COLUMNS}
+
+
+def read_table(path):
+    """A whole table as a DataFrame, from any supported format."""
+    fmt = table_format(path)
+    if fmt == "parquet":
+        df = pd.read_parquet(path)
+    elif fmt == "feather":
+        df = pd.read_feather(path)
+    else:
+        df = pd.read_csv(path, dtype=_csv_dtypes())
+    return apply_dtypes(df)
+
+
+def iter_table_chunks(path, rows=CHUNK_ROWS):
+    """The table as DataFrames of about `rows` rows each, in file order, without loading it all."""
+    fmt = table_format(path)
+    if fmt == "parquet":
+        for batch in pyarrow.parquet.ParquetFile(path).iter_batches(batch_size=rows):
+            yield apply_dtypes(batch.to_pandas())
+    elif fmt == "feather":
+        # Feather files are read in the record batches they were written with
+        with pa.memory_map(path) as source:
+            reader = pa.ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                yield apply_dtypes(reader.get_batch(i).to_pandas())
+    else:
+        for chunk in pd.read_csv(path, dtype=_csv_dtypes(), chunksize=rows):
+            yield apply_dtypes(chunk)
+
+
+def write_table(df, path):
+    """
+    Write a table in the format its extension names. Binary formats get the standard dtypes;
+    CSV is written as-is, so existing CSV outputs keep their text.
+    """
+    fmt = table_format(path)
+    if fmt == "csv":
+        df.to_csv(path, index=False)
+        return
+    df = apply_dtypes(df.copy())
+    if fmt == "parquet":
+        df.to_parquet(path, index=False)
+    else:
+        df.reset_index(drop=True).to_feather(path)
+
+
+class TableWriter:
+    """Appends DataFrames with the same columns to a CSV or Parquet file as they are produced."""
+    def __init__(self, path):
+        self.path = path
+        self.format = table_format(path)
+        if self.format == "feather":
+            raise ValueError("Feather files cannot be written incrementally; use .parquet or .csv")
+        self.rows_written = 0
+        self._file = open(path, "w", newline="") if self.format == "csv" else None
+        self._parquet = None
+        self._schema = None
+
+    def write(self, df):
+        if self.format == "csv":
+            df.to_csv(self._file, header=not self.rows_written, index=False)
+        else:
+            df = apply_dtypes(df.copy())
+            # Each chunk has its own categories, so they are stored as plain strings and restored on reading
+            for column in df.columns.intersection(CATEGORICAL_COLUMNS):
+                df[column] = df[column].astype(str)
+            if self._parquet is None:
+                table = pa.Table.from_pandas(df, preserve_index=False)
+                self._schema = table.schema
+                self._parquet = pyarrow.parquet.ParquetWriter(self.path, self._schema)
+            else:
+                table = pa.Table.from_pandas(df, schema=self._schema, preserve_index=False)
+            self._parquet.write_table(table)
+        self.rows_written += len(df)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+        if self._parquet is not None:
+            self._parquet.close()
+        elif self.format == "parquet":
+            # Nothing was written; leave an empty file rather than none at all
+            open(self.path, "wb").close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a pose or match table between CSV, Parquet and Feather.")
+    parser.add_argument("input")
+    parser.add_argument("output")
+    args = parser.parse_args()
+    df = read_table(args.input)
+    write_table(df, args.output)
+    print(f"Wrote {len(df)} rows: {os.path.getsize(args.input) / 1e6:.2f} MB -> "
+          f"{os.path.getsize(args.output) / 1e6:.2f} MB")
+
+
+if __name__ == "__main__":
+    main()
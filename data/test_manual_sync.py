@@ -0,0 +1,135 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from manual_sync import interpolate_poses, match_nearest, stream_matches
+
+
+def make_session(rng, poses, images):
+    """A pose log with a 'row' column giving each pose's index, and time-ordered (timestamp, filename) images."""
+    pose_times = np.sort(rng.uniform(0, 10_000, poses))
+    pose_df = pd.DataFrame({"time": pose_times, "row": np.arange(poses)})
+    # Some images before the first pose and after the last one
+    image_times = np.sort(rng.uniform(-500, 10_500, images))
+    return pose_df, [(t, f"color_{i}.png") for i, t in enumerate(image_times)]
+
+
+def chunked(pose_df, chunk_rows):
+    return (pose_df.iloc[start:start + chunk_rows] for start in range(0, len(pose_df), chunk_rows))
+
+
+def streamed_pairs(pose_df, images, chunk_rows, max_gap, policy, batch_size=7):
+    rows = list(stream_matches(chunked(pose_df, chunk_rows), images, max_gap, policy, batch_size))
+    if not rows:
+        return []
+    rows = pd.concat(rows, ignore_index=True)
+    return list(zip(rows["image_filename"], rows["row"]))
+
+
+def expected_pairs(pose_df, images, max_gap, policy):
+    matches = match_nearest(pose_df["time"].values, np.array([t for t, _ in images]), max_gap, policy)
+    return [(name, match) for (_, name), match in zip(images, matches) if match >= 0]
+
+
+@pytest.mark.parametrize("policy", ["many-to-one", "one-to-one"])
+@pytest.mark.parametrize("max_gap", [None, 5.0])
+@pytest.mark.parametrize("seed", range(5))
+def test_stream_matches_equals_match_nearest(policy, max_gap, seed):
+    rng = np.random.default_rng(seed)
+    pose_df, images = make_session(rng, poses=int(rng.integers(1, 300)), images=int(rng.integers(0, 600)))
+    for chunk_rows in (1, 2, 17, len(pose_df)):
+        assert streamed_pairs(pose_df, images, chunk_rows, max_gap, policy) == \
+            expected_pairs(pose_df, images, max_gap, policy)
+
+
+def test_pose_at_chunk_boundary_is_kept_by_the_closer_image_in_the_next_chunk():
+    # Pose 1 ends the first chunk; image a claims it first, but b in the next chunk is closer
+    pose_df = pd.DataFrame({"time": [0.0, 10.0, 30.0], "row": [0, 1, 2]})
+    images = [(8.0, "a.png"), (11.0, "b.png")]
+    pairs = streamed_pairs(pose_df, images, chunk_rows=2, max_gap=None, policy="one-to-one")
+    assert pairs == [("b.png", 1)] == expected_pairs(pose_df, images, None, "one-to-one")
+
+
+def test_held_image_keeps_the_last_pose_when_no_later_image_is_closer():
+    pose_df = pd.DataFrame({"time": [0.0, 10.0, 30.0], "row": [0, 1, 2]})
+    images = [(9.0, "a.png"), (12.0, "b.png")]
+    pairs = streamed_pairs(pose_df, images, chunk_rows=2, max_gap=None, policy="one-to-one")
+    assert pairs == [("a.png", 1)] == expected_pairs(pose_df, images, None, "one-to-one")
+
+
+def test_images_after_the_last_pose_compete_for_it_across_batches():
+    pose_df = pd.DataFrame({"time": [0.0, 10.0], "row": [0, 1]})
+    images = [(10.0 + i, f"{i}.png") for i in (1, 2, 3)]
+    for batch_size in (1, 2, 3):
+        assert streamed_pairs(pose_df, images, 1, None, "one-to-one", batch_size) == [("1.png", 1)]
+        assert streamed_pairs(pose_df, images, 1, None, "many-to-one", batch_size) == \
+            [(name, 1) for _, name in images]
+
+
+def test_unordered_pose_log_is_rejected():
+    pose_df = pd.DataFrame({"time": [0.0, 10.0, 5.0], "row": [0, 1, 2]})
+    with pytest.raises(ValueError):
+        streamed_pairs(pose_df, [(1.0, "a.png")], chunk_rows=2, max_gap=None, policy="many-to-one")
+
+
+def test_match_nearest_tie_goes_to_the_earlier_sample():
+    # 5 is 5 ms from both 0 and 10
+    assert match_nearest([0, 10, 20], [5, 15]).tolist() == [0, 1]
+
+
+def test_match_nearest_clamps_queries_outside_the_samples():
+    assert match_nearest([0, 10, 20], [-100, 1000]).tolist() == [0, 2]
+
+
+def test_match_nearest_max_gap_is_inclusive():
+    # Gaps of 3, 4 and 6 ms
+    assert match_nearest([0, 10, 20], [3, 14, 26], max_gap=4).tolist() == [0, 1, -1]
+
+
+def test_match_nearest_returns_indices_into_unsorted_times():
+    assert match_nearest([20, 0, 10], [11, -1, 19]).tolist() == [2, 1, 0]
+
+
+def test_match_nearest_one_to_one_keeps_the_closest_query():
+    # Both queries are nearest pose 1: 11 is 1 ms away and keeps it; on a tie the earlier query does
+    assert match_nearest([0, 10, 100], [7, 11], policy="one-to-one").tolist() == [-1, 1]
+    assert match_nearest([0, 10, 100], [8, 12], policy="one-to-one").tolist() == [1, -1]
+
+
+def test_match_nearest_without_samples():
+    assert match_nearest([], [1, 2]).tolist() == [-1, -1]
+
+
+def test_interpolate_poses_takes_the_short_way_across_180_degrees():
+    # Azimuth 179 -> -179 is a 2 degree turn through 180, not 358 degrees back through 0
+    positions, angles, valid = interpolate_poses(
+        [0, 10], [[0, 0, 0], [10, 20, 30]], [[179, 0, 0], [-179, 0, 0]], [5, 7.5])
+    assert valid.tolist() == [True, True]
+    np.testing.assert_allclose(positions, [[5, 10, 15], [7.5, 15, 22.5]])
+    np.testing.assert_allclose(np.abs(angles[0]), [180, 0, 0], atol=1e-9)
+    np.testing.assert_allclose(angles[1], [-179.5, 0, 0], atol=1e-9)
+
+
+def test_interpolate_poses_turns_about_each_euler_axis():
+    # A turn about a single axis is interpolated linearly in that angle; azimuth is Z, elevation Y, roll X
+    _, angles, _ = interpolate_poses([0, 10], np.zeros((2, 3)), [[0, 10, -40], [0, 30, -40]], [2.5])
+    np.testing.assert_allclose(angles, [[0, 15, -40]], atol=1e-9)
+
+
+def test_interpolate_poses_endpoints():
+    positions, angles, valid = interpolate_poses(
+        [0, 10, 20], [[0, 0, 0], [1, 1, 1], [2, 2, 2]], [[0, 0, 0], [10, 0, 0], [20, 0, 0]], [0, 20, -1, 21])
+    # Exactly on the first and last sample: that sample's pose; outside the samples: invalid and NaN
+    assert valid.tolist() == [True, True, False, False]
+    np.testing.assert_allclose(positions[:2], [[0, 0, 0], [2, 2, 2]])
+    np.testing.assert_allclose(angles[:2], [[0, 0, 0], [20, 0, 0]], atol=1e-9)
+    assert np.isnan(positions[2:]).all() and np.isnan(angles[2:]).all()
+
+
+def test_interpolate_poses_max_gap_needs_a_close_sample_on_both_sides():
+    _, _, valid = interpolate_poses([0, 10, 100], np.zeros((3, 3)), np.zeros((3, 3)), [5, 12, 98], max_gap=5)
+    assert valid.tolist() == [True, False, False]
@@ -35,6 +35,11 @@ from model.loss import Similarity
 from utils.inout import load_json, save_json_bop23
 print(">>> Running version from ImferenceModel")
 
+# Capture-side depth storage (depth_store.py, depth_archive.py)
+SENSOR_SCRIPTS_DIR = os.environ.get(
+    "SENSOR_SCRIPTS_DIR", osp.join(osp.dirname(osp.abspath(__file__)), "..", "..", "sensor_scripts"))
+sys.path.append(SENSOR_SCRIPTS_DIR)
+
 inv_rgb_transform = T.Compose(
         [
             T.Normalize(
@@ -84,12 +89,19 @@ def visualize(rgb, detections, save_path="tmp.png"):
     concat.paste(prediction, (img.shape[1], 0))
     return concat
 
+def read_depth(depth_path):
+    """Read a depth image file, or one frame of a depth archive or store given as "<dir>#<frame>"."""
+    if "#" in depth_path:
+        from depth_store import load_depth
+        return np.array(load_depth(depth_path))
+    return imageio.imread(depth_path)
+
 def batch_input_data(depth_path, cam_path, device):
     batch = {}
     cam_info = load_json(cam_path)
 
     # Read depth image
-    depth_raw = imageio.imread(depth_path)
+    depth_raw = read_depth(depth_path)
 
     # Handle RGB depth image (convert to grayscale)
     if depth_raw.ndim == 3 and depth_raw.shape[2] == 3:
@@ -21,6 +21,17 @@ sys.path.append(os.path.join(ROOT_DIR, 'provider'))
 sys.path.append(os.path.join(ROOT_DIR, 'utils'))
 sys.path.append(os.path.join(ROOT_DIR, 'model'))
 sys.path.append(os.path.join(BASE_DIR, 'model', 'pointnet2'))
+# Capture-side depth storage (depth_store.py, depth_archive.py)
+SENSOR_SCRIPTS_DIR = os.environ.get('SENSOR_SCRIPTS_DIR', os.path.join(BASE_DIR, '..', '..', 'sensor_scripts'))
+sys.path.append(SENSOR_SCRIPTS_DIR)
+
+
+def load_depth_im(depth_path):
+    """Read a depth image file, or one frame of a depth archive or store given as "<dir>#<frame>"."""
+    if '#' in depth_path:
+        from depth_store import load_depth
+        return np.array(load_depth(depth_path))
+    return load_im(depth_path)
 
 
 def get_parser():
@@ -232,7 +243,7 @@ def get_test_data(rgb_path, depth_path, cam_path, cad_path, seg_path, det_score_
     whole_image = load_im(rgb_path).astype(np.uint8)
     if len(whole_image.shape)==2:
         whole_image = np.concatenate([whole_image[:,:,None], whole_image[:,:,None], whole_image[:,:,None]], axis=2)
-    whole_depth = load_im(depth_path).astype(np.float32) / 1000.0 #* cam_info['depth_scale'] / 1000.0
+    whole_depth = load_depth_im(depth_path).astype(np.float32) / 1000.0 #* cam_info['depth_scale'] / 1000.0
     if len(whole_depth.shape) == 3:
         whole_depth = cv2.cvtColor(whole_depth, cv2.COLOR_BGR2GRAY)
     whole_pts = get_point_cloud_from_depth(whole_depth, K)
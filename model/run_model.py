@@ -1,4 +1,5 @@
 import os
+import sys
 import time
 import subprocess
 import torch
@@ -9,9 +10,16 @@ camera_path = "/workspace/USdata/camera.json"
 output_base = "/workspace/USdata/output2"
 rgb_base = "/workspace/USdata/rgb"
 depth_base = "/workspace/USdata/depth"
+# Depth archive or store written by the capture scripts; when set, frame i is decoded from it
+# into depth{i}.png instead of that PNG having to be exported beforehand
+depth_archive = None
 num_frames = 122 
 resize_dims =(512, 512) # (320, 320)
 
+if depth_archive is not None:
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "sensor_scripts"))
+    from depth_store import load_depth
+
 for i in range(num_frames):
     print(f"\n[INFO] Processing frame {i}...")
 
@@ -19,6 +27,13 @@ for i in range(num_frames):
     depth_path = f"{depth_base}/depth{i}.png"
     output_dir = f"{output_base}/frame_{i}"
 
+    if depth_archive is not None:
+        try:
+            # Only frame i is read and decoded from the archive
+            cv2.imwrite(depth_path, load_depth(f"{depth_archive}#{i}"))
+        except (IndexError, KeyError) as e:
+            print(f"[WARNING] No depth frame {i} in {depth_archive}: {e}")
+
     if not os.path.exists(rgb_path) or not os.path.exists(depth_path):
         print(f"[WARNING] Skipping frame {i} due to missing RGB or depth image.")
         continue
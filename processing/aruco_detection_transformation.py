@@ -1,10 +1,14 @@
 import cv2
 import numpy as np
 from scipy.spatial.transform import Rotation as R
-import csv
 import os
+import sys
 import json
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data"))
+from image_manifest import load_manifest
+from tables import read_table
+
 
 """
 image_file = "test_img.png"
@@ -182,11 +186,16 @@ def transformation(x, y, z, azimuth, elevation, roll, image_filename, input_dir,
 
 
 
-with open('pose_with_image_matches.csv', newline='') as csvfile:
-   reader = csv.DictReader(csvfile)
-   i = 0
-   for row in reader:
-       x, y, z = float(row['x'])/1000, float(row['y'])/1000, float(row['z'])/1000
-       azimuth, elevation, roll = float(row['azimuth']), float(row['elevation']), float(row['roll'])
-       image_filename = row['image_filename']
-       transformation(x, y, z, azimuth, elevation, roll, image_filename, "Color", "ground_truth")
+# Images present in the input folder, from its cached manifest rather than a check per file
+available_images = set(load_manifest("Color")["filename"].tolist())
+
+# The matches table may also be converted to .parquet or .feather with data/tables.py
+matches = read_table('pose_with_image_matches.csv')
+for row in matches.itertuples(index=False):
+   x, y, z = float(row.x)/1000, float(row.y)/1000, float(row.z)/1000
+   azimuth, elevation, roll = float(row.azimuth), float(row.elevation), float(row.roll)
+   image_filename = row.image_filename
+   if image_filename not in available_images:
+       print(f"Skipping {image_filename}: not in Color")
+       continue
+   transformation(x, y, z, azimuth, elevation, roll, image_filename, "Color", "ground_truth")
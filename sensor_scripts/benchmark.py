@@ -0,0 +1,127 @@
+"""
+    Throughput benchmark for server.py using the simulated sensor clients.
+
+    Starts server.py on localhost in a scratch directory, connects simulated cameras
+    and EM trackers, runs for a fixed duration, then stops the server and reports the
+    sustained paired samples per second and the server's latency percentiles.
+    The server's output is kept in server.log in the scratch directory.
+        python benchmark.py --mode async --duration 30 --cameras 2 --camera-delay 0.03
+"""
+
+import argparse
+import csv
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+from simulators import SimulatedCamera, SimulatedEMTracker
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+SERVER_SCRIPT = os.path.join(base_dir, "server.py")
+HOST = "127.0.0.1"
+PORT = 5999
+STARTUP_DELAY = 1.0  # Seconds for the server to start listening
+LATENCY_METRICS = [
+    "capture_cycle_seconds",
+    "capture_camera_request_seconds",
+    "capture_camera_frame_age_seconds",
+    "capture_em_rtt_seconds",
+    "capture_log_flush_seconds",
+]
+
+
+def count_rows(path, timestamp_column):
+    """Return (rows, seconds between the first and last row) of a server output CSV."""
+    if not os.path.exists(path):
+        return 0, 0.0
+    with open(path, newline="") as f:
+        timestamps = [float(row[timestamp_column]) for row in csv.DictReader(f)]
+    if len(timestamps) < 2:
+        return len(timestamps), 0.0
+    return len(timestamps), max(timestamps) - min(timestamps)
+
+
+def run_benchmark(mode, duration, rate, cameras, em_trackers, camera_delay, camera_fps, em_rate, port=PORT,
+                  latest_frame=False, em_batch=False):
+    work_dir = tempfile.mkdtemp(prefix="capture_bench_")
+    server_log_path = os.path.join(work_dir, "server.log")
+    server_log = open(server_log_path, "w")
+    server = subprocess.Popen(
+        [sys.executable, SERVER_SCRIPT, "--host", HOST, "--port", str(port), "--mode", mode,
+         "--rate", str(rate), "--metrics-port", "0", "--stats-file", "server_stats.json"]
+        + (["--em-batch"] if em_batch else []),
+        cwd=work_dir, stdout=server_log, stderr=subprocess.STDOUT,
+    )
+    time.sleep(STARTUP_DELAY)
+
+    clients = [
+        SimulatedCamera(server_ip=HOST, port=port, stream_id=i, delay=camera_delay, rate=camera_fps,
+                        latest_frame=latest_frame)
+        for i in range(cameras)
+    ] + [
+        SimulatedEMTracker(server_ip=HOST, port=port, stream_id=i, rate=em_rate)
+        for i in range(em_trackers)
+    ]
+    for client in clients:
+        client.start()
+
+    time.sleep(duration)
+    server.send_signal(signal.SIGINT)
+    server.wait(timeout=30)
+    server_log.close()
+    if server.returncode != 0:
+        with open(server_log_path) as f:
+            print(f"server.py exited with code {server.returncode}; the end of {server_log_path}:")
+            print("".join(f.readlines()[-20:]), end="")
+    for client in clients:
+        client.stop_event.set()
+        client.join(timeout=5)
+
+    if mode == "stream":
+        rows, span = count_rows(os.path.join(work_dir, "interpolated_data.csv"), "CameraTimestamp")
+    else:
+        rows, span = count_rows(os.path.join(work_dir, "synchronized_data.csv"), "ServerCycleTimestamp")
+    stats_path = os.path.join(work_dir, "server_stats.json")
+    stats = {}
+    if os.path.exists(stats_path):
+        with open(stats_path) as f:
+            stats = json.load(f)["metrics"]
+
+    print(f"Mode {mode}: {cameras} camera(s), {em_trackers} EM tracker(s), {duration:.0f} s, output in {work_dir}")
+    print(f"  Paired rows: {rows}, sustained {rows / span if span else 0.0:.2f} rows/s")
+    for key, values in stats.items():
+        if any(key.startswith(name) for name in LATENCY_METRICS) and values["count"]:
+            print(f"  {key}: p50 {values['p50'] * 1000:.2f} ms, p90 {values['p90'] * 1000:.2f} ms, "
+                  f"p99 {values['p99'] * 1000:.2f} ms, max {values['max'] * 1000:.2f} ms ({values['count']} samples)")
+    for client in clients:
+        print(f"  {client.client_type}:{client.stream_id} sent {client.samples_sent} samples")
+    return rows, span, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark server.py against simulated sensors on localhost.")
+    parser.add_argument("--mode", choices=["lockstep", "async", "stream"], default="async")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds to capture")
+    parser.add_argument("--rate", type=float, default=30.0, help="Server target cycle rate (Hz)")
+    parser.add_argument("--cameras", type=int, default=1)
+    parser.add_argument("--em-trackers", type=int, default=1)
+    parser.add_argument("--camera-delay", type=float, default=0.02, help="Simulated processing per frame (s)")
+    parser.add_argument("--camera-fps", type=float, default=30.0, help="Camera rate in stream mode")
+    parser.add_argument("--em-rate", type=float, default=100.0, help="EM rate in stream mode")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--latest-frame", action="store_true",
+                        help="Simulated cameras answer requests from their newest frame")
+    parser.add_argument("--em-batch", action="store_true",
+                        help="Request every EM sample since the last cycle instead of only the newest")
+    args = parser.parse_args()
+    run_benchmark(args.mode, args.duration, args.rate, args.cameras, args.em_trackers,
+                  args.camera_delay, args.camera_fps, args.em_rate, port=args.port, latest_frame=args.latest_frame,
+                  em_batch=args.em_batch)
+
+
+if __name__ == "__main__":
+    main()
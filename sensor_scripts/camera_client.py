@@ -3,102 +3,274 @@
 """
 
 import socket
+import threading
 import time
-import pyrealsense2 as rs
-import numpy as np
 import cv2
+import argparse
 import os
-import csv
+from contextlib import nullcontext
+from functools import partial
+
+import protocol
+from capture_telemetry import TELEMETRY_INTERVAL, CaptureTelemetry
+from color_video import DEFAULT_CODEC, VIDEO_CODECS, ColorVideoWriter, video_path
+from data_logger import BackgroundCSVWriter
+from depth_archive import CODECS as DEPTH_CODECS, DepthArchive
+from depth_store import DepthStore
+from frame_grabber import FRAME_TIMEOUT, LatestFrameGrabber
+from frame_ring import FrameRingWriter
+from frame_source import RealSenseSource, ReplaySource
+from frame_writer import FrameWriterPool
+from preview import PREVIEW_FPS, FramePreview, colorize_depth
+from protocol import MessageReader
 
 SERVER_IP = "206.87.234.104"  # Replace with actual server IP
 PORT = 4999           # Replace with actual server port
 RETRY_DELAY = 5       # Seconds to wait before reconnection
+STREAM_ID = 0         # Distinguishes this client from others of the same type on the server
+HEADLESS = False      # No preview window and no colorized depth PNGs; for the capture box without a display
+COLOR_SINK = "png"    # "png": one file per color frame, "video": one video file per session
+VIDEO_CODEC = DEFAULT_CODEC  # "FFV1" (lossless) or "MJPG" when COLOR_SINK is "video"
+DEPTH_FORMAT = "raw"  # "raw": memory-mapped depth store; "png16", "zstd" or "lz4": compressed depth archive
+CAMERA_FPS = 30
+REPLAY_LOG = None     # camera_timestamps.csv of a recorded session to replay instead of using the camera
+REPLAY_SPEED = 1.0    # Replay speed-up; 0 replays as fast as frames load
+REPLAY_LOOP = False
+SHARED_RING = False   # Also publish frames to a shared-memory ring ("RealSense_<stream id>") for local consumers
 
 # Directories and log file setup
-depth_dir = "../data/depth_frames"
-color_dir = "../data/color_frames"
-log_file = "../data/camera_timestamps.csv"
-os.makedirs(depth_dir, exist_ok=True)
-os.makedirs(color_dir, exist_ok=True)
+DATA_DIR = "../data"
+
+def use_data_dir(data_dir):
+    """Point every output path into data_dir and create its frame directories."""
+    global depth_dir, depth_store_dir, depth_archive_dir, color_dir, log_file, telemetry_base
+    depth_dir = os.path.join(data_dir, "depth_frames")
+    depth_store_dir = os.path.join(data_dir, "depth_store")
+    depth_archive_dir = os.path.join(data_dir, "depth_archive")
+    color_dir = os.path.join(data_dir, "color_frames")
+    log_file = os.path.join(data_dir, "camera_timestamps.csv")
+    telemetry_base = os.path.join(data_dir, "capture_telemetry")
+    os.makedirs(depth_dir, exist_ok=True)
+    os.makedirs(color_dir, exist_ok=True)
+
+use_data_dir(DATA_DIR)
+
+def open_frame_source():
+    if REPLAY_LOG is not None:
+        return ReplaySource(REPLAY_LOG, speed=REPLAY_SPEED, loop=REPLAY_LOOP)
+    return RealSenseSource(CAMERA_FPS)
+
+def save_frame(frame, depth_store, telemetry):
+    """Runs on a writer thread: save the depth data and images of one frame. Returns its timestamp log row."""
+    timestamp, frame_count, store_index, depth_png_filename, color_filename, depth_image, color_image = frame
+    with telemetry.time_write("depth"):
+        depth_store.write(store_index, depth_image, timestamp, frame_count)
+    if not HEADLESS:
+        with telemetry.time_write("depth_png"):
+            cv2.imwrite(depth_png_filename, colorize_depth(depth_image))
+    if color_image is not None:  # None when the color video sink has it
+        with telemetry.time_write("color"):
+            cv2.imwrite(color_filename, color_image)
+    return [timestamp, depth_store.reference(store_index), color_filename]
+
+def grab_and_publish(grab_frame, ring):
+    """Runs on the grab thread: grab a frame and copy it into the shared-memory ring."""
+    frame = grab_frame()
+    if frame is not None:
+        ring.publish(*frame)
+    return frame
+
+def queue_frame(frame, frame_count, writer_pool, depth_store, color_video):
+    """
+    Queue a grabbed frame for saving; the files are written in the background.
+    Returns (depth_filename, color_filename), the paths the frame will be saved to,
+    or empty paths if the writer queue was full and the frame will not be saved.
+    """
+    _, timestamp, depth_image, color_image = frame
+
+    def claim():
+        # Claim the depth store slot and define filenames, only once the frame has a place in the queue
+        store_index = depth_store.reserve()
+        depth_png_filename = os.path.join(depth_dir, f"depth_{frame_count}.png")
+        if color_video is not None:
+            # Encoded in capture order on the video writer's own thread
+            return (timestamp, frame_count, store_index, depth_png_filename,
+                    color_video.write(frame_count, color_image, timestamp), depth_image, None)
+        return (timestamp, frame_count, store_index, depth_png_filename,
+                os.path.join(color_dir, f"color_{frame_count}.png"), depth_image, color_image)
+
+    queued = writer_pool.submit_from(claim)
+    if queued is None:
+        print(f"Writer queue full, frame {frame_count} will not be saved.")
+        return "", ""
+    _, _, store_index, _, color_filename, _, _ = queued
+    return depth_store.reference(store_index), color_filename
+
+def show_frames(preview, depth_image, color_image):
+    """Hand the frames to the preview window, if there is one. Returns False if the user pressed 'q' in it."""
+    if preview is None:
+        return True
+    preview.show(depth_image, color_image)
+    return not preview.quit_requested.is_set()
+
+def answer_time_probe(client, payload, send_lock=None):
+    """Answer a clock sync probe with the current local time."""
+    with send_lock or nullcontext():
+        protocol.send_message(client, protocol.MSG_TIME_REPLY, protocol.pack_time_reply(payload, time.time()))
+
+def answer_probes(client, reader, send_lock, server_closed):
+    """
+    Runs on its own thread while streaming: answer clock sync probes the moment they arrive,
+    so the reply is not held up until the next frame. Sets server_closed when the connection ends.
+    """
+    try:
+        while (message := reader.read_message()) is not None:
+            msg_type, payload = message
+            if msg_type == protocol.MSG_TIME_PROBE:
+                answer_time_probe(client, payload, send_lock)
+    except (socket.error, protocol.ProtocolError) as e:
+        print(f"Stopped reading from server: {e}")
+    server_closed.set()
+
+def stream_frames(client, reader, grabber, writer_pool, depth_store, color_video, preview, frame_count):
+    """
+    Push every grabbed frame to the server as soon as it arrives, without waiting for requests.
+    Clock sync probes from the server are answered on a separate thread.
+    Returns False if the user asked to quit or the frame source ran out, True if the server closed the connection.
+    """
+    print("Streaming frames to server.")
+    send_lock = threading.Lock()  # Frames and probe replies share the socket
+    server_closed = threading.Event()
+    threading.Thread(target=answer_probes, args=(client, reader, send_lock, server_closed),
+                     name="probe-replies", daemon=True).start()
+    last_sequence = 0
+    while True:
+        if server_closed.is_set():
+            print("Server closed the connection.")
+            return True
+
+        frame = grabber.wait_for_newer(last_sequence)
+        if frame is None:
+            if grabber.finished:
+                return False
+            print("No frame from the camera, still waiting.")
+            continue
+        last_sequence, timestamp, depth_image, color_image = frame
+        depth_filename, color_filename = queue_frame(frame, frame_count, writer_pool, depth_store, color_video)
+        payload = protocol.pack_camera_data(
+            timestamp, frame_count, depth_filename, color_filename, time.time() - timestamp)
+        with send_lock:
+            protocol.send_message(client, protocol.MSG_CAMERA_DATA, payload)
+        frame_count += 1
+
+        if not show_frames(preview, depth_image, color_image):
+            print("Quitting on user request.")
+            return False
 
 def send_realsense_data():
+    """Serve one connection to the server. Returns True once the user quits or a replayed session runs out of frames."""
     frame_count = 0
+    writer_pool = None
+    timestamp_log = None
+    depth_store = None
+    color_video = None
+    preview = None
+    grabber = None
+    source = None
+    ring = None
+    telemetry = None
     try:
         # Create and connect the client socket.
         client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         client.connect((SERVER_IP, PORT))
         print("Connected to server.")
         # Send handshake message to identify client type.
-        client.send(b"RealSense")
+        protocol.send_message(client, protocol.MSG_HELLO, protocol.pack_text(f"RealSense:{STREAM_ID}"))
+        reader = MessageReader(client)
 
-        # Start the RealSense pipeline.
-        pipeline = rs.pipeline()
-        config = rs.config()
-        config.enable_stream(rs.stream.depth, 640, 480, rs.format.z16, 30)
-        config.enable_stream(rs.stream.color, 640, 480, rs.format.bgr8, 30)
-        pipeline.start(config)
+        # Start the RealSense pipeline, or the replay of a recorded session.
+        source = open_frame_source()
+        source.start()
+        sinks = ("depth", "color") if HEADLESS else ("depth", "depth_png", "color")
+        telemetry = CaptureTelemetry(f"{telemetry_base}_{int(time.time())}.csv", sinks, TELEMETRY_INTERVAL)
+        grab_frame = partial(telemetry.grab, source.grab)
+        # Keep the newest frame on hand so requests never wait for the sensor
+        if SHARED_RING:
+            ring = FrameRingWriter(f"RealSense_{STREAM_ID}")
+            print(f"Publishing frames to shared memory {ring.name}")
+            grab_frame = partial(grab_and_publish, grab_frame, ring)
+        grabber = LatestFrameGrabber(grab_frame)
+        reply = None  # (sequence, frame index, depth_filename, color_filename) of the last frame sent
 
         # Open CSV file in append mode; write header if starting fresh.
-        with open(log_file, "a", newline="") as f:
-            writer = csv.writer(f)
-            if frame_count == 0:
-                writer.writerow(["Timestamp", "Depth File", "Color File"])
-
-            while True:
-                # Block until the server sends a request.
-                server_msg = client.recv(1024)
-                if not server_msg:
-                    print("Server closed the connection.")
-                    break
+        is_new_log = not os.path.exists(log_file) or os.path.getsize(log_file) == 0
+        timestamp_log = BackgroundCSVWriter(
+            log_file, header=["Timestamp", "Depth File", "Color File"] if is_new_log else None, mode="a")
+        # Depth frames are appended to a chunked store or archive rather than written as one .npy file each
+        if DEPTH_FORMAT == "raw":
+            depth_store = DepthStore(depth_store_dir, mode="a")
+        else:
+            depth_store = DepthArchive(depth_archive_dir, mode="a", codec=DEPTH_FORMAT)
+        writer_pool = FrameWriterPool(
+            partial(save_frame, depth_store=depth_store, telemetry=telemetry),
+            on_saved=timestamp_log.write_row)  # Logged in capture order, whichever writer finishes first
+        telemetry.watch_queue("writer", lambda: writer_pool.queue_depth, lambda: writer_pool.dropped)
+        if COLOR_SINK == "video":
+            session_video = video_path(os.path.join(color_dir, f"color_{int(time.time())}"), VIDEO_CODEC)
+            # In request modes frames are written at the server's cycle rate, so CAMERA_FPS is only nominal;
+            # frame timing comes from the video's index
+            color_video = ColorVideoWriter(session_video, CAMERA_FPS, VIDEO_CODEC,
+                                           write_observer=telemetry.write_observer("color"))
+            telemetry.watch_queue("video", lambda: color_video.queue_depth, lambda: color_video.dropped)
+        telemetry.start()
+        preview = None if HEADLESS else FramePreview(PREVIEW_FPS, overlay=telemetry.overlay_lines)
 
-                request = server_msg.strip()
-                print(f"Received request: {request}")
-
-                if request == b"RequestCameraData":
-                    # Capture frames upon receiving a data request.
-                    frames = pipeline.wait_for_frames()
-                    depth_frame = frames.get_depth_frame()
-                    color_frame = frames.get_color_frame()
-                    timestamp = time.time()
-
-                    if not depth_frame or not color_frame:
-                        print("Invalid frame data, skipping this request.")
-                        continue
-
-                    # Convert frames to numpy arrays.
-                    depth_image = np.asanyarray(depth_frame.get_data())
-                    color_image = np.asanyarray(color_frame.get_data())
-
-                    # Define filenames for saving data.
-                    depth_filename = os.path.join(depth_dir, f"depth_{frame_count}.npy")
-                    depth_png_filename = os.path.join(depth_dir, f"depth_{frame_count}.png")
-                    color_filename = os.path.join(color_dir, f"color_{frame_count}.png")
-
-                    # Save the depth data and images.
-                    np.save(depth_filename, depth_image)
-                    cv2.imwrite(depth_png_filename, cv2.applyColorMap(cv2.convertScaleAbs(depth_image, alpha=0.03), cv2.COLORMAP_JET))
-                    cv2.imwrite(color_filename, color_image)
-
-                    # Log the timestamp and file paths.
-                    writer.writerow([timestamp, depth_filename, color_filename])
-                    f.flush()  # Ensure data is written promptly
-
-                    # Send the data info back to the server.
-                    data_str = f"{timestamp}, {depth_filename}, {color_filename}"
-                    client.send(data_str.encode())
-                    print(f"Sent frame {frame_count}: {data_str}")
+        while True:
+            # Block until the server sends a request.
+            message = reader.read_message()
+            if message is None:
+                print("Server closed the connection.")
+                break
+
+            msg_type, payload = message
+            print(f"Received request: {msg_type}")
+
+            if msg_type == protocol.MSG_REQUEST_CAMERA:
+                if grabber.finished:
+                    break
+                # Answer from the newest grabbed frame; only waits before the camera's first frame.
+                frame = grabber.wait_for_newer(0, FRAME_TIMEOUT)
+                if frame is None:
+                    print("No frame from the camera yet, skipping this request.")
+                    continue
+                sequence, timestamp, depth_image, color_image = frame
+                if reply is None or reply[0] != sequence:
+                    # A new frame: save it. A repeat request for the same frame gets the same paths.
+                    reply = (sequence, frame_count,
+                             *queue_frame(frame, frame_count, writer_pool, depth_store, color_video))
                     frame_count += 1
+                _, frame_index, depth_filename, color_filename = reply
+                frame_age = time.time() - timestamp
 
-                    # Optionally, display images for debugging.
-                    cv2.imshow("Depth", cv2.applyColorMap(cv2.convertScaleAbs(depth_image, alpha=0.03), cv2.COLORMAP_JET))
-                    cv2.imshow("Color", color_image)
-                    if cv2.waitKey(1) & 0xFF == ord('q'):
-                        print("Quitting on user request.")
-                        return
-                else:
-                    print("Received unrecognized request; ignoring.")
+                # Send the data info back to the server.
+                payload = protocol.pack_camera_data(timestamp, frame_index, depth_filename, color_filename, frame_age)
+                protocol.send_message(client, protocol.MSG_CAMERA_DATA, payload)
+                print(f"Sent frame {frame_index} ({frame_age * 1000:.1f} ms old): {timestamp}, {depth_filename}, {color_filename}")
 
-    except (socket.error, ConnectionRefusedError) as e:
+                # Optionally, display images for debugging.
+                if not show_frames(preview, depth_image, color_image):
+                    print("Quitting on user request.")
+                    return True
+            elif msg_type == protocol.MSG_TIME_PROBE:
+                answer_time_probe(client, payload)
+            elif msg_type == protocol.MSG_START_STREAM:
+                if not stream_frames(client, reader, grabber, writer_pool, depth_store, color_video, preview, frame_count):
+                    return True
+                break
+            else:
+                print("Received unrecognized request; ignoring.")
+
+    except (socket.error, ConnectionRefusedError, protocol.ProtocolError) as e:
         print(f"Connection error: {e}. Retrying in {RETRY_DELAY} seconds...")
         time.sleep(RETRY_DELAY)
     finally:
@@ -106,13 +278,61 @@ def send_realsense_data():
             client.close()
         except Exception:
             pass
+        if grabber is not None:
+            grabber.close()
+            print(f"Frame grabber: {grabber.summary()}")
         try:
-            pipeline.stop()
+            source.stop()
         except Exception:
             pass
-        cv2.destroyAllWindows()
-        print("Connection closed. Attempting reconnection...")
+        if ring is not None:
+            ring.close()
+        if writer_pool is not None:
+            # Finish writing queued frames before the log they are recorded in is closed
+            writer_pool.close()
+            print(f"Frame writer: {writer_pool.summary()}")
+        if color_video is not None:
+            color_video.close()
+            print(f"Color video: {color_video.frames_written} frames in {color_video.path}, {color_video.dropped} dropped")
+        if timestamp_log is not None:
+            timestamp_log.close()
+        if depth_store is not None:
+            depth_store.close()
+        if preview is not None:
+            preview.close()
+        if telemetry is not None:
+            telemetry.close()
+
+    if grabber is not None and grabber.finished:
+        print("Frame source failed." if grabber.error is not None else "Frame source finished.")
+        return True
+    if preview is not None and preview.quit_requested.is_set():
+        return True
+    print("Connection closed. Attempting reconnection...")
 
 if __name__ == "__main__":
-    while True:
-        send_realsense_data()
+    parser = argparse.ArgumentParser(description="RealSense capture client.")
+    parser.add_argument("--server", default=SERVER_IP)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--stream-id", type=int, default=STREAM_ID)
+    parser.add_argument("--headless", action="store_true", help="No preview window or colorized depth PNGs")
+    parser.add_argument("--preview-fps", type=float, default=PREVIEW_FPS, help="Preview redraws per second")
+    parser.add_argument("--color-sink", choices=["png", "video"], default=COLOR_SINK)
+    parser.add_argument("--video-codec", choices=list(VIDEO_CODECS), default=VIDEO_CODEC)
+    parser.add_argument("--depth-format", choices=["raw", *DEPTH_CODECS], default=DEPTH_FORMAT)
+    parser.add_argument("--data-dir", default=DATA_DIR, help="Where frames and camera_timestamps.csv are written")
+    parser.add_argument("--replay", metavar="LOG", help="Replay the session recorded in this camera_timestamps.csv")
+    parser.add_argument("--replay-speed", type=float, default=REPLAY_SPEED, help="Replay speed-up, 0 for no pacing")
+    parser.add_argument("--replay-loop", action="store_true", help="Start the replay over when it ends")
+    parser.add_argument("--shared-ring", action="store_true", help="Publish frames to shared memory for local readers")
+    parser.add_argument("--telemetry-interval", type=float, default=TELEMETRY_INTERVAL,
+                        help="Seconds between capture telemetry rows")
+    args = parser.parse_args()
+    SERVER_IP, PORT, STREAM_ID = args.server, args.port, args.stream_id
+    HEADLESS, PREVIEW_FPS = args.headless, args.preview_fps
+    COLOR_SINK, VIDEO_CODEC, DEPTH_FORMAT = args.color_sink, args.video_codec, args.depth_format
+    REPLAY_LOG, REPLAY_SPEED, REPLAY_LOOP = args.replay, args.replay_speed, args.replay_loop
+    SHARED_RING, TELEMETRY_INTERVAL = args.shared_ring, args.telemetry_interval
+    use_data_dir(args.data_dir)
+    while not send_realsense_data():
+        pass
@@ -1,85 +1,153 @@
 import time
-import pyrealsense2 as rs
-import numpy as np
 import cv2
 import os
-import csv
+import argparse
+from functools import partial
+
+from capture_telemetry import TELEMETRY_INTERVAL, CaptureTelemetry
+from color_video import DEFAULT_CODEC, VIDEO_CODECS, ColorVideoWriter, video_path
+from data_logger import BackgroundCSVWriter
+from depth_archive import CODECS as DEPTH_CODECS, DepthArchive
+from depth_store import DepthStore
+from frame_source import RealSenseSource, ReplaySource
+from frame_writer import FrameWriterPool
+from preview import PREVIEW_FPS, FramePreview
 
 # Determine the script's directory and set paths relative to it
 base_dir = os.path.dirname(os.path.abspath(__file__))
-depth_dir = os.path.join(base_dir, "depth_frames")
-color_dir = os.path.join(base_dir, "color_frames")
-log_file = os.path.join(base_dir, "camera_timestamps.csv")
 
-# Create folders if they don't exist
-os.makedirs(depth_dir, exist_ok=True)
-os.makedirs(color_dir, exist_ok=True)
+def use_data_dir(data_dir):
+    """Point every output path into data_dir and create its frame directories."""
+    global depth_store_dir, depth_archive_dir, color_dir, log_file, telemetry_base
+    depth_store_dir = os.path.join(data_dir, "depth_store")
+    depth_archive_dir = os.path.join(data_dir, "depth_archive")
+    color_dir = os.path.join(data_dir, "color_frames")
+    log_file = os.path.join(data_dir, "camera_timestamps.csv")
+    telemetry_base = os.path.join(data_dir, "capture_telemetry")
+    # Create folders if they don't exist
+    os.makedirs(color_dir, exist_ok=True)
+
+use_data_dir(base_dir)
+
+HEADLESS = False  # No preview window; for the capture box without a display
+COLOR_SINK = "png"  # "png": one file per color frame, "video": one video file per session
+VIDEO_CODEC = DEFAULT_CODEC  # "FFV1" (lossless) or "MJPG" when COLOR_SINK is "video"
+DEPTH_FORMAT = "raw"  # "raw": memory-mapped depth store; "png16", "zstd" or "lz4": compressed depth archive
+CAMERA_FPS = 15
+REPLAY_LOG = None  # camera_timestamps.csv of a recorded session to replay instead of using the camera
+REPLAY_SPEED = 1.0  # Replay speed-up; 0 replays as fast as frames load
+
+def save_frame(frame, depth_store, telemetry):
+    """Runs on a writer thread: save one frame's depth data and color image. Returns its timestamp log row."""
+    timestamp, frame_count, store_index, color_filename, depth_image, color_image = frame
+    with telemetry.time_write("depth"):
+        depth_store.write(store_index, depth_image, timestamp, frame_count)
+    if color_image is not None:  # None when the color video sink has it
+        with telemetry.time_write("color"):
+            cv2.imwrite(color_filename, color_image)
+    return [timestamp, depth_store.reference(store_index), color_filename]
 
 def main():
     frame_count = 0
 
-    # Initialize RealSense pipeline
-    pipeline = rs.pipeline()
-    config = rs.config()
-    config.enable_stream(rs.stream.depth, 640, 480, rs.format.z16, 15)
-    config.enable_stream(rs.stream.color, 640, 480, rs.format.bgr8, 15)
-    pipeline.start(config)
-
-    # Open CSV log file
-    with open(log_file, "a", newline="") as f:
-        writer = csv.writer(f)
-        # Write header only if file is empty
-        if os.stat(log_file).st_size == 0:
-            writer.writerow(["Timestamp", "Depth File", "Color File"])
-
-        print("Recording started. Press 'q' to quit.")
-        try:
-            while True:
-                # Wait for a new frame
-                frames = pipeline.wait_for_frames()
-                depth_frame = frames.get_depth_frame()
-                color_frame = frames.get_color_frame()
-                timestamp = time.time()
-
-                if not depth_frame or not color_frame:
-                    print("Invalid frame, skipping.")
-                    continue
-
-                # Convert to NumPy arrays
-                depth_image = np.asanyarray(depth_frame.get_data())
-                color_image = np.asanyarray(color_frame.get_data())
-
-                # Create filenames
-                depth_filename = os.path.join(depth_dir, f"depth_{frame_count}.npy")
-                color_filename = os.path.join(color_dir, f"color_{frame_count}.png")
-
-                # Save data
-                np.save(depth_filename, depth_image)
-                cv2.imwrite(color_filename, color_image)
-
-                # Log the data
-                writer.writerow([timestamp, depth_filename, color_filename])
-                f.flush()
-
-                # Show frames
-                depth_display = cv2.applyColorMap(
-                    cv2.convertScaleAbs(depth_image, alpha=0.03),
-                    cv2.COLORMAP_JET)
-                cv2.imshow("Depth", depth_display)
-                cv2.imshow("Color", color_image)
-
+    # Initialize RealSense pipeline, or the replay of a recorded session
+    source = ReplaySource(REPLAY_LOG, speed=REPLAY_SPEED) if REPLAY_LOG is not None else RealSenseSource(CAMERA_FPS)
+    source.start()
+    telemetry = CaptureTelemetry(f"{telemetry_base}_{int(time.time())}.csv", ("depth", "color"), TELEMETRY_INTERVAL)
+
+    # Open CSV log file; write header only if file is empty
+    is_new_log = not os.path.exists(log_file) or os.stat(log_file).st_size == 0
+    timestamp_log = BackgroundCSVWriter(
+        log_file, header=["Timestamp", "Depth File", "Color File"] if is_new_log else None, mode="a")
+    # Frames are saved on writer threads so a slow disk does not hold up capture
+    if DEPTH_FORMAT == "raw":
+        depth_store = DepthStore(depth_store_dir, mode="a")
+    else:
+        depth_store = DepthArchive(depth_archive_dir, mode="a", codec=DEPTH_FORMAT)
+    writer_pool = FrameWriterPool(
+        partial(save_frame, depth_store=depth_store, telemetry=telemetry),
+        on_saved=timestamp_log.write_row)  # Logged in capture order, whichever writer finishes first
+    telemetry.watch_queue("writer", lambda: writer_pool.queue_depth, lambda: writer_pool.dropped)
+    color_video = None
+    if COLOR_SINK == "video":
+        session_video = video_path(os.path.join(color_dir, f"color_{int(time.time())}"), VIDEO_CODEC)
+        color_video = ColorVideoWriter(session_video, CAMERA_FPS, VIDEO_CODEC,
+                                       write_observer=telemetry.write_observer("color"))
+        telemetry.watch_queue("video", lambda: color_video.queue_depth, lambda: color_video.dropped)
+    telemetry.start()
+    preview = None if HEADLESS else FramePreview(PREVIEW_FPS, overlay=telemetry.overlay_lines)
+
+    print("Recording started. Press Ctrl+C to quit." if HEADLESS else "Recording started. Press 'q' to quit.")
+    try:
+        while True:
+            # Wait for a new frame
+            try:
+                frame = telemetry.grab(source.grab)
+            except EOFError as e:
+                print(e)
+                break
+            if frame is None:
+                print("Invalid frame, skipping.")
+                continue
+            timestamp, depth_image, color_image = frame
+
+            def claim():
+                # Claim the depth store slot and create filenames, only once the frame has a place in the queue
+                store_index = depth_store.reserve()
+                if color_video is not None:
+                    return (timestamp, frame_count, store_index,
+                            color_video.write(frame_count, color_image, timestamp), depth_image, None)
+                return (timestamp, frame_count, store_index,
+                        os.path.join(color_dir, f"color_{frame_count}.png"), depth_image, color_image)
+
+            # Queue the frame to be saved and logged
+            if writer_pool.submit_from(claim) is None:
+                print(f"Writer queue full, frame {frame_count} will not be saved.")
+
+            # Show frames; the preview thread colorizes and draws them at its own rate
+            if preview is not None:
+                preview.show(depth_image, color_image)
                 # Quit on key press 'q'
-                if cv2.waitKey(1) & 0xFF == ord('q'):
+                if preview.quit_requested.is_set():
                     print("User requested exit.")
                     break
 
-                print(f"Captured frame {frame_count}")
-                frame_count += 1
-
-        finally:
-            pipeline.stop()
-            cv2.destroyAllWindows()
-            print("Capture stopped.")
+            print(f"Captured frame {frame_count}")
+            frame_count += 1
+
+    except KeyboardInterrupt:
+        print("User requested exit.")
+    finally:
+        source.stop()
+        if preview is not None:
+            preview.close()
+        # Finish writing queued frames before the log they are recorded in is closed
+        writer_pool.close()
+        if color_video is not None:
+            color_video.close()
+            print(f"Color video: {color_video.frames_written} frames in {color_video.path}, {color_video.dropped} dropped")
+        timestamp_log.close()
+        depth_store.close()
+        telemetry.close()
+        print(f"Frame writer: {writer_pool.summary()}")
+        print("Capture stopped.")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record RealSense frames without the server.")
+    parser.add_argument("--headless", action="store_true", help="No preview window")
+    parser.add_argument("--preview-fps", type=float, default=PREVIEW_FPS, help="Preview redraws per second")
+    parser.add_argument("--color-sink", choices=["png", "video"], default=COLOR_SINK)
+    parser.add_argument("--video-codec", choices=list(VIDEO_CODECS), default=VIDEO_CODEC)
+    parser.add_argument("--depth-format", choices=["raw", *DEPTH_CODECS], default=DEPTH_FORMAT)
+    parser.add_argument("--data-dir", default=base_dir, help="Where frames and camera_timestamps.csv are written")
+    parser.add_argument("--replay", metavar="LOG", help="Replay the session recorded in this camera_timestamps.csv")
+    parser.add_argument("--replay-speed", type=float, default=REPLAY_SPEED, help="Replay speed-up, 0 for no pacing")
+    parser.add_argument("--telemetry-interval", type=float, default=TELEMETRY_INTERVAL,
+                        help="Seconds between capture telemetry rows")
+    args = parser.parse_args()
+    HEADLESS, PREVIEW_FPS = args.headless, args.preview_fps
+    COLOR_SINK, VIDEO_CODEC, DEPTH_FORMAT = args.color_sink, args.video_codec, args.depth_format
+    REPLAY_LOG, REPLAY_SPEED = args.replay, args.replay_speed
+    TELEMETRY_INTERVAL = args.telemetry_interval
+    use_data_dir(args.data_dir)
     main()
@@ -0,0 +1,152 @@
+"""
+    Capture health telemetry for the camera scripts.
+
+    The capture loop counts grabbed and invalid framesets and times each grab
+    (almost all of it spent inside wait_for_frames); writer threads time each
+    sink's encode and write. Every `interval` seconds a report thread turns the
+    counts into rates over that interval, samples queue backlogs and drop
+    counters, appends one row to a CSV file and prints a one-line summary.
+    The latest report is also available as text for the preview overlay, so
+    frame loss in a long session shows up when and where it happens.
+"""
+
+import threading
+import time
+
+from data_logger import BackgroundCSVWriter
+from metrics import Histogram
+
+TELEMETRY_INTERVAL = 5.0  # Seconds between telemetry rows
+
+
+class CaptureTelemetry:
+    def __init__(self, path, sinks, interval=TELEMETRY_INTERVAL):
+        """
+        path is the CSV file rows are written to, None to only print and show them.
+        sinks names the writers whose write latency is reported, e.g. ("depth", "color");
+        the first must be written once for every saved frame, as it also gives the saved frame rate.
+        """
+        self.path = path
+        self.sinks = tuple(sinks)
+        self.interval = interval
+        self.frames = 0
+        self.invalid = 0
+        self._lock = threading.Lock()
+        self._grab_wait = Histogram()
+        self._writes = {sink: Histogram() for sink in self.sinks}
+        self._queues = {}  # name -> callable returning the current backlog
+        self._drops = {}   # name -> callable returning the frames dropped so far
+        self._last_report = []
+        self._log = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def watch_queue(self, name, queue_depth, dropped=None):
+        """Report a queue's backlog, and optionally its drop count, in every row. Call before start()."""
+        self._queues[name] = queue_depth
+        if dropped is not None:
+            self._drops[name] = dropped
+
+    def start(self):
+        if self.path is not None:
+            header = ["Time", "Frames", "FPS", "SavedFPS", "Invalid", "Dropped", "GrabWaitMeanMs", "GrabWaitMaxMs"]
+            for sink in self.sinks:
+                header += [f"{_column(sink)}WriteMeanMs", f"{_column(sink)}WriteMaxMs"]
+            header += [f"{_column(name)}Queue" for name in self._queues]
+            self._log = BackgroundCSVWriter(self.path, header=header)
+        self._thread = threading.Thread(target=self._run, name="capture-telemetry", daemon=True)
+        self._thread.start()
+
+    def grab(self, grab_frame):
+        """Call grab_frame(), timing it and counting the frameset. Exceptions pass through uncounted."""
+        start = time.perf_counter()
+        frame = grab_frame()
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self._grab_wait.observe(elapsed)
+            if frame is None:
+                self.invalid += 1
+            else:
+                self.frames += 1
+        return frame
+
+    def observe_write(self, sink, seconds):
+        with self._lock:
+            self._writes[sink].observe(seconds)
+
+    def write_observer(self, sink):
+        """Callable recording write latency for `sink`, for writers that report their own timings."""
+        return lambda seconds: self.observe_write(sink, seconds)
+
+    def time_write(self, sink):
+        """Context manager timing one write to `sink`."""
+        return _WriteTimer(self, sink)
+
+    def overlay_lines(self):
+        """Text lines of the latest report, for drawing over the preview."""
+        return self._last_report
+
+    def _run(self):
+        last_time = time.monotonic()
+        last_frames = last_invalid = 0
+        last_drops = {name: 0 for name in self._drops}
+        stopped = False
+        while not stopped:
+            stopped = self._stop_event.wait(self.interval)  # The last row covers the part-interval before close()
+            now = time.monotonic()
+            elapsed = now - last_time
+            # Start a fresh window so every row covers only its own interval
+            with self._lock:
+                frames, invalid = self.frames, self.invalid
+                grab_wait, self._grab_wait = self._grab_wait, Histogram()
+                writes, self._writes = self._writes, {sink: Histogram() for sink in self.sinks}
+            drops = {name: dropped() for name, dropped in self._drops.items()}
+            queues = {name: queue_depth() for name, queue_depth in self._queues.items()}
+
+            fps = (frames - last_frames) / elapsed
+            new_invalid = invalid - last_invalid
+            new_drops = sum(drops[name] - last_drops[name] for name in drops)
+            grab = grab_wait.snapshot()
+            write_stats = {sink: writes[sink].snapshot() for sink in self.sinks}
+            saved_fps = write_stats[self.sinks[0]]["count"] / elapsed if self.sinks else 0.0
+
+            if self._log is not None:
+                row = [time.time(), frames, round(fps, 2), round(saved_fps, 2), new_invalid, new_drops,
+                       round(grab["mean"] * 1000, 2), round(grab["max"] * 1000, 2)]
+                for sink in self.sinks:
+                    row += [round(write_stats[sink]["mean"] * 1000, 2), round(write_stats[sink]["max"] * 1000, 2)]
+                row += list(queues.values())
+                self._log.write_row(row)
+
+            self._last_report = [
+                f"{fps:.1f} fps, {saved_fps:.1f} saved/s, {new_invalid} invalid, {new_drops} dropped",
+                f"grab wait {grab['mean'] * 1000:.1f} ms (max {grab['max'] * 1000:.1f})",
+                " ".join(f"{sink} {write_stats[sink]['mean'] * 1000:.1f} ms" for sink in self.sinks)
+                + "".join(f", {name} queue {depth}" for name, depth in queues.items()),
+            ]
+            print("Capture: " + "; ".join(self._last_report))
+            last_time, last_frames, last_invalid, last_drops = now, frames, invalid, drops
+
+    def close(self):
+        if self._thread is not None:
+            self._stop_event.set()
+            self._thread.join()
+        if self._log is not None:
+            self._log.close()
+
+
+def _column(name):
+    return "".join(part.capitalize() for part in name.split("_"))
+
+
+class _WriteTimer:
+    def __init__(self, telemetry, sink):
+        self.telemetry = telemetry
+        self.sink = sink
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.telemetry.observe_write(self.sink, time.perf_counter() - self.start)
@@ -0,0 +1,141 @@
+"""
+    Clock offset and drift estimation between the server and each sensor client.
+
+    The server sends bursts of time probes; each reply carries the client's clock.
+    Within a burst only the probe with the smallest round trip is kept, since it
+    has the least room for asymmetric network delay. The kept (server time, offset)
+    points are fitted with a line, giving the offset and the drift between clocks.
+"""
+
+import time
+
+import protocol
+
+PROBES_PER_BURST = 8
+HISTORY_SIZE = 30  # Bursts kept for the drift fit
+MAX_DRIFT = 100e-6  # Quartz clocks drift by tens of ppm; a fit beyond this is measurement error
+MIN_DRIFT_SPAN = 10.0  # Seconds the bursts must span before a drift is fitted at all
+
+
+class ClockSync:
+    def __init__(self, name, history_size=HISTORY_SIZE):
+        self.name = name
+        self.history_size = history_size
+        self.points = []     # (server_mid, offset, rtt) for the best probe of each burst
+        self.offset = 0.0    # Client clock minus server clock at reference_time
+        self.drift = 0.0     # Change in offset per second of server time
+        self.reference_time = 0.0
+
+    @property
+    def synced(self):
+        return bool(self.points)
+
+    def add_burst(self, samples):
+        """
+        Add one burst of probe samples, each (t_send, client_ts, t_recv) in server/client seconds.
+        Returns the best (minimum RTT) sample's offset.
+        """
+        t_send, client_ts, t_recv = min(samples, key=lambda s: s[2] - s[0])
+        server_mid = (t_send + t_recv) / 2
+        offset = client_ts - server_mid
+        self.points.append((server_mid, offset, t_recv - t_send))
+        del self.points[:-self.history_size]
+        self._fit()
+        return offset
+
+    def _fit(self):
+        """Least-squares line through the (server_mid, offset) points."""
+        self.reference_time = self.points[0][0]
+        xs = [p[0] - self.reference_time for p in self.points]
+        ys = [p[1] for p in self.points]
+        n = len(xs)
+        mean_x = sum(xs) / n
+        mean_y = sum(ys) / n
+        var_x = sum((x - mean_x) ** 2 for x in xs)
+        self.drift = 0.0
+        # Over a short span, a millisecond of probe jitter already looks like hundreds of ppm
+        if n >= 2 and xs[-1] - xs[0] >= MIN_DRIFT_SPAN and var_x > 0:
+            drift = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / var_x
+            if abs(drift) <= MAX_DRIFT:
+                self.drift = drift
+            else:
+                print(f"Clock sync {self.name}: ignoring implausible drift of {drift * 1e6:.0f} ppm")
+        self.offset = mean_y - self.drift * mean_x
+
+    def offset_at(self, server_ts):
+        """Estimated client-minus-server offset at the given server time."""
+        return self.offset + self.drift * (server_ts - self.reference_time)
+
+    def to_server_time(self, client_ts):
+        """Map a timestamp from the client's clock onto the server's clock."""
+        return self.reference_time + (client_ts - self.reference_time - self.offset) / (1 + self.drift)
+
+
+def probe_burst(sock, reader, count=PROBES_PER_BURST):
+    """Send `count` time probes over a blocking socket and return the (t_send, client_ts, t_recv) samples."""
+    samples = []
+    for probe_id in range(count):
+        t_send = time.time()
+        protocol.send_message(sock, protocol.MSG_TIME_PROBE, protocol.PROBE_ID.pack(probe_id))
+        samples.append(_read_reply(reader.read_message(), probe_id, t_send))
+    return samples
+
+
+async def probe_burst_async(loop, sock, reader, count=PROBES_PER_BURST):
+    """Same as probe_burst(), for a non-blocking socket driven by an asyncio loop."""
+    samples = []
+    for probe_id in range(count):
+        t_send = time.time()
+        await loop.sock_sendall(sock, protocol.encode_message(protocol.MSG_TIME_PROBE, protocol.PROBE_ID.pack(probe_id)))
+        samples.append(_read_reply(await reader.read_message_async(loop), probe_id, t_send))
+    return samples
+
+
+def _read_reply(message, probe_id, t_send):
+    t_recv = time.time()
+    if message is None:
+        raise ConnectionError("Client closed the connection during clock sync")
+    if message[0] != protocol.MSG_TIME_REPLY:
+        raise protocol.ProtocolError(f"Expected time reply, got message type {message[0]}")
+    reply_id, client_ts = protocol.unpack_time_reply(message[1])
+    if reply_id != probe_id:
+        raise protocol.ProtocolError(f"Time reply {reply_id} does not match probe {probe_id}")
+    return t_send, client_ts, t_recv
+
+
+class StreamingProber:
+    """
+    Runs probe bursts over a socket that is also carrying pushed samples.
+    Probes are sent one at a time; each reply, picked out of the data stream by
+    the caller, triggers the next probe until the burst is complete.
+    """
+
+    def __init__(self, sync, count=PROBES_PER_BURST):
+        self.sync = sync
+        self.count = count
+        self.active = False
+        self._samples = []
+        self._t_send = 0.0
+
+    def start(self, sock):
+        self.active = True
+        self._samples = []
+        self._send_probe(sock)
+
+    def handle_reply(self, sock, payload):
+        """Record a time reply. Returns True when the burst is complete and the sync has been updated."""
+        t_recv = time.time()
+        reply_id, client_ts = protocol.unpack_time_reply(payload)
+        if not self.active or reply_id != len(self._samples):
+            return False
+        self._samples.append((self._t_send, client_ts, t_recv))
+        if len(self._samples) < self.count:
+            self._send_probe(sock)
+            return False
+        self.active = False
+        self.sync.add_burst(self._samples)
+        return True
+
+    def _send_probe(self, sock):
+        self._t_send = time.time()
+        protocol.send_message(sock, protocol.MSG_TIME_PROBE, protocol.PROBE_ID.pack(len(self._samples)))
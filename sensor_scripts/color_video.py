@@ -0,0 +1,173 @@
+"""
+    Color frames written to a video container instead of one PNG per frame.
+
+    ColorVideoWriter encodes frames with cv2.VideoWriter on its own thread, as
+    lossless FFV1 or as MJPEG, and writes a sidecar CSV index mapping each
+    capture frame index to its position in the video and its timestamp.
+    Logs refer to a frame as "<video path>#<frame index>"; load_color() accepts
+    those as well as plain color_{n}.png paths, and ColorVideoReader seeks to
+    a frame by index or by timestamp. The index is authoritative for timing:
+    the container's frame rate is nominal, since frames may be written at
+    whatever rate the server requests them rather than the camera's rate.
+"""
+
+import bisect
+import csv
+import queue
+import threading
+import time
+
+import cv2
+
+from data_logger import BackgroundCSVWriter
+
+VIDEO_CODECS = {"FFV1": ".mkv", "MJPG": ".avi"}  # FourCC -> container extension
+DEFAULT_CODEC = "FFV1"  # Lossless; MJPG is several times cheaper to encode but lossy
+MAX_QUEUED_FRAMES = 60
+INDEX_SUFFIX = ".index.csv"
+INDEX_HEADER = ["FrameIndex", "VideoFrame", "Timestamp"]
+REFERENCE_SEPARATOR = "#"
+
+_STOP = object()
+
+
+def video_path(base_path, codec=DEFAULT_CODEC):
+    """base_path with the container extension that suits the codec."""
+    return base_path + VIDEO_CODECS[codec]
+
+
+class ColorVideoWriter:
+    def __init__(self, path, fps, codec=DEFAULT_CODEC, max_queue=MAX_QUEUED_FRAMES, write_observer=None):
+        """
+        The video size is taken from the first frame. Frames are encoded in the order they are written.
+        fps is only the container's nominal rate; each frame's real timestamp is in the index.
+        write_observer, if given, receives the seconds each frame took to encode and write.
+        """
+        if codec not in VIDEO_CODECS:
+            raise ValueError(f"Unsupported codec {codec}, expected one of {', '.join(VIDEO_CODECS)}")
+        self.path = path
+        self.fps = fps
+        self.codec = codec
+        self.write_observer = write_observer
+        self.frames_written = 0
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()  # Counted by both the caller and the encoding thread
+        self._video = None
+        self._index = BackgroundCSVWriter(path + INDEX_SUFFIX, header=INDEX_HEADER)
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, name=f"video-writer:{path}", daemon=True)
+        self._thread.start()
+
+    def write(self, frame_index, color_image, timestamp):
+        """
+        Queue a frame for encoding and return the reference it will be found under.
+        If the queue is full the frame is dropped, counted, and left out of the index.
+        """
+        try:
+            self._queue.put_nowait((frame_index, color_image, timestamp))
+        except queue.Full:
+            self._count_drop()
+            print(f"Video queue full, color frame {frame_index} will not be saved.")
+        return f"{self.path}{REFERENCE_SEPARATOR}{frame_index}"
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def _count_drop(self):
+        with self._dropped_lock:
+            self.dropped += 1
+
+    def close(self):
+        """Encode everything still queued, then finish the video and its index."""
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+        if self._video is not None:
+            self._video.release()
+        self._index.close()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            frame_index, color_image, timestamp = item
+            if self._video is None:
+                height, width = color_image.shape[:2]
+                self._video = cv2.VideoWriter(self.path, cv2.VideoWriter_fourcc(*self.codec), self.fps, (width, height))
+                if not self._video.isOpened():
+                    print(f"Could not open {self.path} for {self.codec} video; color frames will be lost.")
+            if not self._video.isOpened():
+                self._count_drop()
+                continue
+            start = time.perf_counter()
+            self._video.write(color_image)
+            if self.write_observer is not None:
+                self.write_observer(time.perf_counter() - start)
+            self._index.write_row([frame_index, self.frames_written, timestamp])
+            self.frames_written += 1
+
+
+class ColorVideoReader:
+    def __init__(self, path):
+        self.path = path
+        with open(path + INDEX_SUFFIX, newline="") as f:
+            rows = [(int(row["FrameIndex"]), int(row["VideoFrame"]), float(row["Timestamp"]))
+                    for row in csv.DictReader(f)]
+        self.video_frames = {frame_index: video_frame for frame_index, video_frame, _ in rows}
+        # Written in capture order, so already sorted by timestamp
+        self.timestamps = [timestamp for _, _, timestamp in rows]
+        self.frame_indices = [frame_index for frame_index, _, _ in rows]
+        self._capture = cv2.VideoCapture(path)
+        self._position = 0  # Video frame the next read() returns
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def _read_video_frame(self, video_frame):
+        with self._lock:
+            # Seeking costs a keyframe decode; reading on from the current position is free
+            if video_frame != self._position:
+                self._capture.set(cv2.CAP_PROP_POS_FRAMES, video_frame)
+            ok, image = self._capture.read()
+            self._position = video_frame + 1
+        if not ok:
+            raise IndexError(f"Could not decode frame {video_frame} of {self.path}")
+        return image
+
+    def frame(self, frame_index):
+        """The color image logged as capture frame frame_index."""
+        if frame_index not in self.video_frames:
+            raise KeyError(f"Frame {frame_index} is not in {self.path}")
+        return self._read_video_frame(self.video_frames[frame_index])
+
+    def frame_at(self, timestamp):
+        """(frame index, timestamp, image) of the frame captured closest to `timestamp`."""
+        if not self.timestamps:
+            raise IndexError(f"{self.path} has no frames")
+        i = bisect.bisect_left(self.timestamps, timestamp)
+        if i == len(self.timestamps) or (i > 0 and timestamp - self.timestamps[i - 1] <= self.timestamps[i] - timestamp):
+            i -= 1
+        frame_index = self.frame_indices[i]
+        return frame_index, self.timestamps[i], self.frame(frame_index)
+
+    def close(self):
+        self._capture.release()
+
+
+_open_readers = {}
+_open_readers_lock = threading.Lock()
+
+
+def load_color(path):
+    """Load a color image from a color_{n}.png file or a "<video path>#<frame index>" reference."""
+    if REFERENCE_SEPARATOR not in path:
+        return cv2.imread(path)
+    video, frame_index = path.rsplit(REFERENCE_SEPARATOR, 1)
+    with _open_readers_lock:
+        if video not in _open_readers:
+            _open_readers[video] = ColorVideoReader(video)
+        reader = _open_readers[video]
+    return reader.frame(int(frame_index))
@@ -0,0 +1,72 @@
+"""
+    Buffered CSV logging on a background thread.
+    The file stays open for the whole session and rows are written in batches,
+    so callers in the sync loop only pay for a queue put.
+"""
+
+import csv
+import queue
+import threading
+import time
+
+FLUSH_BATCH_SIZE = 50  # Rows written before forcing a flush
+FLUSH_INTERVAL = 1.0   # Seconds between flushes when rows arrive slowly
+
+_STOP = object()
+
+
+class BackgroundCSVWriter:
+    def __init__(self, path, header=None, mode="w", batch_size=FLUSH_BATCH_SIZE, flush_interval=FLUSH_INTERVAL,
+                 flush_observer=None):
+        self.path = path
+        self.flush_observer = flush_observer  # Optional callable receiving the seconds each flush took
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.rows_written = 0
+        self._queue = queue.Queue()
+        self._file = open(path, mode, newline="")
+        self._writer = csv.writer(self._file)
+        if header is not None:
+            self._writer.writerow(header)
+            self._file.flush()
+        self._thread = threading.Thread(target=self._run, name=f"csv-writer:{path}", daemon=True)
+        self._thread.start()
+
+    def write_row(self, row):
+        """Queue a row for writing. Never touches the disk on the caller's thread."""
+        self._queue.put(row)
+
+    def close(self):
+        """Write every queued row, flush and close the file."""
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+        self._file.close()
+
+    def _run(self):
+        batch = []
+        last_flush = time.monotonic()
+        while True:
+            timeout = max(0.0, self.flush_interval - (time.monotonic() - last_flush))
+            try:
+                row = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                row = None
+            if row is _STOP:
+                self._flush(batch)
+                return
+            if row is not None:
+                batch.append(row)
+            if len(batch) >= self.batch_size or time.monotonic() - last_flush >= self.flush_interval:
+                self._flush(batch)
+                batch = []
+                last_flush = time.monotonic()
+
+    def _flush(self, batch):
+        start = time.perf_counter()
+        if batch:
+            self._writer.writerows(batch)
+            self.rows_written += len(batch)
+        self._file.flush()
+        if batch and self.flush_observer is not None:
+            self.flush_observer(time.perf_counter() - start)
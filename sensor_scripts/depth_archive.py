@@ -0,0 +1,271 @@
+"""
+    Losslessly compressed depth frames in chunked archive files.
+
+    Each frame is compressed on its own, as a 16-bit PNG or as zstd/lz4 of the
+    frame with every row delta-encoded, and appended to the current chunk file.
+    An index records where each frame starts and how long it is, so a single
+    frame is decoded without reading anything else. Writer threads compress in
+    parallel; only the append to the chunk file is serialized.
+
+    DepthArchive has the same reserve/write/reference interface as DepthStore,
+    so the capture scripts can use either, and depth_store.load_depth() resolves
+    "<archive dir>#<n>" references too.
+        python depth_archive.py pack ../data/depth_store ../data/depth_archive --codec zstd
+"""
+
+import argparse
+import csv
+import json
+import os
+import threading
+
+import cv2
+import numpy as np
+
+from data_logger import BackgroundCSVWriter
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+CODECS = ("png16", "zstd", "lz4")
+DEFAULT_CODEC = "png16"  # Needs nothing beyond OpenCV; zstd compresses better and faster if installed
+FRAMES_PER_CHUNK = 512
+FRAME_SHAPE = (480, 640)
+FRAME_DTYPE = np.uint16
+PNG_COMPRESSION = 1  # zlib level; higher levels cost a lot of CPU for little gain on depth
+ZSTD_LEVEL = 3
+ARCHIVE_METADATA_FILE = "depth_archive.json"
+INDEX_FILE = "depth_archive_index.csv"
+INDEX_HEADER = ["Frame", "Chunk", "Offset", "Length", "Timestamp", "CaptureFrame"]
+REFERENCE_SEPARATOR = "#"
+
+_local = threading.local()  # zstd (de)compressors are not safe to share between threads
+
+
+def chunk_path(directory, chunk):
+    return os.path.join(directory, f"depth_archive_{chunk:05d}.bin")
+
+
+def check_codec(codec):
+    if codec not in CODECS:
+        raise ValueError(f"Unknown depth codec {codec}, expected one of {', '.join(CODECS)}")
+    if codec == "zstd" and zstandard is None:
+        raise ImportError("The zstd depth codec needs the zstandard package")
+    if codec == "lz4" and lz4 is None:
+        raise ImportError("The lz4 depth codec needs the lz4 package")
+
+
+def encode_depth(depth_image, codec):
+    if codec == "png16":
+        ok, data = cv2.imencode(".png", depth_image, [cv2.IMWRITE_PNG_COMPRESSION, PNG_COMPRESSION])
+        if not ok:
+            raise ValueError("PNG encoding failed")
+        return data.tobytes()
+    # Neighbouring depth pixels are close, so row deltas are mostly small and compress well.
+    # The subtraction wraps around in the frame's unsigned type, which keeps it lossless.
+    deltas = np.diff(depth_image, axis=1, prepend=np.zeros((depth_image.shape[0], 1), depth_image.dtype))
+    if codec == "zstd":
+        if not hasattr(_local, "compressor"):
+            _local.compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+        return _local.compressor.compress(deltas.tobytes())
+    return lz4.frame.compress(deltas.tobytes())
+
+
+def decode_depth(data, codec, shape=FRAME_SHAPE, dtype=FRAME_DTYPE):
+    if codec == "png16":
+        return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_UNCHANGED)
+    if codec == "zstd":
+        if not hasattr(_local, "decompressor"):
+            _local.decompressor = zstandard.ZstdDecompressor()
+        raw = _local.decompressor.decompress(data)
+    else:
+        raw = lz4.frame.decompress(data)
+    deltas = np.frombuffer(raw, dtype=dtype).reshape(shape)
+    return np.cumsum(deltas, axis=1, dtype=dtype)
+
+
+class DepthArchive:
+    def __init__(self, directory, mode="r", codec=DEFAULT_CODEC, frames_per_chunk=FRAMES_PER_CHUNK,
+                 shape=FRAME_SHAPE, dtype=FRAME_DTYPE):
+        """
+        mode "r" opens an existing archive read-only, "a" opens or creates one and appends
+        after the frames already in it, "w" creates a new archive and fails if one exists.
+        The codec, chunk size, frame shape and dtype of an existing archive come from its metadata.
+        """
+        self.directory = directory
+        self.writable = mode != "r"
+        self._lock = threading.Lock()
+        self._entries = {}     # frame number -> (chunk, offset, length, timestamp, capture frame)
+        self._read_files = {}  # chunk number -> open file
+        metadata_path = os.path.join(directory, ARCHIVE_METADATA_FILE)
+
+        if os.path.exists(metadata_path):
+            if mode == "w":
+                raise FileExistsError(f"Depth archive already exists in {directory}")
+            with open(metadata_path) as f:
+                metadata = json.load(f)
+            self.codec = metadata["codec"]
+            self.frames_per_chunk = metadata["frames_per_chunk"]
+            self.shape = tuple(metadata["shape"])
+            self.dtype = np.dtype(metadata["dtype"])
+        elif mode == "r":
+            raise FileNotFoundError(f"No depth archive in {directory}")
+        else:
+            os.makedirs(directory, exist_ok=True)
+            self.codec = codec
+            self.frames_per_chunk = frames_per_chunk
+            self.shape = tuple(shape)
+            self.dtype = np.dtype(dtype)
+            with open(metadata_path, "w") as f:
+                json.dump({"codec": self.codec, "frames_per_chunk": self.frames_per_chunk,
+                           "shape": list(self.shape), "dtype": self.dtype.str}, f, indent=2)
+        check_codec(self.codec)
+
+        index_path = os.path.join(directory, INDEX_FILE)
+        if os.path.exists(index_path):
+            with open(index_path, newline="") as f:
+                for row in csv.DictReader(f):
+                    self._entries[int(row["Frame"])] = (
+                        int(row["Chunk"]), int(row["Offset"]), int(row["Length"]),
+                        float(row["Timestamp"]), int(row["CaptureFrame"]))
+        self._length = max(self._entries) + 1 if self._entries else 0
+
+        self._index_log = None
+        self._chunk_file = None
+        if self.writable:
+            # Appends always go to a fresh chunk, so a chunk cut short by a crash is never written into again
+            self._chunk = max((entry[0] for entry in self._entries.values()), default=-1) + 1
+            self._chunk_frames = 0
+            self._index_log = BackgroundCSVWriter(
+                index_path, header=None if self._entries else INDEX_HEADER, mode="a")
+
+    def __len__(self):
+        return self._length
+
+    def reserve(self):
+        """Claim the next frame number, so it can be reported before the frame is written."""
+        with self._lock:
+            n = self._length
+            self._length += 1
+            return n
+
+    def write(self, n, depth_image, timestamp, frame=-1):
+        """Compress a frame and append it as frame n. Safe to call from several writer threads."""
+        if not self.writable:
+            raise PermissionError("Depth archive was opened read-only")
+        data = encode_depth(depth_image, self.codec)
+        with self._lock:
+            if self._chunk_file is None or self._chunk_frames >= self.frames_per_chunk:
+                if self._chunk_file is not None:
+                    self._chunk_file.close()
+                    self._chunk += 1
+                self._chunk_file = open(chunk_path(self.directory, self._chunk), "ab")
+                self._chunk_frames = 0
+            offset = self._chunk_file.tell()
+            self._chunk_file.write(data)
+            # The index row may reach disk as soon as it is queued, so the frame has to be there first
+            self._chunk_file.flush()
+            self._chunk_frames += 1
+            entry = (self._chunk, offset, len(data), timestamp, frame)
+            self._entries[n] = entry
+            self._length = max(self._length, n + 1)
+        self._index_log.write_row([n, *entry])
+
+    def append(self, depth_image, timestamp, frame=-1):
+        """Write a frame after the last one. Returns its frame number."""
+        n = self.reserve()
+        self.write(n, depth_image, timestamp, frame)
+        return n
+
+    def _read(self, chunk, offset, length):
+        with self._lock:
+            if self._chunk_file is not None and chunk == self._chunk:
+                self._chunk_file.flush()
+            if chunk not in self._read_files:
+                self._read_files[chunk] = open(chunk_path(self.directory, chunk), "rb")
+            f = self._read_files[chunk]
+            f.seek(offset)
+            return f.read(length)
+
+    def __getitem__(self, n):
+        """Decode frame n. Only that frame's bytes are read."""
+        if n not in self._entries:
+            raise IndexError(f"Frame {n} is not in the depth archive {self.directory}")
+        chunk, offset, length, _, _ = self._entries[n]
+        return decode_depth(self._read(chunk, offset, length), self.codec, self.shape, self.dtype)
+
+    def timestamp(self, n):
+        return self._entries[n][3] if n in self._entries else float("nan")
+
+    def index(self):
+        """Timestamps and capture frame numbers of all frames; never-written frames have a NaN timestamp."""
+        index = np.empty(self._length, dtype=[("timestamp", "<f8"), ("frame", "<i8")])
+        index["timestamp"] = np.nan
+        index["frame"] = -1
+        for n, (_, _, _, timestamp, frame) in self._entries.items():
+            index[n] = (timestamp, frame)
+        return index
+
+    def reference(self, n):
+        """String naming frame n in logs, understood by depth_store.load_depth()."""
+        return f"{self.directory}{REFERENCE_SEPARATOR}{n}"
+
+    def close(self):
+        with self._lock:
+            if self._chunk_file is not None:
+                self._chunk_file.close()
+                self._chunk_file = None
+            for f in self._read_files.values():
+                f.close()
+            self._read_files.clear()
+        if self._index_log is not None:
+            self._index_log.close()
+            self._index_log = None
+
+
+def pack_store(store_dir, archive_dir, codec=DEFAULT_CODEC):
+    """Compress every written frame of a DepthStore into a new archive, keeping frame numbers."""
+    from depth_store import DepthStore
+
+    store = DepthStore(store_dir)
+    archive = DepthArchive(archive_dir, mode="w", codec=codec, shape=store.shape, dtype=store.dtype)
+    raw_bytes = packed = 0
+    for start, depth, index in store.iter_chunks():
+        for slot in np.flatnonzero(~np.isnan(index["timestamp"])):
+            archive.write(start + slot, depth[slot], float(index["timestamp"][slot]), int(index["frame"][slot]))
+            raw_bytes += depth[slot].nbytes
+            packed += 1
+    archive.close()
+    size = sum(os.path.getsize(os.path.join(archive_dir, name)) for name in os.listdir(archive_dir))
+    print(f"Packed {packed} frames with {codec}: {raw_bytes / 1e6:.1f} MB -> {size / 1e6:.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compressed depth archive tools.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    pack = subparsers.add_parser("pack", help="Compress a raw depth store into an archive")
+    pack.add_argument("store_dir")
+    pack.add_argument("archive_dir")
+    pack.add_argument("--codec", choices=CODECS, default=DEFAULT_CODEC)
+    export = subparsers.add_parser("export", help="Write one frame as a 16-bit PNG")
+    export.add_argument("archive_dir")
+    export.add_argument("frame", type=int)
+    export.add_argument("output")
+    args = parser.parse_args()
+
+    if args.command == "pack":
+        pack_store(args.store_dir, args.archive_dir, args.codec)
+    else:
+        archive = DepthArchive(args.archive_dir)
+        cv2.imwrite(args.output, archive[args.frame])
+        archive.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""
+    Chunked, memory-mapped storage for depth frames.
+
+    Frames are written into preallocated .npy chunk files of FRAMES_PER_CHUNK
+    frames each, with a parallel index chunk holding every frame's capture
+    timestamp and capture frame number. Frame n lives at slot n % FRAMES_PER_CHUNK
+    of chunk n // FRAMES_PER_CHUNK, so random access is O(1), reads are zero-copy
+    np.memmap views, and reading a session front to back is sequential I/O.
+    Slots that were reserved but never written (dropped frames) have a NaN timestamp.
+
+    Logs refer to a stored frame as "<store dir>#<n>"; load_depth() accepts those,
+    references into compressed depth archives, and plain .npy or 16-bit PNG paths.
+        python depth_store.py convert ../data/camera_timestamps.csv ../data/depth_store
+"""
+
+import argparse
+import csv
+import json
+import os
+import re
+import threading
+
+import cv2
+import numpy as np
+
+from depth_archive import ARCHIVE_METADATA_FILE, DepthArchive
+
+FRAMES_PER_CHUNK = 256        # ~150 MB per chunk at 640x480 uint16
+FRAME_SHAPE = (480, 640)
+FRAME_DTYPE = np.uint16
+INDEX_DTYPE = np.dtype([("timestamp", "<f8"), ("frame", "<i8")])
+METADATA_FILE = "depth_store.json"
+REFERENCE_SEPARATOR = "#"
+
+
+def chunk_paths(directory, chunk):
+    return (os.path.join(directory, f"depth_chunk_{chunk:05d}.npy"),
+            os.path.join(directory, f"index_chunk_{chunk:05d}.npy"))
+
+
+class DepthStore:
+    def __init__(self, directory, mode="r", frames_per_chunk=FRAMES_PER_CHUNK, shape=FRAME_SHAPE, dtype=FRAME_DTYPE):
+        """
+        mode "r" opens an existing store read-only, "a" opens or creates one and appends
+        after the frames already in it, "w" creates a new store and fails if one exists.
+        The chunk size, frame shape and dtype of an existing store come from its metadata.
+        """
+        self.directory = directory
+        self.writable = mode != "r"
+        self._lock = threading.Lock()
+        self._chunks = {}  # chunk number -> (depth memmap, index memmap)
+        metadata_path = os.path.join(directory, METADATA_FILE)
+
+        if os.path.exists(metadata_path):
+            if mode == "w":
+                raise FileExistsError(f"Depth store already exists in {directory}")
+            with open(metadata_path) as f:
+                metadata = json.load(f)
+            self.frames_per_chunk = metadata["frames_per_chunk"]
+            self.shape = tuple(metadata["shape"])
+            self.dtype = np.dtype(metadata["dtype"])
+        elif mode == "r":
+            raise FileNotFoundError(f"No depth store in {directory}")
+        else:
+            os.makedirs(directory, exist_ok=True)
+            self.frames_per_chunk = frames_per_chunk
+            self.shape = tuple(shape)
+            self.dtype = np.dtype(dtype)
+            with open(metadata_path, "w") as f:
+                json.dump({"frames_per_chunk": self.frames_per_chunk, "shape": list(self.shape),
+                           "dtype": self.dtype.str}, f, indent=2)
+
+        self._length = self._count_frames()
+
+    def _count_frames(self):
+        """Frames in the store: one past the last written slot of the last chunk."""
+        chunk = 0
+        while os.path.exists(chunk_paths(self.directory, chunk)[1]):
+            chunk += 1
+        if chunk == 0:
+            return 0
+        index = np.load(chunk_paths(self.directory, chunk - 1)[1], mmap_mode="r")
+        written = np.flatnonzero(~np.isnan(index["timestamp"]))
+        return (chunk - 1) * self.frames_per_chunk + (written[-1] + 1 if len(written) else 0)
+
+    def _chunk(self, chunk, create=False):
+        with self._lock:
+            if chunk in self._chunks:
+                return self._chunks[chunk]
+            depth_path, index_path = chunk_paths(self.directory, chunk)
+            if os.path.exists(index_path):
+                access = "r+" if self.writable else "r"
+                arrays = (np.load(depth_path, mmap_mode=access), np.load(index_path, mmap_mode=access))
+            elif create:
+                # Preallocate the whole chunk; the filesystem keeps unwritten frames sparse
+                depth = np.lib.format.open_memmap(
+                    depth_path, mode="w+", dtype=self.dtype, shape=(self.frames_per_chunk,) + self.shape)
+                index = np.lib.format.open_memmap(
+                    index_path, mode="w+", dtype=INDEX_DTYPE, shape=(self.frames_per_chunk,))
+                index["timestamp"] = np.nan
+                index["frame"] = -1
+                arrays = (depth, index)
+            else:
+                raise IndexError(f"Chunk {chunk} does not exist in {self.directory}")
+            self._chunks[chunk] = arrays
+            return arrays
+
+    def __len__(self):
+        return self._length
+
+    def reserve(self):
+        """Claim the next frame number, so it can be reported before the frame is written."""
+        with self._lock:
+            n = self._length
+            self._length += 1
+            return n
+
+    def write(self, n, depth_image, timestamp, frame=-1):
+        """Write a frame into slot n. Safe to call from several writer threads for different slots."""
+        if not self.writable:
+            raise PermissionError("Depth store was opened read-only")
+        chunk, slot = divmod(n, self.frames_per_chunk)
+        depth, index = self._chunk(chunk, create=True)
+        depth[slot] = depth_image
+        index[slot] = (timestamp, frame)
+        with self._lock:
+            self._length = max(self._length, n + 1)
+
+    def append(self, depth_image, timestamp, frame=-1):
+        """Write a frame after the last one. Returns its frame number."""
+        n = self.reserve()
+        self.write(n, depth_image, timestamp, frame)
+        return n
+
+    def __getitem__(self, n):
+        """Zero-copy view of frame n."""
+        if not 0 <= n < self._length:
+            raise IndexError(f"Frame {n} out of range for a store of {self._length} frames")
+        chunk, slot = divmod(n, self.frames_per_chunk)
+        return self._chunk(chunk)[0][slot]
+
+    def timestamp(self, n):
+        chunk, slot = divmod(n, self.frames_per_chunk)
+        return float(self._chunk(chunk)[1][slot]["timestamp"])
+
+    def index(self):
+        """Timestamps and capture frame numbers of all frames, as one structured array."""
+        chunks = [index for _, _, index in self.iter_chunks()]
+        return np.concatenate(chunks) if chunks else np.empty(0, dtype=INDEX_DTYPE)
+
+    def iter_chunks(self):
+        """Yield (first frame number, depth view, index view) per chunk, trimmed to the frames in the store."""
+        for chunk in range((self._length + self.frames_per_chunk - 1) // self.frames_per_chunk):
+            start = chunk * self.frames_per_chunk
+            count = min(self.frames_per_chunk, self._length - start)
+            if not os.path.exists(chunk_paths(self.directory, chunk)[1]):
+                return  # Frames reserved but never written
+            depth, index = self._chunk(chunk)
+            yield start, depth[:count], index[:count]
+
+    def reference(self, n):
+        """String naming frame n in logs, understood by load_depth()."""
+        return f"{self.directory}{REFERENCE_SEPARATOR}{n}"
+
+    def flush(self):
+        with self._lock:
+            for depth, index in self._chunks.values():
+                if self.writable:
+                    depth.flush()
+                    index.flush()
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._chunks.clear()
+
+
+_open_stores = {}
+_open_stores_lock = threading.Lock()
+
+
+def open_depth(directory):
+    """Open a depth store or compressed depth archive read-only, whichever `directory` holds."""
+    if os.path.exists(os.path.join(directory, ARCHIVE_METADATA_FILE)):
+        return DepthArchive(directory)
+    return DepthStore(directory)
+
+
+def load_depth(path):
+    """Load a depth frame from a .npy or 16-bit PNG file, or a "<store or archive dir>#<n>" reference."""
+    if REFERENCE_SEPARATOR not in path:
+        return np.load(path) if path.endswith(".npy") else cv2.imread(path, cv2.IMREAD_UNCHANGED)
+    directory, n = path.rsplit(REFERENCE_SEPARATOR, 1)
+    with _open_stores_lock:
+        if directory not in _open_stores:
+            _open_stores[directory] = open_depth(directory)
+        store = _open_stores[directory]
+    return store[int(n)]
+
+
+def convert_session(log_file, store_dir, output_log=None, depth_dir=None):
+    """
+    Copy the depth_{n}.npy files listed in a camera_timestamps.csv into a depth store, in log order.
+    Writes a copy of the log whose Depth File column points into the store.
+    Returns the number of frames converted.
+    """
+    output_log = output_log or os.path.splitext(log_file)[0] + "_store.csv"
+    store = DepthStore(store_dir, mode="a")
+    converted = 0
+    with open(log_file, newline="") as f_in, open(output_log, "w", newline="") as f_out:
+        reader = csv.DictReader(f_in)
+        writer = csv.DictWriter(f_out, fieldnames=reader.fieldnames)
+        writer.writeheader()
+        for row in reader:
+            depth_path = row["Depth File"]
+            if not os.path.exists(depth_path) and depth_dir is not None:
+                # Logged paths are relative to wherever the capture script ran
+                depth_path = os.path.join(depth_dir, os.path.basename(depth_path))
+            if not os.path.exists(depth_path):
+                print(f"Missing {depth_path}, skipping.")
+                continue
+            match = re.search(r"(\d+)\.npy$", depth_path)
+            n = store.append(np.load(depth_path), float(row["Timestamp"]), int(match.group(1)) if match else -1)
+            row["Depth File"] = store.reference(n)
+            writer.writerow(row)
+            converted += 1
+    store.close()
+    print(f"Converted {converted} frames into {store_dir}; updated log written to {output_log}")
+    return converted
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chunked depth store tools.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    convert = subparsers.add_parser("convert", help="Convert a session of depth .npy files into a depth store")
+    convert.add_argument("log_file", help="camera_timestamps.csv of the session")
+    convert.add_argument("store_dir")
+    convert.add_argument("--output-log", help="Log rewritten to point into the store (default <log>_store.csv)")
+    convert.add_argument("--depth-dir", help="Directory holding the .npy files, if the logged paths are stale")
+    info = subparsers.add_parser("info", help="Print the size and time span of a depth store")
+    info.add_argument("store_dir")
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        convert_session(args.log_file, args.store_dir, args.output_log, args.depth_dir)
+    else:
+        store = DepthStore(args.store_dir)
+        index = store.index()
+        written = index[~np.isnan(index["timestamp"])]
+        print(f"{len(store)} frames ({len(written)} written) of {store.shape} {store.dtype}, "
+              f"{store.frames_per_chunk} per chunk")
+        if len(written):
+            print(f"Timestamps {written['timestamp'][0]:.3f} to {written['timestamp'][-1]:.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+    High-rate EM sampling into a fixed-size NumPy ring.
+
+    A background thread polls an EM source (see em_source.py) on a fixed-rate
+    deadline schedule and appends each new sample as a (timestamp, values...)
+    row. Requests are answered from the ring: either the newest sample, or
+    every sample since a caller's cursor in one array, so the tracker can run
+    at its full rate while the server asks at camera rate.
+"""
+
+import threading
+
+import numpy as np
+
+from scheduler import DeadlineScheduler
+
+SAMPLER_RATE = 100.0     # Polls per second
+SAMPLE_CAPACITY = 4096   # Samples kept, about 40 s at 100 Hz
+SAMPLE_VALUES = 6        # x, y, z, azimuth, elevation, roll
+SAMPLE_TIMEOUT = 1.0     # Seconds to wait for the first sample
+
+
+class EMSampler(threading.Thread):
+    def __init__(self, source, rate=SAMPLER_RATE, capacity=SAMPLE_CAPACITY, values=SAMPLE_VALUES):
+        """source must already be started. Sampling starts immediately."""
+        super().__init__(name="em-sampler", daemon=True)
+        self.source = source
+        self.rate = rate
+        self.capacity = capacity
+        self.values = values
+        self.samples = 0       # Samples taken so far; also the cursor just past the newest one
+        self.empty_polls = 0   # Polls that found no new valid sample
+        self.finished = False  # The source ran out of samples
+        self._data = np.zeros((capacity, 1 + values))
+        self._condition = threading.Condition()
+        self._stop_event = threading.Event()
+        self.start()
+
+    def run(self):
+        scheduler = DeadlineScheduler(self.rate)
+        while not self._stop_event.is_set():
+            scheduler.wait()
+            try:
+                sample = self.source.grab()
+            except EOFError as e:
+                print(f"EM source finished: {e}")
+                with self._condition:
+                    self.finished = True
+                    self._condition.notify_all()
+                return
+            except (OSError, RuntimeError) as e:
+                print(f"EM sample failed: {e}")
+                continue
+            if sample is None:
+                self.empty_polls += 1
+                continue
+            timestamp, values = sample
+            with self._condition:
+                row = self._data[self.samples % self.capacity]
+                row[0] = timestamp
+                row[1:] = values[:self.values]
+                self.samples += 1
+                self._condition.notify_all()
+        print(f"EM sampling: {scheduler.summary()}")
+
+    def latest(self, timeout=SAMPLE_TIMEOUT):
+        """The newest sample as (timestamp, values), waiting up to `timeout` for the first one. None if there is none."""
+        with self._condition:
+            self._condition.wait_for(lambda: self.samples or self.finished, timeout)
+            if not self.samples:
+                return None
+            row = self._data[(self.samples - 1) % self.capacity]
+            return float(row[0]), tuple(row[1:].tolist())
+
+    def since(self, cursor):
+        """
+        Every sample taken after `cursor`, oldest first, as a copied (n, 1 + values) array.
+        Returns (samples, new cursor, lost), where lost counts samples already overwritten in the ring.
+        Start with a cursor of 0, or of self.samples to skip what was taken before.
+        """
+        with self._condition:
+            end = self.samples
+            start = max(cursor, end - self.capacity)
+            samples = self._data[np.arange(start, end) % self.capacity]
+        return samples, end, start - cursor
+
+    def summary(self):
+        return f"{self.samples} samples, {self.empty_polls} polls without a new sample"
+
+    def close(self):
+        self._stop_event.set()
+        self.join()
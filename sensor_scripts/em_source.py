@@ -0,0 +1,141 @@
+"""
+    Where emtracker_client gets its EM samples from.
+
+    An EM source has start(), grab() and stop(). grab() returns the newest sample
+    as (timestamp, values) with values (x, y, z, azimuth, elevation, roll), None
+    when there is no new valid sample, or raises EOFError once a finite source
+    has no samples left. grab() never blocks for long: the sampler polls it at a
+    fixed rate, the way the tracker's asynchronous records are meant to be read.
+    TrackerSource calls the EMTracker DLL built from emtracker_program/;
+    ReplayEMSource plays back a recorded pose log for testing without the tracker.
+        python emtracker_client.py --replay ../data/Parsed_Pose_Data.csv
+"""
+
+import csv
+import ctypes
+import time
+
+POSE_COLUMNS = ["x", "y", "z", "azimuth", "elevation", "roll"]
+EULER_FORMAT = 2  # SetUpTracker message type for DOUBLE_POSITION_ANGLES records
+VALID_STATUS = 0  # ATC3DG sensor status when the record is good
+VALID_STATUS_TEXT = "0x0000"  # The same status as written in Parsed_Pose_Data.csv
+
+
+class FunctionSource:
+    """Samples whatever get_sample() returns, stamped with the current time. For the get_data() placeholder."""
+    def __init__(self, get_sample):
+        self.get_sample = get_sample
+
+    def start(self):
+        pass
+
+    def grab(self):
+        return time.time(), tuple(self.get_sample())
+
+    def stop(self):
+        pass
+
+
+class TrackerSource:
+    def __init__(self, dll_path, sensor=0, rate=100.0, offset=(0.0, 0.0, 0.0), angle_align=(0.0, 0.0, 0.0)):
+        """
+        dll_path is the EMTracker.dll wrapping the ATC3DG API. rate is the tracker's
+        measurement rate in Hz (at least 20); offset (mm) and angle_align (degrees)
+        are passed to the sensor's SENSOR_OFFSET and ANGLE_ALIGN parameters.
+        """
+        self.dll_path = dll_path
+        self.sensor = sensor
+        self.rate = rate
+        self.offset = offset
+        self.angle_align = angle_align
+        self._dll = None
+        self._sample = (ctypes.c_double * 6)()
+        self._last_sample = None
+
+    def start(self):
+        dll = ctypes.CDLL(self.dll_path)
+        dll.SetUpTracker.argtypes = [ctypes.c_int32, ctypes.c_int32] + [ctypes.c_double] * 7
+        dll.SetUpTracker.restype = ctypes.c_int
+        dll.GetSampleEuler.argtypes = [ctypes.c_int32, ctypes.POINTER(ctypes.c_double)]
+        dll.GetSampleEuler.restype = ctypes.c_int
+        dll.ShutDownTracker.restype = ctypes.c_int
+        # SetUpTracker prints its own failures; its return value is only set on the failure paths
+        dll.SetUpTracker(self.sensor, EULER_FORMAT, *self.offset, *self.angle_align, self.rate)
+        self._dll = dll
+        self._last_sample = None
+
+    def grab(self):
+        status = self._dll.GetSampleEuler(self.sensor, self._sample)
+        timestamp = time.time()
+        if status != VALID_STATUS:
+            return None
+        sample = tuple(self._sample)
+        # GetAsynchronousRecord hands back the same record until the tracker measures again, and the
+        # record carries no time of its own; a repeat of all six doubles is that same record
+        if sample == self._last_sample:
+            return None
+        self._last_sample = sample
+        return timestamp, sample
+
+    def stop(self):
+        if self._dll is not None:
+            self._dll.ShutDownTracker()
+            self._dll = None
+
+
+class ReplayEMSource:
+    """
+    Replays a recorded pose log: Parsed_Pose_Data.csv from the tracker software, or the
+    em_stream.csv / synchronized_data.csv written by server.py. Like the tracker,
+    grab() returns the newest recorded sample due by now, with recorded times scaled by
+    1/speed, and the current time as its timestamp. Invalid-status rows are skipped.
+    """
+    def __init__(self, log_file, speed=1.0, loop=False):
+        self.log_file = log_file
+        self.speed = speed
+        self.loop = loop
+        self.samples_replayed = 0
+        with open(log_file, newline="") as f:
+            reader = csv.DictReader(f)
+            self.rows = [row for row in (self._parse(row) for row in reader) if row is not None]
+        if not self.rows:
+            raise ValueError(f"No valid EM samples in {log_file}")
+        self._position = 0
+        self._start = None
+
+    @staticmethod
+    def _parse(row):
+        """(recorded time, values) of a log row, or None for an invalid sample."""
+        if "time" in row:
+            if row.get("status", VALID_STATUS_TEXT) != VALID_STATUS_TEXT:
+                return None
+            return float(row["time"]), tuple(float(row[c]) for c in POSE_COLUMNS)
+        timestamp = row["EMTimestamp"] if "EMTimestamp" in row else row["EMTimestampCorrected"]
+        return float(timestamp), tuple(float(v) for v in row["EMData"].split(","))
+
+    def start(self):
+        self._position = 0
+        self._start = time.monotonic()
+
+    def grab(self):
+        if self._position == len(self.rows):
+            if not self.loop:
+                raise EOFError(f"Replay of {self.log_file} finished")
+            self._position = 0
+            self._start = time.monotonic()
+        elapsed = time.monotonic() - self._start
+        first = self.rows[0][0]
+        # Skip to the newest sample due by now; the ones passed over are lost, as with a slow poll of the tracker
+        position = self._position
+        while position < len(self.rows) and (self.speed <= 0 or (self.rows[position][0] - first) / self.speed <= elapsed):
+            position += 1
+            if self.speed <= 0:
+                break  # No pacing: one sample per poll
+        if position == self._position:
+            return None
+        self._position = position
+        self.samples_replayed += 1
+        return time.time(), self.rows[position - 1][1]
+
+    def stop(self):
+        pass
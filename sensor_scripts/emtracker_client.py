@@ -2,61 +2,164 @@
     Do not run this on the same computer as the server - it should be running with camera_client
 """
 
+import argparse
 import socket
 import time
-import json
+
+import protocol
+from em_sampler import SAMPLE_CAPACITY, SAMPLER_RATE, EMSampler
+from em_source import FunctionSource, ReplayEMSource, TrackerSource
+from protocol import MessageReader
 
 SERVER_IP = "0.0.0.0"  # Change to the actual server IP
 PORT = 4999
 RETRY_DELAY = 5  # Seconds to wait before retrying connection
+STREAM_ID = 0  # Distinguishes this client from others of the same type on the server
+STREAM_RATE = 100  # Pushes per second to the server in streaming mode, each with every sample since the last
+TRACKER_DLL = None  # Path to EMTracker.dll; None samples get_data() instead
+TRACKER_SENSOR = 0
+REPLAY_LOG = None  # Recorded pose log to replay instead of using the tracker
+REPLAY_SPEED = 1.0
+REPLAY_LOOP = False
 
 def get_data():
     """Return the sensor or array data. Modify this function to supply actual data."""
-    data = [0.1, 0.2, 0.3]
+    data = [0.1, 0.2, 0.3, 0.0, 0.0, 0.0]  # x, y, z, azimuth, elevation, roll
     return data
 
+def open_em_source():
+    if TRACKER_DLL is not None:
+        return TrackerSource(TRACKER_DLL, TRACKER_SENSOR, SAMPLER_RATE)
+    if REPLAY_LOG is not None:
+        return ReplayEMSource(REPLAY_LOG, speed=REPLAY_SPEED, loop=REPLAY_LOOP)
+    return FunctionSource(get_data)
+
+def send_batch(client, sampler, cursor):
+    """Send every sample taken since `cursor` in one message. Returns the new cursor."""
+    samples, cursor, lost = sampler.since(cursor)
+    if lost:
+        print(f"{lost} EM samples were overwritten before they could be sent.")
+    protocol.send_message(client, protocol.MSG_EM_BATCH, protocol.pack_em_batch(samples, lost))
+    return cursor
+
+def answer_time_probe(client, payload):
+    """Answer a clock sync probe with the current local time."""
+    protocol.send_message(client, protocol.MSG_TIME_REPLY, protocol.pack_time_reply(payload, time.time()))
+
+def stream_data(client, reader, sampler, cursor):
+    """
+    Push the samples taken since the last push to the server every 1/STREAM_RATE seconds
+    without waiting for requests. Clock sync probes are answered while waiting for the next deadline.
+    """
+    print(f"Streaming data to server at {STREAM_RATE} Hz.")
+    period = 1.0 / STREAM_RATE
+    next_deadline = time.monotonic()
+    while not sampler.finished:
+        remaining = next_deadline - time.monotonic()
+        if remaining > 0:
+            messages = reader.poll_messages(remaining)
+            if messages is None:
+                print("Server closed the connection.")
+                return
+            for msg_type, payload in messages:
+                if msg_type == protocol.MSG_TIME_PROBE:
+                    answer_time_probe(client, payload)
+            continue
+
+        if sampler.samples > cursor:
+            cursor = send_batch(client, sampler, cursor)
+        next_deadline += period
+
+    # The source ran out: send whatever was sampled since the last push
+    if sampler.samples > cursor:
+        send_batch(client, sampler, cursor)
+
 def send_data():
+    sampler = None
+    source = None
     try:
         # Establish connection with the server.
         client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         client.connect((SERVER_IP, PORT))
         print("Connected to server.")
 
-        # Optional handshake message.
-        client.send(b"ClientConnected")
+        # Handshake message identifying the client type.
+        protocol.send_message(client, protocol.MSG_HELLO, protocol.pack_text(f"EMTracker:{STREAM_ID}"))
+        reader = MessageReader(client)
+
+        # Sample at the tracker's rate in the background; requests are answered from the ring
+        source = open_em_source()
+        source.start()
+        sampler = EMSampler(source, SAMPLER_RATE, SAMPLE_CAPACITY)
+        cursor = 0  # Samples up to here have been sent in a batch
 
         while True:
             # Block until the server sends a request message.
-            server_msg = client.recv(1024)
-            if not server_msg:
+            message = reader.read_message()
+            if message is None:
                 # An empty message indicates the server closed the connection.
                 print("Server closed the connection.")
                 break
 
-            # Trim any whitespace and decode.
-            request = server_msg.strip()
-            print(f"Received request: {request}")
+            msg_type, payload = message
+            print(f"Received request: {msg_type}")
 
             # Check if the request is a trigger to send data.
-            if request == b"RequestEMData":
-                timestamp = time.time()
-                data_payload = {
-                    "timestamp": timestamp,
-                    "data": get_data()
-                }
-                # Send the JSON-encoded payload.
-                client.send(json.dumps(data_payload).encode())
-                print(f"Sent data: {data_payload}")
+            if msg_type == protocol.MSG_REQUEST_EM:
+                sample = sampler.latest()
+                if sample is None:
+                    # An empty reply, so the server is not left waiting
+                    print("No EM sample yet, sending an empty reply.")
+                    protocol.send_message(client, protocol.MSG_EM_DATA)
+                    continue
+                timestamp, data = sample
+                # Send the newest sample's timestamp and values as packed float64.
+                protocol.send_message(client, protocol.MSG_EM_DATA, protocol.pack_em_data(timestamp, data))
+                print(f"Sent data: {timestamp}, {data}")
+            elif msg_type == protocol.MSG_REQUEST_EM_BATCH:
+                previous = cursor
+                cursor = send_batch(client, sampler, cursor)
+                print(f"Sent {cursor - previous} samples")
+            elif msg_type == protocol.MSG_TIME_PROBE:
+                answer_time_probe(client, payload)
+            elif msg_type == protocol.MSG_START_STREAM:
+                stream_data(client, reader, sampler, cursor)
+                break
             else:
                 print("Received an unrecognized request; ignoring.")
 
-    except (socket.error, ConnectionRefusedError) as e:
+    except (socket.error, ConnectionRefusedError, protocol.ProtocolError) as e:
         print(f"Connection error: {e}. Retrying in {RETRY_DELAY} seconds...")
         time.sleep(RETRY_DELAY)
     finally:
         client.close()
-        print("Connection closed. Attempting reconnection...")
+        if sampler is not None:
+            sampler.close()
+            print(f"EM sampler: {sampler.summary()}")
+        if source is not None:
+            source.stop()
+
+    if sampler is not None and sampler.finished:
+        print("EM source finished.")
+        return True
+    print("Connection closed. Attempting reconnection...")
 
 if __name__ == "__main__":
-    while True:
-        send_data()
+    parser = argparse.ArgumentParser(description="EM tracker client.")
+    parser.add_argument("--server", default=SERVER_IP)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--stream-id", type=int, default=STREAM_ID)
+    parser.add_argument("--rate", type=float, default=SAMPLER_RATE, help="Tracker polls per second")
+    parser.add_argument("--capacity", type=int, default=SAMPLE_CAPACITY, help="Samples kept between requests")
+    parser.add_argument("--tracker-dll", default=TRACKER_DLL, help="EMTracker.dll to sample the tracker through")
+    parser.add_argument("--sensor", type=int, default=TRACKER_SENSOR)
+    parser.add_argument("--replay", metavar="LOG", help="Replay a recorded pose log instead of using the tracker")
+    parser.add_argument("--replay-speed", type=float, default=REPLAY_SPEED, help="Replay speed-up, 0 for no pacing")
+    parser.add_argument("--replay-loop", action="store_true", help="Start the replay over when it ends")
+    args = parser.parse_args()
+    SERVER_IP, PORT, STREAM_ID = args.server, args.port, args.stream_id
+    SAMPLER_RATE, SAMPLE_CAPACITY = args.rate, args.capacity
+    TRACKER_DLL, TRACKER_SENSOR = args.tracker_dll, args.sensor
+    REPLAY_LOG, REPLAY_SPEED, REPLAY_LOOP = args.replay, args.replay_speed, args.replay_loop
+    while not send_data():
+        pass
@@ -0,0 +1,87 @@
+"""
+    Continuous frame grabbing into a single-slot buffer.
+
+    A background thread keeps pulling frames from the camera and keeps only the
+    newest one, numbered with a sequence number. Requests are answered from that
+    slot straight away instead of waiting up to a frame period for the next
+    frame; the frame's own capture timestamp says how old it is.
+"""
+
+import threading
+
+FRAME_TIMEOUT = 5.0  # Seconds to wait for a frame before giving up on the camera
+
+
+class LatestFrameGrabber(threading.Thread):
+    def __init__(self, grab_frame):
+        """
+        grab_frame() blocks until the camera delivers a frame and returns
+        (timestamp, depth_image, color_image), or None for an invalid frameset.
+        The arrays must be copies the driver will not reuse. Grabbing ends when
+        grab_frame() raises EOFError, for sources that run out of frames, or any
+        error other than a RuntimeError, which is kept in `error`.
+        """
+        super().__init__(name="frame-grabber", daemon=True)
+        self.grab_frame = grab_frame
+        self.frames_grabbed = 0
+        self.invalid_frames = 0
+        self.finished = False  # The source ran out of frames or failed
+        self.error = None  # What made the source fail, if it did
+        self._condition = threading.Condition()
+        self._latest = None  # (sequence, timestamp, depth_image, color_image)
+        self._stop_event = threading.Event()
+        self.start()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                frame = self.grab_frame()
+            except EOFError as e:
+                print(f"Frame source finished: {e}")
+                self._finish()
+                return
+            except RuntimeError as e:
+                # wait_for_frames raises on timeout; keep trying until closed
+                print(f"Frame grab failed: {e}")
+                continue
+            except Exception as e:
+                # Anything else (a bad replay file, a cv2 error) will not go away by retrying
+                print(f"Frame source failed: {e!r}")
+                self.error = e
+                self._finish()
+                return
+            if frame is None:
+                self.invalid_frames += 1
+                continue
+            with self._condition:
+                self.frames_grabbed += 1
+                self._latest = (self.frames_grabbed,) + tuple(frame)
+                self._condition.notify_all()
+
+    def _finish(self):
+        """Wake everyone waiting for a frame; none will come."""
+        with self._condition:
+            self.finished = True
+            self._condition.notify_all()
+
+    def latest(self):
+        """The newest frame as (sequence, timestamp, depth_image, color_image), or None before the first one."""
+        with self._condition:
+            return self._latest
+
+    def wait_for_newer(self, sequence, timeout=FRAME_TIMEOUT):
+        """Return the newest frame once its sequence is past `sequence`, or None on timeout or when finished."""
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self.finished or (self._latest is not None and self._latest[0] > sequence), timeout)
+            if self._latest is not None and self._latest[0] > sequence:
+                return self._latest
+            return None
+
+    def summary(self):
+        return f"{self.frames_grabbed} frames grabbed, {self.invalid_frames} invalid"
+
+    def close(self):
+        """Stop grabbing. Returns once the frame being waited for, if any, has arrived."""
+        self._stop_event.set()
+        self.join(FRAME_TIMEOUT)
@@ -0,0 +1,192 @@
+"""
+    Shared-memory ring of recent camera frames for processes on the same machine.
+
+    The capture process publishes every frame into one of RING_SLOTS slots of a
+    multiprocessing.shared_memory segment, with a sequence number and timestamp.
+    Readers attach by name and get NumPy views straight onto the shared slots,
+    so live consumers (ArUco detection, inference, a viewer) see frames without
+    a disk round trip.
+
+    Views are zero-copy: a slot is reused RING_SLOTS frames later, so a reader
+    that holds on to a frame longer than that must copy it, or check
+    is_current(sequence) after using it. camera_client.py --shared-ring publishes
+    to "RealSense_<stream id>":
+        python frame_ring.py watch RealSense_0
+"""
+
+import argparse
+import sys
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+RING_SLOTS = 8  # About 250 ms of frames at 30 fps
+DEPTH_SHAPE = (480, 640)
+COLOR_SHAPE = (480, 640, 3)
+NAME_PREFIX = "mech464_frames_"
+MAGIC = b"FRNG"
+HEADER_SIZE = 64
+HEADER_DTYPE = np.dtype([
+    ("magic", "S4"), ("slots", "<u4"), ("depth_shape", "<u4", 2), ("color_shape", "<u4", 3), ("latest", "<u8"),
+])
+SLOT_DTYPE = np.dtype([("sequence", "<u8"), ("timestamp", "<f8")])
+POLL_INTERVAL = 0.001  # Seconds between checks while waiting for a new frame
+
+
+def _align(offset, alignment=64):
+    return (offset + alignment - 1) // alignment * alignment
+
+
+def _layout(slots, depth_shape, color_shape):
+    """Byte offsets of the slot table, depth frames and color frames, and the total size."""
+    table = HEADER_SIZE
+    depth = _align(table + slots * SLOT_DTYPE.itemsize)
+    color = _align(depth + slots * int(np.prod(depth_shape)) * np.dtype(np.uint16).itemsize)
+    size = _align(color + slots * int(np.prod(color_shape)))
+    return table, depth, color, size
+
+
+class _FrameRing:
+    def _map(self, slots, depth_shape, color_shape):
+        table, depth, color, _ = _layout(slots, depth_shape, color_shape)
+        buf = self._shm.buf
+        self.slots = slots
+        self._header = np.ndarray((), dtype=HEADER_DTYPE, buffer=buf)
+        self._table = np.ndarray((slots,), dtype=SLOT_DTYPE, buffer=buf, offset=table)
+        self._depth = np.ndarray((slots,) + tuple(depth_shape), dtype=np.uint16, buffer=buf, offset=depth)
+        self._color = np.ndarray((slots,) + tuple(color_shape), dtype=np.uint8, buffer=buf, offset=color)
+
+    def _release(self):
+        # The views must go before the mapping can be closed
+        self._header = self._table = self._depth = self._color = None
+        self._shm.close()
+
+
+class FrameRingWriter(_FrameRing):
+    def __init__(self, name, slots=RING_SLOTS, depth_shape=DEPTH_SHAPE, color_shape=COLOR_SHAPE):
+        self.name = NAME_PREFIX + name
+        size = _layout(slots, depth_shape, color_shape)[3]
+        try:
+            self._shm = shared_memory.SharedMemory(self.name, create=True, size=size)
+        except FileExistsError:
+            # Left behind by a capture process that did not shut down cleanly
+            stale = shared_memory.SharedMemory(self.name)
+            stale.close()
+            stale.unlink()
+            self._shm = shared_memory.SharedMemory(self.name, create=True, size=size)
+        self._map(slots, depth_shape, color_shape)
+        self._table["sequence"] = 0
+        self._header["slots"] = slots
+        self._header["depth_shape"] = depth_shape
+        self._header["color_shape"] = color_shape
+        self._header["latest"] = 0
+        self._header["magic"] = MAGIC  # Last, so readers never see a half-written header
+        self.sequence = 0
+
+    def publish(self, timestamp, depth_image, color_image):
+        """Copy a frame into the next slot and make it the latest. Returns its sequence number."""
+        self.sequence += 1
+        slot = self.sequence % self.slots
+        # Sequence 0 marks the slot as being written, so readers skip it until it is complete
+        self._table[slot]["sequence"] = 0
+        self._depth[slot] = depth_image
+        self._color[slot] = color_image
+        self._table[slot]["timestamp"] = timestamp
+        self._table[slot]["sequence"] = self.sequence
+        self._header["latest"] = self.sequence
+        return self.sequence
+
+    def close(self):
+        self._release()
+        self._shm.unlink()
+
+
+class FrameRingReader(_FrameRing):
+    def __init__(self, name):
+        self.name = NAME_PREFIX + name
+        # The writer owns the segment. A reader registered with its resource tracker would unlink it on exit,
+        # so it attaches untracked (track=False, 3.13+) or unregisters right after attaching
+        if sys.version_info >= (3, 13):
+            self._shm = shared_memory.SharedMemory(self.name, track=False)
+        else:
+            self._shm = shared_memory.SharedMemory(self.name)
+            resource_tracker.unregister(self._shm._name, "shared_memory")
+        header = np.ndarray((), dtype=HEADER_DTYPE, buffer=self._shm.buf)
+        if header["magic"] != MAGIC:
+            raise ValueError(f"{self.name} is not a frame ring")
+        self._map(int(header["slots"]), tuple(header["depth_shape"]), tuple(header["color_shape"]))
+
+    @property
+    def latest_sequence(self):
+        return int(self._header["latest"])
+
+    def is_current(self, sequence):
+        """True while the slot holding `sequence` has not been reused for a newer frame."""
+        return int(self._table[sequence % self.slots]["sequence"]) == sequence
+
+    def read(self, sequence):
+        """(sequence, timestamp, depth view, color view) of frame `sequence`, or None if it is gone or not written."""
+        if sequence <= 0:
+            return None
+        slot = sequence % self.slots
+        timestamp = float(self._table[slot]["timestamp"])
+        if not self.is_current(sequence):
+            return None
+        return sequence, timestamp, self._depth[slot], self._color[slot]
+
+    def latest(self):
+        """The newest frame, or None before the first one is published."""
+        return self.read(self.latest_sequence)
+
+    def wait_for_newer(self, sequence, timeout=None):
+        """The newest frame once it is past `sequence`, or None on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.latest_sequence <= sequence:
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            time.sleep(POLL_INTERVAL)
+        return self.latest()
+
+    def close(self):
+        self._release()
+
+
+def watch(name, duration):
+    """Print the frame rate and delivery latency seen by a reader of the ring."""
+    reader = FrameRingReader(name)
+    print(f"Attached to {reader.name}: {reader.slots} slots")
+    sequence = reader.latest_sequence
+    frames = missed = 0
+    latencies = []
+    start = time.monotonic()
+    try:
+        while duration is None or time.monotonic() - start < duration:
+            frame = reader.wait_for_newer(sequence, timeout=1.0)
+            if frame is None:
+                continue
+            latencies.append(time.time() - frame[1])
+            missed += frame[0] - sequence - 1 if sequence else 0
+            sequence = frame[0]
+            frames += 1
+    except KeyboardInterrupt:
+        pass
+    elapsed = time.monotonic() - start
+    reader.close()
+    if latencies:
+        print(f"{frames} frames in {elapsed:.1f} s ({frames / elapsed:.1f} fps), {missed} skipped, "
+              f"median latency {np.median(latencies) * 1000:.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared-memory frame ring tools.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    watch_parser = subparsers.add_parser("watch", help="Report the rate and latency of frames in a ring")
+    watch_parser.add_argument("name", help="Ring name, e.g. RealSense_0")
+    watch_parser.add_argument("--duration", type=float, help="Seconds to watch (default: until Ctrl+C)")
+    args = parser.parse_args()
+    watch(args.name, args.duration)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+    Where the capture scripts get their frames from.
+
+    A frame source has start(), grab() and stop(). grab() blocks until the next
+    frame and returns (timestamp, depth_image, color_image), None for an invalid
+    frameset, or raises EOFError once a finite source has no frames left.
+    RealSenseSource wraps the live camera; ReplaySource plays back a recorded
+    session from its camera_timestamps.csv, so the capture, write and serve
+    path can be run and profiled without a camera attached.
+        python camera_manual_data_collection.py --replay ../data/camera_timestamps.csv --replay-speed 2
+"""
+
+import csv
+import os
+import time
+
+import numpy as np
+
+from color_video import load_color
+from depth_store import load_depth
+
+CAMERA_WIDTH = 640
+CAMERA_HEIGHT = 480
+
+
+class RealSenseSource:
+    def __init__(self, fps, width=CAMERA_WIDTH, height=CAMERA_HEIGHT):
+        self.fps = fps
+        self.width = width
+        self.height = height
+        self._pipeline = None
+
+    def start(self):
+        import pyrealsense2 as rs  # Only needed with the camera attached
+
+        self._pipeline = rs.pipeline()
+        config = rs.config()
+        config.enable_stream(rs.stream.depth, self.width, self.height, rs.format.z16, self.fps)
+        config.enable_stream(rs.stream.color, self.width, self.height, rs.format.bgr8, self.fps)
+        self._pipeline.start(config)
+
+    def grab(self):
+        frames = self._pipeline.wait_for_frames()
+        depth_frame = frames.get_depth_frame()
+        color_frame = frames.get_color_frame()
+        timestamp = time.time()
+
+        if not depth_frame or not color_frame:
+            return None
+
+        # Copy the frames into numpy arrays; the driver reuses its buffers once the frameset is released.
+        return timestamp, np.array(depth_frame.get_data()), np.array(color_frame.get_data())
+
+    def stop(self):
+        if self._pipeline is not None:
+            self._pipeline.stop()
+            self._pipeline = None
+
+
+class ReplaySource:
+    """
+    Replays the frames listed in a camera_timestamps.csv, spaced like the original
+    capture divided by `speed` (0 replays as fast as frames can be loaded).
+    Frames get the current time as their timestamp, like a live camera would.
+    """
+    def __init__(self, log_file, speed=1.0, loop=False):
+        self.log_file = log_file
+        self.speed = speed
+        self.loop = loop
+        self.frames_replayed = 0
+        with open(log_file, newline="") as f:
+            self.rows = [(float(row["Timestamp"]), row["Depth File"], row["Color File"]) for row in csv.DictReader(f)]
+        if not self.rows:
+            raise ValueError(f"No frames in {log_file}")
+        self._position = 0
+        self._start = None
+
+    def _resolve(self, path):
+        """Logged paths are relative to wherever capture ran; fall back to looking next to the log."""
+        log_dir = os.path.dirname(os.path.abspath(self.log_file))
+        for candidate in (path,
+                          os.path.join(log_dir, os.path.basename(os.path.dirname(path)), os.path.basename(path)),
+                          os.path.join(log_dir, os.path.basename(path))):
+            # Store, archive and video references name a frame after "#"
+            if os.path.exists(candidate.split("#")[0]):
+                return candidate
+        return path
+
+    def start(self):
+        self._position = 0
+        self._start = time.monotonic()
+
+    def grab(self):
+        if self._position == len(self.rows):
+            if not self.loop:
+                raise EOFError(f"Replay of {self.log_file} finished")
+            self._position = 0
+            self._start = time.monotonic()
+        recorded_time, depth_path, color_path = self.rows[self._position]
+        self._position += 1
+
+        # Load first, then wait, so loading does not delay the frame
+        depth_image = load_depth(self._resolve(depth_path))
+        color_image = load_color(self._resolve(color_path))
+        if self.speed > 0:
+            due = self._start + (recorded_time - self.rows[0][0]) / self.speed
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        if depth_image is None or color_image is None:
+            return None
+        self.frames_replayed += 1
+        # Copy so store-backed frames do not stay tied to the memory map
+        return time.time(), depth_image.copy(), color_image
+
+    def stop(self):
+        pass
@@ -0,0 +1,121 @@
+"""
+    Background persistence for captured frames.
+
+    The capture loop hands each frame to a FrameWriterPool and carries on; a
+    small pool of writer threads does the encoding and disk writes. The queue
+    is bounded so a slow disk cannot grow memory without limit: when it is
+    full, new frames are dropped and counted instead of blocking capture.
+    Writers finish out of order, so each save_frame() result is handed to
+    on_saved in the order the frames were submitted.
+"""
+
+import queue
+import threading
+
+WRITER_THREADS = 3       # cv2.imwrite and np.save release the GIL, so a few threads help
+MAX_QUEUED_FRAMES = 60   # About 2 s of 30 fps 640x480 color + depth
+
+_STOP = object()
+_FAILED = object()
+
+
+class FrameWriterPool:
+    def __init__(self, save_frame, num_workers=WRITER_THREADS, max_queue=MAX_QUEUED_FRAMES, on_saved=None):
+        """
+        save_frame is called on a writer thread with each submitted frame and does the actual writing.
+        Frames must own their pixel buffers: copy arrays that point into camera driver memory before submitting.
+        on_saved, if given, is called with save_frame's return value for every frame saved, in submission
+        order; frames that failed to save are skipped.
+        """
+        self.save_frame = save_frame
+        self.on_saved = on_saved
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._next_submitted = 0  # Sequence number of the next frame submitted
+        self._next_saved = 0      # Sequence number of the next frame to hand to on_saved
+        self._results = {}        # Finished frames waiting for earlier ones, by sequence number
+        self.submitted = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.max_depth = 0
+        self._workers = [
+            threading.Thread(target=self._run, name=f"frame-writer-{i}", daemon=True)
+            for i in range(num_workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, frame):
+        """Queue a frame for writing. Returns False if the queue was full and the frame was dropped."""
+        return self.submit_from(lambda: frame) is not None
+
+    def submit_from(self, make_frame):
+        """
+        Queue the frame make_frame() returns, calling it only if there is room for it, so whatever it
+        claims (a store slot, a video frame) is only claimed for frames that will be written.
+        Returns the frame, or None if the queue was full and the frame was dropped.
+        """
+        with self._lock:
+            # Writers only take from the queue and every put happens under the lock, so the room stays
+            if self._queue.full():
+                self.dropped += 1
+                return None
+            frame = make_frame()
+            self._queue.put_nowait((self._next_submitted, frame))
+            self._next_submitted += 1
+            self.submitted += 1
+            self.max_depth = max(self.max_depth, self._queue.qsize())
+        return frame
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "max_queue_depth": self.max_depth,
+                "submitted": self.submitted,
+                "written": self.written,
+                "dropped": self.dropped,
+                "failed": self.failed,
+            }
+
+    def summary(self):
+        s = self.stats()
+        return (f"queue {s['queue_depth']} (max {s['max_queue_depth']}), written {s['written']}, "
+                f"dropped {s['dropped']}, failed {s['failed']}")
+
+    def close(self):
+        """Write everything still queued, then stop the writer threads."""
+        for _ in self._workers:
+            self._queue.put(_STOP)
+        for worker in self._workers:
+            worker.join()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            sequence, frame = item
+            try:
+                result = self.save_frame(frame)
+            except Exception as e:
+                result = _FAILED
+                print(f"Failed to write frame: {e}")
+            with self._lock:
+                if result is _FAILED:
+                    self.failed += 1
+                else:
+                    self.written += 1
+                self._results[sequence] = result
+                # Hand over every result that is now next in line
+                while self._next_saved in self._results:
+                    result = self._results.pop(self._next_saved)
+                    self._next_saved += 1
+                    if result is not _FAILED and self.on_saved is not None:
+                        self.on_saved(result)
+
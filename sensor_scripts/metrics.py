@@ -0,0 +1,218 @@
+"""
+    Lightweight in-process metrics for the capture server.
+
+    Counters and histograms are kept in a MetricsRegistry and can be served
+    in Prometheus text format from a local HTTP endpoint and/or dumped
+    periodically to a JSON stats file. Observing a value only takes a lock
+    and a few additions, so it is cheap enough for the sync loop.
+"""
+
+import bisect
+import json
+import math
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds in seconds, from sub-millisecond socket round trips up to stalled sensors
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+class Counter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def snapshot(self):
+        return {"value": self.value}
+
+    def render(self, name, labels):
+        return [f"{name}{_format_labels(labels)} {self.value}"]
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self._lock = threading.Lock()
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # Last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.sum += value
+            self.max = max(self.max, value)
+
+    def time(self):
+        """Context manager observing the elapsed time of its block."""
+        return _Timer(self)
+
+    def quantile(self, q):
+        """Estimate a quantile by linear interpolation inside the bucket that contains it."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for i, bucket_count in enumerate(self.counts):
+            if cumulative + bucket_count >= rank and bucket_count:
+                # Clamp to the largest observed value so estimates never exceed it
+                upper = min(self.buckets[i], self.max) if i < len(self.buckets) else self.max
+                lower = min(self.buckets[i - 1], upper) if i > 0 else 0.0
+                return lower + (upper - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return self.max
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "count": self.count,
+                "mean": self.sum / self.count if self.count else 0.0,
+                "p50": self.quantile(0.5),
+                "p90": self.quantile(0.9),
+                "p99": self.quantile(0.99),
+                "max": self.max,
+            }
+
+    def render(self, name, labels):
+        with self._lock:
+            lines = []
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), self.counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == math.inf else repr(bound)
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {self.sum}")
+            lines.append(f"{name}_count{_format_labels(labels)} {self.count}")
+            return lines
+
+
+class _Timer:
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}  # (name, labels) -> metric
+        self._help = {}     # name -> (type, help text)
+        self._http_server = None
+        self._dump_stop = threading.Event()
+        self._dump_thread = None
+        self._dump_path = None
+
+    def _get(self, kind, name, help_text, labels, factory):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if key not in self._metrics:
+                self._metrics[key] = factory()
+                self._help.setdefault(name, (kind, help_text))
+            return self._metrics[key]
+
+    def counter(self, name, help_text="", **labels):
+        return self._get("counter", name, help_text, labels, Counter)
+
+    def histogram(self, name, help_text="", buckets=LATENCY_BUCKETS, **labels):
+        return self._get("histogram", name, help_text, labels, lambda: Histogram(buckets))
+
+    def render_prometheus(self):
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            items = sorted(self._metrics.items())
+        lines = []
+        last_name = None
+        for (name, labels), metric in items:
+            if name != last_name:
+                kind, help_text = self._help[name]
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                last_name = name
+            lines.extend(metric.render(name, labels))
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """All metrics as a JSON-serializable dict, keyed by name and label string."""
+        with self._lock:
+            items = sorted(self._metrics.items())
+        return {f"{name}{_format_labels(labels)}": metric.snapshot() for (name, labels), metric in items}
+
+    def start_http_server(self, host, port):
+        """Serve /metrics from a daemon thread."""
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render_prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass  # Keep scrapes out of the console
+
+        self._http_server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=self._http_server.serve_forever, name="metrics-http", daemon=True).start()
+        print(f"Metrics served at http://{host}:{port}/metrics")
+
+    def start_json_dump(self, path, interval):
+        """Rewrite `path` with a snapshot every `interval` seconds. Counters also get a per-second rate."""
+        self._dump_path = path
+
+        def run():
+            last_values = {}
+            last_time = time.monotonic()
+            while not self._dump_stop.wait(interval):
+                now = time.monotonic()
+                stats = self.snapshot()
+                for key, values in stats.items():
+                    if "value" in values:
+                        values["per_second"] = (values["value"] - last_values.get(key, 0)) / (now - last_time)
+                        last_values[key] = values["value"]
+                last_time = now
+                self._write_json(path, stats)
+
+        self._dump_thread = threading.Thread(target=run, name="metrics-json", daemon=True)
+        self._dump_thread.start()
+
+    def _write_json(self, path, stats):
+        # Write then rename so readers never see a half-written file
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"time": time.time(), "metrics": stats}, f, indent=2)
+        os.replace(tmp_path, path)
+
+    def stop(self):
+        if self._http_server is not None:
+            self._http_server.shutdown()
+            self._http_server.server_close()
+        if self._dump_thread is not None:
+            self._dump_stop.set()
+            self._dump_thread.join()
+            # Final snapshot so the file reflects the whole session
+            self._write_json(self._dump_path, self.snapshot())
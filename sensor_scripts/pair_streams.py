@@ -0,0 +1,70 @@
+"""
+    Pair camera frames with EM samples after a streaming capture session (server.py SERVER_MODE = "stream").
+    Both stream logs already hold timestamps on the server clock, so each frame is
+    matched to the EM sample nearest in time, up to MAX_PAIR_GAP seconds away.
+    With several cameras or EM sensors, every camera stream is paired with every EM stream.
+"""
+
+import bisect
+import csv
+
+CAMERA_STREAM_FILE = "camera_stream.csv"
+EM_STREAM_FILE = "em_stream.csv"
+OUTPUT_FILE = "paired_data.csv"
+MAX_PAIR_GAP = 0.05  # Seconds; frames with no EM sample this close are dropped
+
+
+def load_stream(path, timestamp_column):
+    """Read a stream log and return {stream_id: rows sorted by the given timestamp column}."""
+    with open(path, newline="") as f:
+        rows = list(csv.DictReader(f))
+    streams = {}
+    for row in rows:
+        row[timestamp_column] = float(row[timestamp_column])
+        streams.setdefault(row.get("StreamID", "0"), []).append(row)
+    for stream_rows in streams.values():
+        stream_rows.sort(key=lambda row: row[timestamp_column])
+    return streams
+
+
+def pair_streams(camera_rows, em_rows, max_gap=MAX_PAIR_GAP):
+    """Yield (camera_row, em_row, gap) for every frame with an EM sample within max_gap seconds."""
+    em_times = [row["EMTimestamp"] for row in em_rows]
+    for cam_row in camera_rows:
+        t_cam = cam_row["CameraTimestamp"]
+        i = bisect.bisect_left(em_times, t_cam)
+        # The nearest sample is either the first one at/after t_cam or the one before it.
+        candidates = [j for j in (i - 1, i) if 0 <= j < len(em_times)]
+        if not candidates:
+            continue
+        best = min(candidates, key=lambda j: abs(em_times[j] - t_cam))
+        gap = em_times[best] - t_cam
+        if abs(gap) <= max_gap:
+            yield cam_row, em_rows[best], gap
+
+
+def main():
+    camera_streams = load_stream(CAMERA_STREAM_FILE, "CameraTimestamp")
+    em_streams = load_stream(EM_STREAM_FILE, "EMTimestamp")
+
+    with open(OUTPUT_FILE, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["CameraTimestamp", "CameraData", "EMTimestamp", "EMData", "TimeGap", "CameraStream", "EMStream"])
+        for cam_stream, camera_rows in camera_streams.items():
+            for em_stream, em_rows in em_streams.items():
+                paired = 0
+                for cam_row, em_row, gap in pair_streams(camera_rows, em_rows):
+                    cam_data = f"{cam_row['DepthFile']}, {cam_row['ColorFile']}"
+                    writer.writerow([
+                        cam_row["CameraTimestamp"], cam_data, em_row["EMTimestamp"], em_row["EMData"], gap,
+                        cam_stream, em_stream,
+                    ])
+                    paired += 1
+                print(f"Camera {cam_stream} / EM {em_stream}: paired {paired} of {len(camera_rows)} frames "
+                      f"with {len(em_rows)} EM samples")
+
+    print(f"Wrote {OUTPUT_FILE}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+    Fixed-size, time-indexed buffer of recent EM samples.
+
+    Samples are stored in one preallocated NumPy array as
+        timestamp, x, y, z, qw, qx, qy, qz
+    where the quaternion comes from the tracker's azimuth/elevation/roll (intrinsic ZYX, degrees).
+    pose_at(t) finds the two samples bracketing t by binary search and interpolates
+    position linearly and orientation with SLERP.
+"""
+
+import numpy as np
+
+RING_CAPACITY = 4096  # Samples kept, about 40 s at 100 Hz
+
+
+def euler_to_quaternion(azimuth, elevation, roll):
+    """Intrinsic ZYX Euler angles in degrees to a unit quaternion (w, x, y, z)."""
+    a, e, r = np.radians([azimuth, elevation, roll]) / 2
+    ca, sa = np.cos(a), np.sin(a)
+    ce, se = np.cos(e), np.sin(e)
+    cr, sr = np.cos(r), np.sin(r)
+    return np.array([
+        cr * ce * ca + sr * se * sa,
+        sr * ce * ca - cr * se * sa,
+        cr * se * ca + sr * ce * sa,
+        cr * ce * sa - sr * se * ca,
+    ])
+
+
+def quaternion_to_euler(q):
+    """Unit quaternion (w, x, y, z) to intrinsic ZYX Euler angles (azimuth, elevation, roll) in degrees."""
+    w, x, y, z = q
+    azimuth = np.arctan2(2 * (w * z + x * y), 1 - 2 * (y * y + z * z))
+    elevation = np.arcsin(np.clip(2 * (w * y - z * x), -1.0, 1.0))
+    roll = np.arctan2(2 * (w * x + y * z), 1 - 2 * (x * x + y * y))
+    return tuple(np.degrees([azimuth, elevation, roll]).tolist())
+
+
+def slerp(q0, q1, fraction):
+    """Spherical linear interpolation between unit quaternions, along the shorter arc."""
+    dot = np.dot(q0, q1)
+    if dot < 0:
+        q1, dot = -q1, -dot
+    if dot > 0.9995:
+        # Nearly identical orientations, fall back to normalized linear interpolation.
+        q = q0 + fraction * (q1 - q0)
+        return q / np.linalg.norm(q)
+    theta = np.arccos(dot)
+    return (np.sin((1 - fraction) * theta) * q0 + np.sin(fraction * theta) * q1) / np.sin(theta)
+
+
+class PoseRingBuffer:
+    def __init__(self, capacity=RING_CAPACITY):
+        self.capacity = capacity
+        self._data = np.zeros((capacity, 8))
+        self._count = 0
+        self._next = 0  # Physical row the next sample goes into
+
+    def __len__(self):
+        return self._count
+
+    def append(self, timestamp, x, y, z, azimuth, elevation, roll):
+        """Add a sample, overwriting the oldest once full. Samples older than the newest one are dropped."""
+        if self._count and timestamp <= self.newest_time:
+            return False
+        self._data[self._next, 0] = timestamp
+        self._data[self._next, 1:4] = (x, y, z)
+        self._data[self._next, 4:8] = euler_to_quaternion(azimuth, elevation, roll)
+        self._next = (self._next + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+        return True
+
+    @property
+    def oldest_time(self):
+        return self._data[self._physical(0), 0] if self._count else None
+
+    @property
+    def newest_time(self):
+        return self._data[self._physical(self._count - 1), 0] if self._count else None
+
+    def _physical(self, i):
+        """Physical row of the i-th oldest sample."""
+        return (self._next - self._count + i) % self.capacity
+
+    def _search(self, t):
+        """Number of samples with timestamp <= t, found by binary search over the (at most two) sorted segments."""
+        start = self._physical(0)
+        if start + self._count <= self.capacity:
+            return int(np.searchsorted(self._data[start:start + self._count, 0], t, side="right"))
+        older = self._data[start:, 0]
+        if t < older[-1]:
+            return int(np.searchsorted(older, t, side="right"))
+        return len(older) + int(np.searchsorted(self._data[:self._next, 0], t, side="right"))
+
+    def pose_at(self, t):
+        """
+        Interpolated pose at time t as (x, y, z, qw, qx, qy, qz).
+        Returns None if t lies outside the buffered time range.
+        """
+        if not self._count or t < self.oldest_time or t > self.newest_time:
+            return None
+        i = self._search(t)
+        if i == self._count:
+            return tuple(self._data[self._physical(i - 1), 1:8].tolist())
+        before = self._data[self._physical(i - 1)]
+        after = self._data[self._physical(i)]
+        fraction = (t - before[0]) / (after[0] - before[0])
+        position = before[1:4] + fraction * (after[1:4] - before[1:4])
+        orientation = slerp(before[4:8], after[4:8], fraction)
+        return tuple(position.tolist()) + tuple(orientation.tolist())
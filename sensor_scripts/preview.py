@@ -0,0 +1,72 @@
+"""
+    Live preview of captured frames, drawn on its own thread.
+
+    The capture loop only hands over its newest frame, which replaces any frame
+    the preview has not drawn yet. The preview thread colorizes and shows it at
+    a reduced rate, so GUI and colormap work never runs on the capture thread.
+    Pressing 'q' in a preview window sets quit_requested. An optional overlay
+    callable supplies status lines, such as capture telemetry, drawn over the
+    color image.
+"""
+
+import threading
+
+import cv2
+
+from scheduler import DeadlineScheduler
+
+PREVIEW_FPS = 10  # Redraws per second; capture runs at 15-30 fps
+
+
+def colorize_depth(depth_image):
+    return cv2.applyColorMap(cv2.convertScaleAbs(depth_image, alpha=0.03), cv2.COLORMAP_JET)
+
+
+def draw_overlay(image, lines):
+    """A copy of image with the text lines drawn in its top-left corner; the original may still be being saved."""
+    image = image.copy()
+    for i, line in enumerate(lines):
+        y = 20 + 20 * i
+        cv2.putText(image, line, (10, y), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 3, cv2.LINE_AA)
+        cv2.putText(image, line, (10, y), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1, cv2.LINE_AA)
+    return image
+
+
+class FramePreview(threading.Thread):
+    def __init__(self, fps=PREVIEW_FPS, overlay=None):
+        super().__init__(name="frame-preview", daemon=True)
+        self.fps = fps
+        self.overlay = overlay
+        self.quit_requested = threading.Event()
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+        self._latest = None
+        self.frames_offered = 0
+        self.frames_shown = 0
+        self.start()
+
+    def show(self, depth_image, color_image):
+        """Offer the newest frame. Cheap enough to call on every captured frame; never blocks on the GUI."""
+        with self._lock:
+            self._latest = (depth_image, color_image)
+            self.frames_offered += 1
+
+    def run(self):
+        scheduler = DeadlineScheduler(self.fps)
+        while not self._stop_event.is_set():
+            scheduler.wait()
+            with self._lock:
+                frame, self._latest = self._latest, None
+            if frame is not None:
+                depth_image, color_image = frame
+                cv2.imshow("Depth", colorize_depth(depth_image))
+                cv2.imshow("Color", draw_overlay(color_image, self.overlay()) if self.overlay else color_image)
+                self.frames_shown += 1
+            # waitKey also pumps the window events, so call it even without a new frame
+            if cv2.waitKey(1) & 0xFF == ord('q'):
+                self.quit_requested.set()
+        cv2.destroyAllWindows()
+
+    def close(self):
+        self._stop_event.set()
+        self.join()
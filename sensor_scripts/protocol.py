@@ -0,0 +1,201 @@
+"""
+    Binary wire protocol shared by server.py and the sensor clients.
+
+    Every message is a fixed 8-byte header followed by the payload:
+        magic (2 bytes) | version (uint8) | message type (uint8) | payload length (uint32)
+    Timestamps and pose values are packed as big-endian float64.
+"""
+
+import select
+import struct
+
+import numpy as np
+
+MAGIC = b"MP"
+VERSION = 2
+BUFFER_SIZE = 4096
+HEADER = struct.Struct("!2sBBI")
+MAX_PAYLOAD = 64 * 1024 * 1024  # Anything bigger means the stream is out of sync
+
+# Message types
+MSG_HELLO = 1           # Client -> server handshake, payload is the client type ("RealSense", "EMTracker")
+MSG_REQUEST_CAMERA = 2  # Server -> camera client, no payload
+MSG_REQUEST_EM = 3      # Server -> EM client, no payload
+MSG_CAMERA_DATA = 4     # Camera client -> server, see pack_camera_data()
+MSG_EM_DATA = 5         # EM client -> server, see pack_em_data(); an empty payload means no sample yet
+MSG_TIME_PROBE = 6      # Server -> any client, payload is a uint32 probe id
+MSG_TIME_REPLY = 7      # Client -> server, see pack_time_reply()
+MSG_START_STREAM = 8    # Server -> any client, switch to pushing samples at the native rate
+MSG_REQUEST_EM_BATCH = 9  # Server -> EM client, no payload; asks for every sample taken since the last batch
+MSG_EM_BATCH = 10       # EM client -> server, see pack_em_batch()
+
+CAMERA_DATA = struct.Struct("!dId")  # timestamp, frame index, frame age (followed by the file paths)
+TIMESTAMP = struct.Struct("!d")
+PROBE_ID = struct.Struct("!I")
+TIME_REPLY = struct.Struct("!Id")  # echoed probe id, client clock at reply
+EM_BATCH = struct.Struct("!IHI")  # sample count, values per sample, samples lost before this batch
+
+
+class ProtocolError(Exception):
+    """Raised when the byte stream does not contain a valid message."""
+
+
+def encode_message(msg_type, payload=b""):
+    """Prefix the payload with the message header."""
+    return HEADER.pack(MAGIC, VERSION, msg_type, len(payload)) + payload
+
+
+def send_message(sock, msg_type, payload=b""):
+    """Send one complete message, header and payload together."""
+    sock.sendall(encode_message(msg_type, payload))
+
+
+class MessageReader:
+    """
+    Reassembles messages from a TCP byte stream.
+    A single recv() may hold part of a message or several messages at once, so
+    incoming bytes are buffered and only complete messages are handed out.
+    """
+
+    def __init__(self, sock=None):
+        self.sock = sock
+        self._buffer = bytearray()
+
+    def feed(self, data):
+        """Add bytes received from the socket to the buffer."""
+        self._buffer.extend(data)
+
+    def next_message(self):
+        """Return the next complete (msg_type, payload) from the buffer, or None if incomplete."""
+        if len(self._buffer) < HEADER.size:
+            return None
+        magic, version, msg_type, length = HEADER.unpack_from(self._buffer)
+        if magic != MAGIC or version != VERSION:
+            raise ProtocolError(f"Bad header: magic={magic!r}, version={version}")
+        if length > MAX_PAYLOAD:
+            raise ProtocolError(f"Payload length {length} exceeds limit")
+        end = HEADER.size + length
+        if len(self._buffer) < end:
+            return None
+        payload = bytes(self._buffer[HEADER.size:end])
+        del self._buffer[:end]
+        return msg_type, payload
+
+    def read_message(self):
+        """Block until a complete message arrives. Returns None if the peer closed the connection."""
+        while True:
+            message = self.next_message()
+            if message is not None:
+                return message
+            data = self.sock.recv(BUFFER_SIZE)
+            if not data:
+                return None
+            self.feed(data)
+
+    def poll_messages(self, timeout=0.0):
+        """
+        Return every complete message available after waiting at most `timeout` seconds for data.
+        Returns None if the peer closed the connection.
+        """
+        readable, _, _ = select.select([self.sock], [], [], timeout)
+        if readable:
+            data = self.sock.recv(BUFFER_SIZE)
+            if not data:
+                return None
+            self.feed(data)
+        messages = []
+        while (message := self.next_message()) is not None:
+            messages.append(message)
+        return messages
+
+    async def read_message_async(self, loop):
+        """Same as read_message(), for a non-blocking socket driven by an asyncio loop."""
+        while True:
+            message = self.next_message()
+            if message is not None:
+                return message
+            data = await loop.sock_recv(self.sock, BUFFER_SIZE)
+            if not data:
+                return None
+            self.feed(data)
+
+
+def pack_text(text):
+    return text.encode("utf-8")
+
+
+def unpack_text(payload):
+    return payload.decode("utf-8")
+
+
+def pack_camera_data(timestamp, frame_index, depth_path, color_path, frame_age=0.0):
+    """
+    Timestamp, frame index and frame age as binary, followed by the two file paths separated by a newline.
+    frame_age is how many seconds old the frame was when it was sent. Empty paths mean the frame
+    was dropped and will not be saved.
+    """
+    paths = f"{depth_path}\n{color_path}".encode("utf-8")
+    return CAMERA_DATA.pack(timestamp, frame_index, frame_age) + paths
+
+
+def unpack_camera_data(payload):
+    """Return (timestamp, frame_index, depth_path, color_path, frame_age)."""
+    if len(payload) < CAMERA_DATA.size:
+        raise ProtocolError(f"Camera payload has invalid length {len(payload)}")
+    timestamp, frame_index, frame_age = CAMERA_DATA.unpack_from(payload)
+    try:
+        depth_path, color_path = payload[CAMERA_DATA.size:].decode("utf-8").split("\n", 1)
+    except ValueError as e:  # Undecodable bytes or no separator
+        raise ProtocolError(f"Camera payload has invalid file paths: {e}") from e
+    return timestamp, frame_index, depth_path, color_path, frame_age
+
+
+def pack_em_data(timestamp, values):
+    """Timestamp followed by any number of pose values, all float64."""
+    return struct.pack(f"!d{len(values)}d", timestamp, *values)
+
+
+def unpack_em_data(payload):
+    """Return (timestamp, values) where values is a tuple of floats."""
+    if len(payload) < TIMESTAMP.size or len(payload) % 8:
+        raise ProtocolError(f"EM payload has invalid length {len(payload)}")
+    count = len(payload) // 8 - 1
+    timestamp, *values = struct.unpack(f"!d{count}d", payload)
+    return timestamp, tuple(values)
+
+
+def pack_em_batch(samples, lost=0):
+    """
+    Any number of EM samples in one message. samples is an (n, 1 + values) array of rows
+    (timestamp, values...); lost counts samples the sender no longer had to include.
+    """
+    samples = np.asarray(samples, dtype=np.float64)
+    if samples.ndim != 2 or samples.shape[1] < 1:
+        raise ValueError(f"EM batch must be a 2-D array of rows, got shape {samples.shape}")
+    return EM_BATCH.pack(len(samples), samples.shape[1] - 1, lost) + samples.astype(">f8").tobytes()
+
+
+def unpack_em_batch(payload):
+    """Return (samples, lost) where samples is an (n, 1 + values) float64 array of (timestamp, values...) rows."""
+    if len(payload) < EM_BATCH.size:
+        raise ProtocolError(f"EM batch payload has invalid length {len(payload)}")
+    count, values, lost = EM_BATCH.unpack_from(payload)
+    if len(payload) != EM_BATCH.size + count * (values + 1) * 8:
+        raise ProtocolError(f"EM batch of {count} samples has invalid length {len(payload)}")
+    samples = np.frombuffer(payload, dtype=">f8", offset=EM_BATCH.size).reshape(count, values + 1)
+    return samples.astype(np.float64), lost
+
+
+def pack_time_reply(probe_payload, client_ts):
+    """Echo the probe id back with the client's current clock reading."""
+    if len(probe_payload) != PROBE_ID.size:
+        raise ProtocolError(f"Time probe payload has invalid length {len(probe_payload)}")
+    probe_id, = PROBE_ID.unpack(probe_payload)
+    return TIME_REPLY.pack(probe_id, client_ts)
+
+
+def unpack_time_reply(payload):
+    """Return (probe_id, client_ts)."""
+    if len(payload) != TIME_REPLY.size:
+        raise ProtocolError(f"Time reply payload has invalid length {len(payload)}")
+    return TIME_REPLY.unpack(payload)
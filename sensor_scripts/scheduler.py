@@ -0,0 +1,78 @@
+"""
+    Fixed-rate loop timing on monotonic deadlines.
+
+    Deadlines are laid on a fixed grid (start + k * period), so time spent doing
+    work in a cycle does not push later cycles back. When a cycle overruns its
+    slot, the missed slots are skipped and counted instead of being run back to
+    back to catch up.
+"""
+
+import asyncio
+import time
+from collections import deque
+
+STATS_WINDOW = 500  # Recent cycles used for the rate and jitter statistics
+
+
+class DeadlineScheduler:
+    def __init__(self, rate_hz, stats_window=STATS_WINDOW):
+        self.rate_hz = rate_hz
+        self.period = 1.0 / rate_hz
+        self.cycles = 0
+        self.overruns = 0   # Cycles whose work ran past the next deadline
+        self.skipped = 0    # Deadlines dropped because of overruns
+        self._deadline = None
+        self._wakeups = deque(maxlen=stats_window)   # Monotonic wake-up times
+        self._lateness = deque(maxlen=stats_window)  # Seconds woken after the deadline
+
+    def _next_delay(self):
+        """Advance to the next deadline on the grid and return how long to sleep until it."""
+        now = time.monotonic()
+        if self._deadline is None:
+            self._deadline = now
+            return 0.0
+        self._deadline += self.period
+        if self._deadline < now:
+            missed = int((now - self._deadline) // self.period) + 1
+            self._deadline += missed * self.period
+            self.overruns += 1
+            self.skipped += missed
+        return self._deadline - now
+
+    def _record_wakeup(self):
+        now = time.monotonic()
+        self.cycles += 1
+        self._wakeups.append(now)
+        self._lateness.append(now - self._deadline)
+
+    def wait(self):
+        """Block until the next deadline. The first call returns immediately."""
+        delay = self._next_delay()
+        if delay > 0:
+            time.sleep(delay)
+        self._record_wakeup()
+
+    async def wait_async(self):
+        """Same as wait(), for use inside an asyncio loop."""
+        delay = self._next_delay()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        self._record_wakeup()
+
+    def achieved_rate(self):
+        """Cycles per second over the recent window."""
+        if len(self._wakeups) < 2:
+            return 0.0
+        return (len(self._wakeups) - 1) / (self._wakeups[-1] - self._wakeups[0])
+
+    def jitter(self):
+        """Mean and maximum wake-up lateness over the recent window, in seconds."""
+        if not self._lateness:
+            return 0.0, 0.0
+        return sum(self._lateness) / len(self._lateness), max(self._lateness)
+
+    def summary(self):
+        mean_late, max_late = self.jitter()
+        return (f"target {self.rate_hz:.1f} Hz, achieved {self.achieved_rate():.2f} Hz, "
+                f"jitter mean {mean_late * 1000:.2f} ms / max {max_late * 1000:.2f} ms, "
+                f"{self.overruns} overruns, {self.skipped} skipped deadlines")
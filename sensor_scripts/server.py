@@ -2,144 +2,674 @@
     Run this on the same computer as the camera client. 
 """
 
+import argparse
+import asyncio
+import selectors
 import socket
 import time
-import csv
 import threading
+from collections import deque
+
+import protocol
+from clock_sync import ClockSync, StreamingProber, probe_burst, probe_burst_async
+from data_logger import BackgroundCSVWriter
+from metrics import MetricsRegistry
+from pose_buffer import PoseRingBuffer, quaternion_to_euler
+from scheduler import DeadlineScheduler
+from protocol import MessageReader, ProtocolError
 
 HOST = "206.87.234.104"
 PORT = 4999
-LOG_FILE = "synchronized_data.csv"
-CYCLE_INTERVAL = 0.1  # Delay between cycles (adjust as needed)
-BUFFER_SIZE = 4096
+LOG_FILE = "synchronized_data.csv"  # EMInterpolated is 1 where the pose is interpolated at the frame time, 0 where it is the newest sample
+CYCLE_RATE_HZ = 10  # Target sync cycles per second; overruns skip a slot instead of drifting
+SCHEDULE_REPORT_INTERVAL = 10.0  # Seconds between achieved rate / jitter reports
+LOG_FLUSH_ROWS = 50  # Rows buffered before the background writer flushes to disk
+LOG_FLUSH_INTERVAL = 1.0  # Maximum seconds a row waits before being flushed
+CLOCK_SYNC_INTERVAL = 5.0  # Seconds between clock probe bursts to each client
+REQUEST_TIMEOUT = 2.0  # Seconds a client has to answer a request or probe before it is dropped
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9464  # Prometheus scrape endpoint at /metrics; None to disable
+METRICS_JSON_FILE = "server_stats.json"  # Periodic JSON stats dump; None to disable
+METRICS_DUMP_INTERVAL = 10.0  # Seconds between JSON stats dumps
+# "lockstep": request camera then EM data each cycle
+# "async":    request camera and EM data concurrently each cycle
+# "stream":   clients push samples at their native rate, pair afterwards with pair_streams.py
+SERVER_MODE = "async"
+EM_BATCH = False  # Lockstep/async: ask EM clients for every sample since the last cycle, not just the newest
+EM_SAMPLES_LOG_FILE = "em_samples.csv"  # With EM_BATCH, every EM sample received, in the em_stream.csv format
+STREAM_LOG_FILES = {"RealSense": "camera_stream.csv", "EMTracker": "em_stream.csv"}
+STREAM_LOG_HEADERS = {
+    "RealSense": ["ServerReceiveTimestamp", "CameraTimestamp", "FrameIndex", "DepthFile", "ColorFile", "StreamID"],
+    "EMTracker": ["ServerReceiveTimestamp", "EMTimestamp", "EMData", "StreamID"],
+}
+INTERPOLATED_LOG_FILE = "interpolated_data.csv"  # Stream mode: each frame with the EM pose at its timestamp
+MAX_PENDING_FRAMES = 300  # Stream mode: frames held per EM stream while it is silent, about 10 s at 30 fps
+INTERPOLATED_LOG_HEADER = [
+    "CameraTimestamp", "FrameIndex", "DepthFile", "ColorFile",
+    "x", "y", "z", "azimuth", "elevation", "roll", "CameraStream", "EMStream",
+]
+
+CLIENT_TYPES = ("RealSense", "EMTracker")
+
+class Client:
+    """
+    A connected sensor client. The handshake names its type and, optionally, a
+    stream ID ("RealSense:1", "EMTracker:2"); clients without one get stream "0".
+    """
+    def __init__(self, sock, addr, client_type, stream_id, reader):
+        self.sock = sock
+        self.addr = addr
+        self.client_type = client_type
+        self.stream_id = stream_id
+        self.name = f"{client_type}:{stream_id}"
+        self.reader = reader
+        self.sync = ClockSync(self.name)
+        self.prober = StreamingProber(self.sync)
 
-# Global storage for the connected clients
-clients = {"RealSense": None, "EMTracker": None}
+# Global storage for the connected clients, keyed by Client.name
+clients = {}
 clients_lock = threading.Lock()
+metrics = MetricsRegistry()
+cycle_time = metrics.histogram("capture_cycle_seconds", "End-to-end duration of one sync cycle")
+rows_logged = metrics.counter("capture_rows_logged_total", "Synchronized or interpolated rows queued for logging")
+log_flush_time = metrics.histogram("capture_log_flush_seconds", "Time the background writer spent writing one batch")
+em_samples_writer = None
+pose_buffers = {}  # Per EM stream, recent samples for interpolating the pose at each frame time
+pending_frames = {}  # Stream mode: per EM stream, frames newer than its latest sample, waiting to be interpolated
+data_writer = None
 
 def log_header():
-    """Initialize CSV file with header."""
-    with open(LOG_FILE, "w", newline="") as f:
-        writer = csv.writer(f)
-        writer.writerow([
+    """Initialize CSV file with header and start the background writer."""
+    global data_writer, em_samples_writer
+    data_writer = BackgroundCSVWriter(
+        LOG_FILE,
+        header=[
             "ServerCycleTimestamp", "CameraTimestamp", "CameraData",
-            "EMTimestampCorrected", "EMData", "RTT_Delay"
-        ])
+            "EMTimestampCorrected", "EMData", "RTT_Delay",
+            "CameraStream", "EMStream", "EMInterpolated"
+        ],
+        batch_size=LOG_FLUSH_ROWS,
+        flush_interval=LOG_FLUSH_INTERVAL,
+        flush_observer=log_flush_time.observe,
+    )
+    if EM_BATCH:
+        em_samples_writer = BackgroundCSVWriter(
+            EM_SAMPLES_LOG_FILE, header=STREAM_LOG_HEADERS["EMTracker"],
+            batch_size=LOG_FLUSH_ROWS, flush_interval=LOG_FLUSH_INTERVAL,
+            flush_observer=log_flush_time.observe,
+        )
+
+def log_data(server_ts, cam_ts, cam_data, em_ts_corr, em_data, delay, cam_stream, em_stream, em_interpolated):
+    """Queue a synchronized data row for the background writer."""
+    data_writer.write_row([server_ts, cam_ts, cam_data, em_ts_corr, em_data, delay, cam_stream, em_stream,
+                           int(em_interpolated)])
+    rows_logged.inc()
+
+def close_log():
+    """Drain any queued rows to disk and close the CSV file."""
+    if data_writer is not None:
+        data_writer.close()
+        print(f"Wrote {data_writer.rows_written} rows to {LOG_FILE}")
+    if em_samples_writer is not None:
+        em_samples_writer.close()
+        print(f"Wrote {em_samples_writer.rows_written} rows to {EM_SAMPLES_LOG_FILE}")
+
+def camera_request_time(client):
+    return metrics.histogram("capture_camera_request_seconds", "Camera request to response latency", client=client.name)
+
+def camera_frame_age(client):
+    return metrics.histogram("capture_camera_frame_age_seconds", "Age of the frame a camera replied with",
+                             client=client.name)
 
-def log_data(server_ts, cam_ts, cam_data, em_ts_corr, em_data, delay):
-    """Append a synchronized data row to the CSV file."""
-    with open(LOG_FILE, "a", newline="") as f:
-        writer = csv.writer(f)
-        writer.writerow([server_ts, cam_ts, cam_data, em_ts_corr, em_data, delay])
-    print(f"Logged row at {server_ts}")
+def em_rtt_time(client):
+    return metrics.histogram("capture_em_rtt_seconds", "EM request round-trip time", client=client.name)
 
-def accept_clients(server_sock):
+def samples_received(client):
+    return metrics.counter("capture_stream_samples_total", "Samples pushed by a streaming client", client=client.name)
+
+def em_samples_lost(client):
+    return metrics.counter("capture_em_samples_lost_total", "EM samples overwritten on the client before being sent",
+                           client=client.name)
+
+def start_metrics():
+    if METRICS_PORT is not None:
+        metrics.start_http_server(METRICS_HOST, METRICS_PORT)
+    if METRICS_JSON_FILE is not None:
+        metrics.start_json_dump(METRICS_JSON_FILE, METRICS_DUMP_INTERVAL)
+
+def parse_handshake(text):
+    """Split "<type>[:<stream id>]" into (client_type, stream_id)."""
+    client_type, _, stream_id = text.strip().partition(":")
+    return client_type, stream_id or "0"
+
+def register_client(sock, addr, reader, handshake):
+    """Add a client that completed its handshake, unless its type is unknown or its name is taken."""
+    client_type, stream_id = parse_handshake(protocol.unpack_text(handshake))
+    with clients_lock:
+        name = f"{client_type}:{stream_id}"
+        if client_type not in CLIENT_TYPES or name in clients:
+            print(f"Unknown or duplicate client '{name}' from {addr}")
+            sock.close()
+            return
+        sock.settimeout(REQUEST_TIMEOUT)  # A client that stops answering is dropped instead of stalling capture
+        clients[name] = Client(sock, addr, client_type, stream_id, reader)
+    print(f"{name} client connected from {addr}")
+
+def drop_client(client, reason):
+    """Remove a client that disconnected or misbehaved. Capture carries on with the others."""
+    with clients_lock:
+        if clients.get(client.name) is client:
+            del clients[client.name]
+    pose_buffers.pop(client.name, None)
+    pending_frames.pop(client.name, None)
+    try:
+        client.sock.close()
+    except OSError:
+        pass
+    print(f"{client.name} client removed: {reason}")
+
+def snapshot_clients(client_type=None):
+    """Clients connected right now, optionally only those of one type."""
+    with clients_lock:
+        return [c for c in clients.values() if client_type is None or c.client_type == client_type]
+
+def accept_clients(server_sock, stop_event):
     """
-    Accept incoming connections until both expected clients are connected.
+    Accept connections for the whole session on a selector, so any number of
+    clients can join at any time and a slow handshake does not hold up the others.
     Each client is identified by its initial handshake message.
     """
+    selector = selectors.DefaultSelector()
+    server_sock.setblocking(False)
+    selector.register(server_sock, selectors.EVENT_READ, None)
     print("Waiting for clients to connect...")
-    while True:
-        client_sock, addr = server_sock.accept()
-        print(f"Connection from {addr}")
-        # Read handshake message
-        try:
-            handshake = client_sock.recv(BUFFER_SIZE)
-            if not handshake:
-                client_sock.close()
-                continue
-            client_type = handshake.decode().strip()
-            with clients_lock:
-                if client_type in clients and clients[client_type] is None:
-                    clients[client_type] = client_sock
-                    print(f"{client_type} client connected from {addr}")
-                else:
-                    print(f"Unknown or duplicate client type '{client_type}' from {addr}")
+    try:
+        while not stop_event.is_set():
+            for key, _ in selector.select(timeout=0.2):
+                if key.data is None:
+                    client_sock, addr = server_sock.accept()
+                    client_sock.setblocking(False)
+                    print(f"Connection from {addr}")
+                    selector.register(client_sock, selectors.EVENT_READ, (addr, MessageReader(client_sock)))
+                    continue
+
+                client_sock = key.fileobj
+                addr, reader = key.data
+                try:
+                    data = client_sock.recv(protocol.BUFFER_SIZE)
+                    if not data:
+                        raise ConnectionError("closed before handshake")
+                    reader.feed(data)
+                    handshake = reader.next_message()
+                    if handshake is None:
+                        continue
+                    selector.unregister(client_sock)
+                    if handshake[0] != protocol.MSG_HELLO:
+                        print(f"Missing handshake from {addr}")
+                        client_sock.close()
+                        continue
+                    register_client(client_sock, addr, reader, handshake[1])
+                except (socket.error, ProtocolError, UnicodeDecodeError) as e:
+                    print(f"Error handling client from {addr}: {e}")
+                    if key.fileobj in selector.get_map():
+                        selector.unregister(client_sock)
                     client_sock.close()
-        except Exception as e:
-            print(f"Error handling client from {addr}: {e}")
-            client_sock.close()
+    finally:
+        for key in list(selector.get_map().values()):
+            if key.data is not None:
+                key.fileobj.close()
+        selector.close()
+
+def expect_message(message, msg_type):
+    """Return the payload of a response, raising if the client closed or replied with the wrong type."""
+    if message is None:
+        raise ConnectionError("Client closed the connection")
+    if message[0] != msg_type:
+        raise ProtocolError(f"Expected message type {msg_type}, got {message[0]}")
+    return message[1]
 
-        with clients_lock:
-            if clients["RealSense"] is not None and clients["EMTracker"] is not None:
-                print("Both clients connected.")
-                break
+def parse_camera_data(camera, payload):
+    """Return (t_cam, extra) where extra is the "depth_path, color_path" text logged to the CSV."""
+    t_cam, _, depth_path, color_path, frame_age = protocol.unpack_camera_data(payload)
+    camera_frame_age(camera).observe(frame_age)
+    return t_cam, f"{depth_path}, {color_path}"
+
+def format_em_values(values):
+    return ", ".join(str(v) for v in values)
+
+def buffer_em_sample(em, t_em, values):
+    """Add a sample, already on the server clock, to the EM stream's pose buffer."""
+    if len(values) >= 6:
+        pose_buffers.setdefault(em.name, PoseRingBuffer()).append(t_em, *values[:6])
+
+def parse_em_batch(em, payload, t_recv):
+    """
+    Log every sample of a batch to the EM samples log and the pose buffer, mapped onto the server clock.
+    Return (t_em_corrected, extra) of the newest sample, or None for an empty batch.
+    """
+    samples, lost = protocol.unpack_em_batch(payload)
+    samples_received(em).inc(len(samples))
+    if lost:
+        em_samples_lost(em).inc(lost)
+    if not len(samples):
+        return None
+    for row in samples:
+        t_em = em.sync.to_server_time(row[0])
+        em_samples_writer.write_row([t_recv, t_em, format_em_values(row[1:]), em.stream_id])
+        buffer_em_sample(em, t_em, row[1:])
+    return em.sync.to_server_time(samples[-1][0]), format_em_values(samples[-1][1:])
 
-def synchronized_cycle():
+def parse_em_reply(em, payload):
     """
-    For each cycle, request camera data first.
-    Then, measure round-trip time for the EM data request and adjust the EM timestamp.
-    Finally, log the synchronized data.
+    Return (t_em_corrected, extra) of a single-sample reply, adding the sample to the pose buffer,
+    or None if the client had no sample yet.
     """
-    camera_sock = clients["RealSense"]
-    em_sock = clients["EMTracker"]
+    if not payload:
+        return None
+    t_em, values = protocol.unpack_em_data(payload)
+    t_em = em.sync.to_server_time(t_em)
+    buffer_em_sample(em, t_em, values)
+    return t_em, format_em_values(values)
 
-    while True:
+def request_em_message():
+    return protocol.MSG_REQUEST_EM_BATCH if EM_BATCH else protocol.MSG_REQUEST_EM
+
+def report_clock_sync(client):
+    sync = client.sync
+    print(f"Clock sync {client.name}: offset={sync.offset * 1000:.3f} ms, drift={sync.drift * 1e6:.2f} ppm")
+
+def sync_clocks(clients_to_sync):
+    """Run one probe burst against each client and update its clock model. Clients that fail are dropped."""
+    for client in clients_to_sync:
         try:
-            # --- Camera Data Cycle ---
-            # Request camera data
-            camera_sock.send(b"RequestCameraData")
-            cam_response = camera_sock.recv(BUFFER_SIZE).decode().strip()
-            # Expecting a comma-separated message: "t_cam, <additional camera info>"
-            cam_parts = cam_response.split(",", 1)
-            if len(cam_parts) < 1:
-                print("Invalid camera data received.")
-                continue
-            t_cam = float(cam_parts[0].strip())
-            cam_extra = cam_parts[1].strip() if len(cam_parts) > 1 else ""
-            print(f"Received camera data: t_cam={t_cam}, extra='{cam_extra}'")
-
-            # --- EM Data Cycle with RTT measurement ---
-            t_req = time.time()  # Record time immediately before sending request
-            em_sock.send(b"RequestEMData")
-            em_response = em_sock.recv(BUFFER_SIZE).decode().strip()
-            t_resp = time.time()  # Record time immediately after reception
-
-            # Compute estimated one-way delay (RTT/2)
-            delay = (t_resp - t_req) / 2
-
-            # Expect EM client to return a comma-separated message: "t_EM, <additional EM info>"
-            em_parts = em_response.split(",", 1)
-            if len(em_parts) < 1:
-                print("Invalid EM data received.")
-                continue
-            t_em = float(em_parts[0].strip())
-            em_extra = em_parts[1].strip() if len(em_parts) > 1 else ""
-            t_em_corrected = t_em - delay
-            print(f"Received EM data: original t_em={t_em}, delay={delay:.4f}, corrected t_em={t_em_corrected:.4f}, extra='{em_extra}'")
+            client.sync.add_burst(probe_burst(client.sock, client.reader))
+            report_clock_sync(client)
+        except (socket.error, ProtocolError) as e:
+            drop_client(client, e)
+
+async def within_timeout(request):
+    """Await a request to one client, raising TimeoutError if it takes longer than REQUEST_TIMEOUT."""
+    try:
+        return await asyncio.wait_for(request, REQUEST_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise TimeoutError(f"No reply within {REQUEST_TIMEOUT} s") from None
+
+async def sync_clocks_async(loop, clients_to_sync):
+    """Same as sync_clocks(), probing all clients concurrently."""
+    bursts = await asyncio.gather(
+        *(within_timeout(probe_burst_async(loop, client.sock, client.reader)) for client in clients_to_sync),
+        return_exceptions=True,
+    )
+    for client, samples in zip(clients_to_sync, bursts):
+        if isinstance(samples, BaseException):
+            drop_client(client, samples)
+        else:
+            client.sync.add_burst(samples)
+            report_clock_sync(client)
+
+def clients_due_for_sync(current, last_sync):
+    """All clients if the sync interval has elapsed, otherwise only those that joined since the last sync."""
+    if last_sync is None or time.monotonic() - last_sync >= CLOCK_SYNC_INTERVAL:
+        return current, True
+    return [c for c in current if not c.sync.synced], False
+
+def pose_at_frame(em, t_cam):
+    """(t_cam, extra) with the EM stream's pose interpolated at the frame time, or None if its buffer does not cover it."""
+    buffer = pose_buffers.get(em.name)
+    pose = None if buffer is None else buffer.pose_at(t_cam)
+    if pose is None:
+        return None
+    return t_cam, format_em_values((*pose[:3], *quaternion_to_euler(pose[3:])))
 
-            # --- Collate and Log ---
-            server_ts = time.time()
-            log_data(server_ts, t_cam, cam_extra, t_em_corrected, em_extra, delay)
+def log_cycle(server_ts, camera_results, em_results):
+    """
+    Log one row per (camera, EM sensor) pair collected in this cycle. The EM pose is interpolated at
+    the frame's timestamp, so EMTimestampCorrected equals CameraTimestamp, whenever the pose buffer
+    has samples on both sides of it (always with --em-batch once running). Otherwise the newest sample is logged
+    with its own timestamp. EMInterpolated tells the two apart.
+    """
+    for camera, t_cam, cam_extra in camera_results:
+        for em, t_em_corrected, em_extra, delay in em_results:
+            interpolated = pose_at_frame(em, t_cam)
+            if interpolated is not None:
+                t_em_corrected, em_extra = interpolated
+            log_data(server_ts, t_cam, cam_extra, t_em_corrected, em_extra, delay, camera.stream_id, em.stream_id,
+                     interpolated is not None)
+
+def synchronized_cycle(stop_event):
+    """
+    For each cycle, request data from every camera first, then from every EM sensor.
+    Timestamps are mapped onto the server clock using each client's periodically
+    refreshed clock sync, rather than correcting each sample by its own RTT/2.
+    Finally, log the synchronized data. Clients may join or leave between cycles.
+    """
+    last_sync = None
+    scheduler = DeadlineScheduler(CYCLE_RATE_HZ)
+    last_report = time.monotonic()
+
+    while not stop_event.is_set():
+        scheduler.wait()
+        if time.monotonic() - last_report >= SCHEDULE_REPORT_INTERVAL:
+            print(f"Cycle timing: {scheduler.summary()}")
+            last_report = time.monotonic()
+
+        to_sync, full_sync = clients_due_for_sync(snapshot_clients(), last_sync)
+        sync_clocks(to_sync)
+        if full_sync:
+            last_sync = time.monotonic()
+
+        cycle_start = time.perf_counter()
+
+        # --- Camera Data Cycle ---
+        camera_results = []
+        for camera in snapshot_clients("RealSense"):
+            try:
+                with camera_request_time(camera).time():
+                    protocol.send_message(camera.sock, protocol.MSG_REQUEST_CAMERA)
+                    cam_payload = expect_message(camera.reader.read_message(), protocol.MSG_CAMERA_DATA)
+                t_cam, cam_extra = parse_camera_data(camera, cam_payload)
+                t_cam = camera.sync.to_server_time(t_cam)
+                camera_results.append((camera, t_cam, cam_extra))
+            except (socket.error, ValueError, ProtocolError) as e:
+                drop_client(camera, e)
+
+        # --- EM Data Cycle, RTT kept for diagnostics ---
+        em_results = []
+        for em in snapshot_clients("EMTracker"):
+            try:
+                t_req = time.time()  # Record time immediately before sending request
+                protocol.send_message(em.sock, request_em_message())
+                em_message = em.reader.read_message()
+                t_resp = time.time()  # Record time immediately after reception
 
-            time.sleep(CYCLE_INTERVAL)
+                # One-way delay estimate (RTT/2), logged only
+                em_rtt_time(em).observe(t_resp - t_req)
+                delay = (t_resp - t_req) / 2
 
-        except (socket.error, ValueError) as e:
-            print(f"Error during cycle: {e}")
-            break
+                if EM_BATCH:
+                    newest = parse_em_batch(em, expect_message(em_message, protocol.MSG_EM_BATCH), t_resp)
+                else:
+                    newest = parse_em_reply(em, expect_message(em_message, protocol.MSG_EM_DATA))
+                if newest is None:
+                    continue  # No new sample since the last cycle
+                t_em_corrected, em_extra = newest
+                em_results.append((em, t_em_corrected, em_extra, delay))
+            except (socket.error, ValueError, ProtocolError) as e:
+                drop_client(em, e)
+
+        # --- Collate and Log ---
+        log_cycle(time.time(), camera_results, em_results)
+        cycle_time.observe(time.perf_counter() - cycle_start)
+    print(f"Cycle timing: {scheduler.summary()}")
+
+async def request_camera(loop, camera):
+    """Request a frame from a camera client and return (camera, t_cam, extra)."""
+    with camera_request_time(camera).time():
+        await loop.sock_sendall(camera.sock, protocol.encode_message(protocol.MSG_REQUEST_CAMERA))
+        cam_message = await camera.reader.read_message_async(loop)
+    t_cam, cam_extra = parse_camera_data(camera, expect_message(cam_message, protocol.MSG_CAMERA_DATA))
+    return camera, camera.sync.to_server_time(t_cam), cam_extra
+
+async def request_em(loop, em):
+    """
+    Request a sample from an EM client and return (em, t_em_corrected, extra, delay),
+    or None when the client has no new sample.
+    The RTT is measured around this request only, so it is not inflated by the cameras.
+    """
+    t_req = time.time()
+    await loop.sock_sendall(em.sock, protocol.encode_message(request_em_message()))
+    em_message = await em.reader.read_message_async(loop)
+    t_resp = time.time()
+
+    em_rtt_time(em).observe(t_resp - t_req)
+    delay = (t_resp - t_req) / 2
+    if EM_BATCH:
+        newest = parse_em_batch(em, expect_message(em_message, protocol.MSG_EM_BATCH), t_resp)
+    else:
+        newest = parse_em_reply(em, expect_message(em_message, protocol.MSG_EM_DATA))
+    return None if newest is None else (em, *newest, delay)
+
+async def async_synchronized_cycle(stop_event):
+    """
+    Same cycle as synchronized_cycle(), but the requests to every client are sent
+    at the same time and awaited together, so each cycle only takes as long as
+    the slowest sensor instead of the sum of all of them.
+    """
+    loop = asyncio.get_running_loop()
+    last_sync = None
+    scheduler = DeadlineScheduler(CYCLE_RATE_HZ)
+    last_report = time.monotonic()
+
+    while not stop_event.is_set():
+        await scheduler.wait_async()
+        if time.monotonic() - last_report >= SCHEDULE_REPORT_INTERVAL:
+            print(f"Cycle timing: {scheduler.summary()}")
+            last_report = time.monotonic()
+
+        current = snapshot_clients()
+        for client in current:
+            client.sock.setblocking(False)
+        to_sync, full_sync = clients_due_for_sync(current, last_sync)
+        await sync_clocks_async(loop, to_sync)
+        if full_sync:
+            last_sync = time.monotonic()
+
+        cycle_start = time.perf_counter()
+        cameras = snapshot_clients("RealSense")
+        ems = snapshot_clients("EMTracker")
+        results = await asyncio.gather(
+            *(within_timeout(request_camera(loop, camera)) for camera in cameras),
+            *(within_timeout(request_em(loop, em)) for em in ems),
+            return_exceptions=True,
+        )
+        camera_results, em_results = [], []
+        for client, result in zip(cameras + ems, results):
+            if isinstance(result, BaseException):
+                drop_client(client, result)
+            elif client.client_type == "RealSense":
+                camera_results.append(result)
+            elif result is not None:
+                em_results.append(result)
+
+        # --- Collate and Log ---
+        log_cycle(time.time(), camera_results, em_results)
+        cycle_time.observe(time.perf_counter() - cycle_start)
+    print(f"Cycle timing: {scheduler.summary()}")
+
+def interpolate_pending_frames(em_name, writer):
+    """Write every pending frame whose timestamp is now covered by this EM stream's buffer, with its interpolated pose."""
+    buffer = pose_buffers[em_name]
+    pending = pending_frames[em_name]
+    em_stream = em_name.partition(":")[2]
+    if not len(buffer):
+        return
+    while pending and pending[0][0] <= buffer.newest_time:
+        t_cam, frame_index, depth_path, color_path, cam_stream = pending.popleft()
+        pose = buffer.pose_at(t_cam)
+        if pose is None:
+            # Frame is older than anything left in the buffer
+            continue
+        writer.write_row([
+            t_cam, frame_index, depth_path, color_path,
+            *pose[:3], *quaternion_to_euler(pose[3:]), cam_stream, em_stream,
+        ])
+        rows_logged.inc()
+
+def handle_stream_message(client, message, t_recv, writers):
+    """Write one pushed sample to its stream log, or feed a clock probe reply to the prober."""
+    msg_type, payload = message
+    sync = client.sync
+    if msg_type in (protocol.MSG_CAMERA_DATA, protocol.MSG_EM_DATA):
+        samples_received(client).inc()
+    elif msg_type == protocol.MSG_EM_BATCH:
+        samples, lost = protocol.unpack_em_batch(payload)
+        samples_received(client).inc(len(samples))
+        if lost:
+            em_samples_lost(client).inc(lost)
+    if msg_type == protocol.MSG_CAMERA_DATA:
+        t_cam, frame_index, depth_path, color_path, frame_age = protocol.unpack_camera_data(payload)
+        camera_frame_age(client).observe(frame_age)
+        t_cam = sync.to_server_time(t_cam)
+        writers[client.client_type].write_row([t_recv, t_cam, frame_index, depth_path, color_path, client.stream_id])
+        for em_name in pose_buffers:
+            pending_frames[em_name].append((t_cam, frame_index, depth_path, color_path, client.stream_id))
+            interpolate_pending_frames(em_name, writers["Interpolated"])
+    elif msg_type == protocol.MSG_EM_DATA:
+        t_em, values = protocol.unpack_em_data(payload)
+        t_em = sync.to_server_time(t_em)
+        writers[client.client_type].write_row([t_recv, t_em, format_em_values(values), client.stream_id])
+        buffer_em_sample(client, t_em, values)
+        interpolate_pending_frames(client.name, writers["Interpolated"])
+    elif msg_type == protocol.MSG_EM_BATCH:
+        for row in samples:
+            t_em = sync.to_server_time(row[0])
+            writers[client.client_type].write_row([t_recv, t_em, format_em_values(row[1:]), client.stream_id])
+            buffer_em_sample(client, t_em, row[1:])
+        if len(samples):
+            interpolate_pending_frames(client.name, writers["Interpolated"])
+    elif msg_type == protocol.MSG_TIME_REPLY:
+        if client.prober.handle_reply(client.sock, payload):
+            report_clock_sync(client)
+    else:
+        print(f"Unexpected message type {msg_type} from {client.name}")
+
+def start_streaming(client, selector):
+    """Sync a newly seen client's clock, switch it to streaming mode and start reading from it."""
+    client.sync.add_burst(probe_burst(client.sock, client.reader))
+    report_clock_sync(client)
+    if client.client_type == "EMTracker":
+        pose_buffers[client.name] = PoseRingBuffer()
+        # Oldest frames are dropped while the stream is silent; they can still be paired from camera_stream.csv
+        pending_frames[client.name] = deque(maxlen=MAX_PENDING_FRAMES)
+    protocol.send_message(client.sock, protocol.MSG_START_STREAM)
+    selector.register(client.sock, selectors.EVENT_READ, client)
+
+def stop_streaming(client, selector, reason):
+    if client.sock in selector.get_map():
+        selector.unregister(client.sock)
+    drop_client(client, reason)
+
+def stream_capture(stop_event):
+    """
+    Switch every client to streaming mode and log what they push, one CSV per client type.
+    No requests are sent, so each sensor runs at its own rate. Timestamps are mapped
+    onto the server clock as they arrive; frames and EM samples are paired afterwards.
+    Frames are also logged live with each EM stream's pose interpolated at their exact timestamp.
+    Clients that connect mid-session are picked up and switched to streaming as well.
+    """
+    writers = {
+        client_type: BackgroundCSVWriter(
+            STREAM_LOG_FILES[client_type], header=STREAM_LOG_HEADERS[client_type],
+            batch_size=LOG_FLUSH_ROWS, flush_interval=LOG_FLUSH_INTERVAL,
+            flush_observer=log_flush_time.observe,
+        )
+        for client_type in CLIENT_TYPES
+    }
+    writers["Interpolated"] = BackgroundCSVWriter(
+        INTERPOLATED_LOG_FILE, header=INTERPOLATED_LOG_HEADER,
+        batch_size=LOG_FLUSH_ROWS, flush_interval=LOG_FLUSH_INTERVAL,
+        flush_observer=log_flush_time.observe,
+    )
+    selector = selectors.DefaultSelector()
+    streaming = {}  # Client.name -> Client already switched to streaming
+    last_sync = time.monotonic()
+
+    try:
+        while not stop_event.is_set():
+            for client in snapshot_clients():
+                if client.name not in streaming:
+                    try:
+                        start_streaming(client, selector)
+                        streaming[client.name] = client
+                    except (socket.error, ProtocolError) as e:
+                        stop_streaming(client, selector, e)
+
+            if time.monotonic() - last_sync >= CLOCK_SYNC_INTERVAL:
+                for client in list(streaming.values()):
+                    try:
+                        if client.prober.active:
+                            # The whole interval went by without the burst completing
+                            raise TimeoutError(f"No clock probe reply within {CLOCK_SYNC_INTERVAL} s")
+                        client.prober.start(client.sock)
+                    except (socket.error, ProtocolError) as e:
+                        del streaming[client.name]
+                        stop_streaming(client, selector, e)
+                last_sync = time.monotonic()
+
+            if not streaming:
+                time.sleep(0.1)
+                continue
+
+            for key, _ in selector.select(timeout=0.1):
+                client = key.data
+                try:
+                    data = client.sock.recv(protocol.BUFFER_SIZE)
+                    t_recv = time.time()
+                    if not data:
+                        raise ConnectionError("Client closed the connection")
+                    client.reader.feed(data)
+                    while (message := client.reader.next_message()) is not None:
+                        handle_stream_message(client, message, t_recv, writers)
+                except (socket.error, ValueError, ProtocolError) as e:
+                    del streaming[client.name]
+                    stop_streaming(client, selector, e)
+    finally:
+        selector.close()
+        for writer in writers.values():
+            writer.close()
+            print(f"Wrote {writer.rows_written} rows to {writer.path}")
 
 def main():
-    log_header()
+    if SERVER_MODE != "stream":
+        log_header()
     server_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     server_sock.bind((HOST, PORT))
     server_sock.listen(5)
     print(f"Server listening on {HOST}:{PORT}")
+    start_metrics()
 
-    # Accept both clients
-    accept_clients(server_sock)
+    # Accept clients in the background for the whole session
+    stop_event = threading.Event()
+    accept_thread = threading.Thread(target=accept_clients, args=(server_sock, stop_event), daemon=True)
+    accept_thread.start()
 
     # Start synchronized cycle in the main thread.
     try:
-        synchronized_cycle()
+        if SERVER_MODE == "stream":
+            stream_capture(stop_event)
+        elif SERVER_MODE == "async":
+            asyncio.run(async_synchronized_cycle(stop_event))
+        else:
+            synchronized_cycle(stop_event)
     except KeyboardInterrupt:
         print("Server shutting down due to keyboard interrupt.")
     finally:
+        stop_event.set()
+        accept_thread.join()
         # Close all client sockets
-        with clients_lock:
-            for client_type, sock in clients.items():
-                if sock:
-                    sock.close()
+        for client in snapshot_clients():
+            client.sock.close()
         server_sock.close()
+        close_log()
+        metrics.stop()
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Synchronized capture server.")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--mode", choices=["lockstep", "async", "stream"], default=SERVER_MODE)
+    parser.add_argument("--rate", type=float, default=CYCLE_RATE_HZ, help="Target sync cycles per second")
+    parser.add_argument("--log-file", default=LOG_FILE)
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT, help="0 disables the /metrics endpoint")
+    parser.add_argument("--stats-file", default=METRICS_JSON_FILE)
+    parser.add_argument("--request-timeout", type=float, default=REQUEST_TIMEOUT,
+                        help="Seconds a client has to answer before it is dropped")
+    parser.add_argument("--em-batch", action="store_true",
+                        help="Collect every EM sample since the last cycle, logged to " + EM_SAMPLES_LOG_FILE)
+    args = parser.parse_args()
+    HOST, PORT, SERVER_MODE, CYCLE_RATE_HZ, LOG_FILE = args.host, args.port, args.mode, args.rate, args.log_file
+    METRICS_PORT = args.metrics_port or None
+    METRICS_JSON_FILE = args.stats_file
+    EM_BATCH = args.em_batch
+    REQUEST_TIMEOUT = args.request_timeout
     main()
@@ -0,0 +1,208 @@
+"""
+    Simulated sensor clients for testing the server without the physical rig.
+
+    Both simulators speak the same protocol as emtracker_client.py and camera_client.py:
+    they answer data requests (including the EM batch request) and clock probes, and switch
+    to pushing samples on MSG_START_STREAM.
+        python simulators.py em --rate 100
+        python simulators.py camera --fps 30 --delay 0.02
+"""
+
+import argparse
+import csv
+import os
+import socket
+import threading
+import time
+
+import numpy as np
+
+import protocol
+from frame_grabber import LatestFrameGrabber
+from protocol import MessageReader
+
+SERVER_IP = "127.0.0.1"
+PORT = 4999
+base_dir = os.path.dirname(os.path.abspath(__file__))
+POSE_REPLAY_FILE = os.path.join(base_dir, "..", "data", "Parsed_Pose_Data.csv")
+POSE_COLUMNS = ["x", "y", "z", "azimuth", "elevation", "roll"]
+
+
+class SimulatedClient(threading.Thread):
+    """
+    Connects, sends its handshake, then serves requests until the server closes the connection.
+    Subclasses provide the client type, the data message and the native sample rate.
+    """
+    client_type = None
+    request_type = None
+
+    def __init__(self, server_ip=SERVER_IP, port=PORT, stream_id=0, rate=30.0):
+        super().__init__(daemon=True)
+        self.server_ip = server_ip
+        self.port = port
+        self.stream_id = stream_id
+        self.rate = rate
+        self.samples_sent = 0
+        self.stop_event = threading.Event()
+
+    def make_message(self):
+        """Return (msg_type, payload) for one fresh sample, or None if there is none to send."""
+        raise NotImplementedError
+
+    def answer(self, msg_type):
+        """Return the (msg_type, payload) reply to a request, or None if there is nothing to answer with."""
+        if msg_type != self.request_type:
+            return None
+        message = self.make_message()
+        if message is not None:
+            self.samples_sent += 1
+        return message
+
+    def run(self):
+        sock = socket.create_connection((self.server_ip, self.port))
+        try:
+            protocol.send_message(sock, protocol.MSG_HELLO, protocol.pack_text(f"{self.client_type}:{self.stream_id}"))
+            reader = MessageReader(sock)
+            while not self.stop_event.is_set():
+                messages = reader.poll_messages(0.1)
+                if messages is None:
+                    return
+                for msg_type, payload in messages:
+                    if msg_type == protocol.MSG_TIME_PROBE:
+                        protocol.send_message(sock, protocol.MSG_TIME_REPLY, protocol.pack_time_reply(payload, time.time()))
+                    elif msg_type == protocol.MSG_START_STREAM:
+                        self.stream(sock, reader)
+                        return
+                    elif (reply := self.answer(msg_type)) is not None:
+                        protocol.send_message(sock, *reply)
+        except (socket.error, protocol.ProtocolError) as e:
+            print(f"{self.client_type}:{self.stream_id} simulator stopped: {e}")
+        finally:
+            sock.close()
+
+    def stream(self, sock, reader):
+        """Push samples at self.rate on monotonic deadlines, answering clock probes in between."""
+        period = 1.0 / self.rate
+        next_deadline = time.monotonic()
+        while not self.stop_event.is_set():
+            remaining = next_deadline - time.monotonic()
+            if remaining > 0:
+                messages = reader.poll_messages(remaining)
+                if messages is None:
+                    return
+                for msg_type, payload in messages:
+                    if msg_type == protocol.MSG_TIME_PROBE:
+                        protocol.send_message(sock, protocol.MSG_TIME_REPLY, protocol.pack_time_reply(payload, time.time()))
+                continue
+            message = self.make_message()
+            if message is not None:
+                protocol.send_message(sock, *message)
+                self.samples_sent += 1
+            next_deadline += period
+
+
+class SimulatedEMTracker(SimulatedClient):
+    """Replays recorded poses from Parsed_Pose_Data.csv, one row per sample, looping at the end."""
+    client_type = "EMTracker"
+    request_type = protocol.MSG_REQUEST_EM
+
+    def __init__(self, replay_file=POSE_REPLAY_FILE, **kwargs):
+        kwargs.setdefault("rate", 100.0)
+        super().__init__(**kwargs)
+        with open(replay_file, newline="") as f:
+            self.poses = [[float(row[c]) for c in POSE_COLUMNS] for row in csv.DictReader(f)]
+        self._index = 0
+        self._last_batch = None  # When the previous batch request was answered
+
+    def next_pose(self):
+        pose = self.poses[self._index % len(self.poses)]
+        self._index += 1
+        return pose
+
+    def make_message(self):
+        return protocol.MSG_EM_DATA, protocol.pack_em_data(time.time(), self.next_pose())
+
+    def answer(self, msg_type):
+        if msg_type != protocol.MSG_REQUEST_EM_BATCH:
+            return super().answer(msg_type)
+        # Every sample the tracker would have taken at self.rate since the previous batch, ending now
+        now = time.time()
+        period = 1.0 / self.rate
+        count = 1 if self._last_batch is None else max(1, int((now - self._last_batch) * self.rate))
+        self._last_batch = now
+        samples = [[now - (count - 1 - i) * period, *self.next_pose()] for i in range(count)]
+        self.samples_sent += count
+        return protocol.MSG_EM_BATCH, protocol.pack_em_batch(samples, 0)
+
+
+class SimulatedCamera(SimulatedClient):
+    """
+    Reports synthetic frames. Each frame takes `delay` seconds, which stand in for the
+    whole capture (grab, encoding, disk writes), before it is reported; no images are built.
+    With latest_frame=True it behaves like camera_client.py instead: synthetic 640x480 frames
+    arrive at `rate` on a grab thread and requests are answered from the newest one.
+    """
+    client_type = "RealSense"
+    request_type = protocol.MSG_REQUEST_CAMERA
+
+    def __init__(self, delay=0.02, latest_frame=False, **kwargs):
+        kwargs.setdefault("rate", 30.0)
+        super().__init__(**kwargs)
+        self.delay = delay
+        self._gradient = np.tile(np.arange(640, dtype=np.uint16), (480, 1))
+        self.grabber = LatestFrameGrabber(self.grab_frame) if latest_frame else None
+
+    def grab_frame(self):
+        time.sleep(1.0 / self.rate)
+        depth_image = self._gradient + np.uint16(self.samples_sent % 1000)
+        return time.time(), depth_image, np.dstack([(depth_image % 256).astype(np.uint8)] * 3)
+
+    def make_message(self):
+        frame_index = self.samples_sent
+        if self.grabber is not None:
+            frame = self.grabber.wait_for_newer(0)
+            if frame is None:
+                print(f"{self.client_type}:{self.stream_id} simulator has no frame to send")
+                return None
+            _, timestamp, _, _ = frame
+            payload = protocol.pack_camera_data(timestamp, frame_index, f"sim_depth_{frame_index}.npy",
+                                                f"sim_color_{frame_index}.png", time.time() - timestamp)
+            return protocol.MSG_CAMERA_DATA, payload
+        timestamp = time.time()
+        time.sleep(self.delay)  # Stands in for grabbing, encoding and saving the frame
+        depth_filename = f"sim_depth_{frame_index}.npy"
+        color_filename = f"sim_color_{frame_index}.png"
+        payload = protocol.pack_camera_data(
+            timestamp, frame_index, depth_filename, color_filename, time.time() - timestamp)
+        return protocol.MSG_CAMERA_DATA, payload
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a simulated sensor client against the server.")
+    parser.add_argument("sensor", choices=["em", "camera"])
+    parser.add_argument("--server", default=SERVER_IP)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--stream-id", type=int, default=0)
+    parser.add_argument("--rate", type=float, help="EM samples per second when streaming (default 100)")
+    parser.add_argument("--fps", type=float, help="Camera frames per second when streaming (default 30)")
+    parser.add_argument("--delay", type=float, default=0.02, help="Camera processing delay per frame in seconds")
+    parser.add_argument("--latest-frame", action="store_true", help="Answer camera requests from the newest frame")
+    parser.add_argument("--replay-file", default=POSE_REPLAY_FILE)
+    args = parser.parse_args()
+
+    common = {"server_ip": args.server, "port": args.port, "stream_id": args.stream_id}
+    if args.sensor == "em":
+        client = SimulatedEMTracker(replay_file=args.replay_file, rate=args.rate or 100.0, **common)
+    else:
+        client = SimulatedCamera(delay=args.delay, latest_frame=args.latest_frame, rate=args.fps or 30.0, **common)
+    client.start()
+    try:
+        while client.is_alive():
+            client.join(0.5)
+    except KeyboardInterrupt:
+        client.stop_event.set()
+    print(f"Sent {client.samples_sent} samples.")
+
+
+if __name__ == "__main__":
+    main()
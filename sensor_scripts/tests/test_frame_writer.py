@@ -0,0 +1,42 @@
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from frame_writer import FrameWriterPool
+
+
+def test_results_are_handed_over_in_submission_order():
+    def save_frame(frame):
+        time.sleep(random.uniform(0, 0.005))  # Writers finish out of order
+        if frame % 7 == 3:
+            raise OSError("disk full")
+        return frame
+
+    saved = []
+    pool = FrameWriterPool(save_frame, num_workers=4, max_queue=200, on_saved=saved.append)
+    for frame in range(200):
+        assert pool.submit(frame)
+    pool.close()
+    assert saved == [frame for frame in range(200) if frame % 7 != 3]
+    assert pool.written == len(saved) and pool.failed == 200 - len(saved)
+
+
+def test_nothing_is_claimed_for_a_dropped_frame():
+    release = threading.Event()
+    pool = FrameWriterPool(lambda frame: release.wait(), num_workers=1, max_queue=2)
+    claimed = []
+
+    def claim(frame):
+        claimed.append(frame)
+        return frame
+
+    results = [pool.submit_from(lambda: claim(frame)) for frame in range(10)]
+    release.set()
+    pool.close()
+    # The worker holds at most one frame and the queue two more; the rest are dropped unclaimed
+    assert results[:2] == [0, 1] and results[-1] is None
+    assert claimed == [frame for frame in results if frame is not None]
+    assert pool.dropped == results.count(None) and pool.submitted == len(claimed)
@@ -0,0 +1,81 @@
+import os
+import socket
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import protocol
+from protocol import MessageReader, ProtocolError
+
+
+def messages():
+    return [
+        (protocol.MSG_HELLO, protocol.pack_text("RealSense:1")),
+        (protocol.MSG_REQUEST_CAMERA, b""),
+        (protocol.MSG_CAMERA_DATA, protocol.pack_camera_data(1.5, 7, "depth.npy", "color.png", 0.02)),
+        (protocol.MSG_EM_DATA, protocol.pack_em_data(2.5, (1.0, 2.0, 3.0, 4.0, 5.0, 6.0))),
+    ]
+
+
+def drain(reader):
+    out = []
+    while (message := reader.next_message()) is not None:
+        out.append(message)
+    return out
+
+
+def test_reader_reassembles_byte_by_byte():
+    stream = b"".join(protocol.encode_message(*m) for m in messages())
+    reader = MessageReader()
+    received = []
+    for i in range(len(stream)):
+        reader.feed(stream[i:i + 1])
+        received.extend(drain(reader))
+    assert received == messages()
+
+
+def test_reader_splits_coalesced_messages():
+    stream = b"".join(protocol.encode_message(*m) for m in messages())
+    reader = MessageReader()
+    # A partial message at the end stays buffered until the rest arrives
+    reader.feed(stream + stream[:5])
+    assert drain(reader) == messages()
+    reader.feed(stream[5:])
+    assert drain(reader) == messages()
+
+
+def test_read_message_over_socket():
+    a, b = socket.socketpair()
+    with a, b:
+        a.sendall(b"".join(protocol.encode_message(*m) for m in messages()))
+        a.shutdown(socket.SHUT_WR)
+        reader = MessageReader(b)
+        assert [reader.read_message() for _ in messages()] == messages()
+        assert reader.read_message() is None
+
+
+def test_reader_rejects_bad_header():
+    reader = MessageReader()
+    reader.feed(b"XX" + protocol.encode_message(protocol.MSG_HELLO)[2:])
+    with pytest.raises(ProtocolError):
+        reader.next_message()
+
+
+def test_em_batch_round_trip():
+    samples = np.arange(21, dtype=np.float64).reshape(3, 7)
+    unpacked, lost = protocol.unpack_em_batch(protocol.pack_em_batch(samples, lost=4))
+    assert np.array_equal(unpacked, samples) and lost == 4
+
+
+@pytest.mark.parametrize("unpack, payload", [
+    (protocol.unpack_camera_data, b"\x00" * 5),
+    (protocol.unpack_camera_data, protocol.CAMERA_DATA.pack(1.0, 2, 0.0) + b"no separator"),
+    (protocol.unpack_em_data, b"\x00" * 5),
+    (protocol.unpack_em_batch, b"\x00" * 5),
+    (protocol.unpack_time_reply, b"\x00" * 5),
+])
+def test_short_payloads_raise_protocol_error(unpack, payload):
+    with pytest.raises(ProtocolError):
+        unpack(payload)